@@ -1,5 +1,5 @@
 """Access Control Lists (ACLs) for accessing/updating AtbdVersions and Contacts"""
-from typing import Dict, List, Tuple
+from typing import Any, Dict, Iterable, List, Set, Tuple
 
 import fastapi_permissions
 
@@ -190,6 +190,117 @@ ATBD_VERSION_ACLS: Dict = {
     ],
 }
 
+
+class CompiledAtbdVersionAcl:
+    """
+    `ATBD_VERSION_ACLS`, compiled into a lookup table so that permission checks
+    don't need to expand the full ACL of a version (`AtbdVersions.__acl__()`)
+    and scan it linearly.
+
+    The only version attributes the ACL conditions depend on are the `status`
+    and wether or not the version is locked, so the outcome of every rule is
+    pre-computed for each (status, locked) combination. For each combination
+    and action, the table holds the ordered list of (grantee, allowed) rules,
+    where the first rule whose grantee matches the principals decides, exactly
+    as in `fastapi_permissions.has_permission`.
+    """
+
+    # Grantees that resolve to the cognito sub(s) of the version's contributors
+    CONTRIBUTOR_GRANTEES = ("lock_owner", "owner", "authors", "reviewers")
+    # Bucket for all the statuses not mentioned in any condition, for which
+    # every status condition evaluates to False
+    OTHER_STATUS = None
+
+    def __init__(self, acls: Dict):
+        """Compiles the ACL for every (status, locked) combination"""
+        statuses: Set[Any] = {self.OTHER_STATUS}
+        for actions in acls.values():
+            for action in actions:
+                for key, allowed_values in action.get("conditions", {}).items():
+                    if key == "status":
+                        statuses.update(allowed_values)
+                    elif key != "locked_by" or allowed_values != [None]:
+                        raise ValueError(
+                            f"Unable to compile ACL condition: {key}={allowed_values}"
+                        )
+
+        self._tables = {
+            (status, locked): self._compile(acls, status, locked)
+            for status in statuses
+            for locked in (True, False)
+        }
+        # Statuses mentioned in at least one condition
+        self.statuses = statuses - {self.OTHER_STATUS}
+
+    @staticmethod
+    def _compile(
+        acls: Dict, status: Any, locked: bool
+    ) -> Dict[str, List[Tuple[str, bool]]]:
+        values = {"status": status, "locked_by": "locked" if locked else None}
+        table: Dict[str, List[Tuple[str, bool]]] = {}
+        for grantee, actions in acls.items():
+            for action in actions:
+                rules = table.setdefault(action["action"], [])
+                # Only the first rule of a grantee for a given action can
+                # ever match
+                if any(g == grantee for g, _ in rules):
+                    continue
+                allowed = not action.get("deny") and all(
+                    values[key] in allowed_values
+                    for key, allowed_values in action.get("conditions", {}).items()
+                )
+                rules.append((grantee, allowed))
+        return table
+
+    def _rules(self, version: Any, action: str) -> List[Tuple[str, bool]]:
+        status = version.status
+        if (status, False) not in self._tables:
+            status = self.OTHER_STATUS
+        return self._tables[(status, version.locked_by is not None)].get(action, [])
+
+    @staticmethod
+    def _matches(grantee: str, version: Any, principals: Set[str], subs: Set[str]):
+        if grantee == "lock_owner":
+            return version.locked_by in subs
+        if grantee == "owner":
+            return version.owner in subs
+        if grantee == "authors":
+            return not subs.isdisjoint(version.authors or [])
+        if grantee == "reviewers":
+            return any(r["sub"] in subs for r in version.reviewers or [])
+        return grantee in principals
+
+    def grantee_rules(self, action: str) -> List[Tuple[str, Set[Tuple[Any, bool]]]]:
+        """
+        For each grantee that has a rule for the action (in order of
+        precedence), returns the set of (status, locked) combinations for
+        which the rule allows the action. Statuses not mentioned in any
+        condition are represented by `OTHER_STATUS`. This allows the ACL
+        to be translated into other query languages (eg: SQL).
+        """
+        grantees: Dict[str, Set[Tuple[Any, bool]]] = {}
+        for (status, locked), table in self._tables.items():
+            for grantee, allowed in table.get(action, []):
+                states = grantees.setdefault(grantee, set())
+                if allowed:
+                    states.add((status, locked))
+        # dicts preserve insertion order, and every table lists the grantees
+        # in the same order
+        return list(grantees.items())
+
+    def has_permission(self, principals: Iterable[str], action: str, version: Any):
+        """Equivalent to `fastapi_permissions.has_permission(principals, action,
+        version.__acl__())`"""
+        principals = set(principals)
+        subs = {p[len("user:") :] for p in principals if p.startswith("user:")}
+        for grantee, allowed in self._rules(version, action):
+            if self._matches(grantee, version, principals, subs):
+                return allowed
+        return False
+
+
+COMPILED_ATBD_VERSION_ACLS = CompiledAtbdVersionAcl(ATBD_VERSION_ACLS)
+
 CONTACT_ACLS: List[Tuple] = [
     (fastapi_permissions.Allow, fastapi_permissions.Authenticated, "create_contact"),
     (fastapi_permissions.Allow, fastapi_permissions.Authenticated, "list_contacts"),
@@ -198,6 +309,10 @@ CONTACT_ACLS: List[Tuple] = [
     (fastapi_permissions.Allow, fastapi_permissions.Authenticated, "delete_contact"),
 ]
 
+SEARCH_ACLS: List[Tuple] = [
+    (fastapi_permissions.Allow, "role:curator", "raw_search"),
+]
+
 COMMENT_ACLS: Dict[str, List[Dict[str, str]]] = {
     "owner": [{"action": "update"}, {"action": "delete"}],
     "role:curator": [{"action": "delete"}],
@@ -0,0 +1,48 @@
+"""ETags of the ATBD versions, and the preconditions of the conditional
+requests (`If-Match`) updating them"""
+import re
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+
+def version_etag(row_version: int) -> str:
+    """
+    Returns the ETag of an AtbdVersion with the given `row_version`
+    """
+    return f'"{row_version}"'
+
+
+def parse_etag(etag: str) -> int:
+    """
+    Parses an ETag returned by `version_etag` (eg: from an `If-Match` header)
+    into the `row_version` of the AtbdVersion
+    """
+    search = re.search(r'^(W/)?"(?P<row_version>\d+)"$', etag.strip())
+    if not search:
+        raise HTTPException(status_code=400, detail=f"Malformed ETag: {etag}")
+    return int(search.group("row_version"))
+
+
+def if_match_row_version(if_match: Optional[str]) -> int:
+    """
+    Returns the `row_version` of the ETag of an `If-Match` header, which
+    conditional requests require (428 Precondition Required)
+    """
+    if if_match is None:
+        raise HTTPException(status_code=428, detail="The If-Match header is required")
+    return parse_etag(if_match)
+
+
+def require_unmodified(updated: Optional[Dict]) -> Dict:
+    """
+    Returns the result of a conditional update, which is `None` if the
+    version was modified since its ETag was read (412 Precondition Failed)
+    """
+    if updated is None:
+        raise HTTPException(
+            status_code=412,
+            detail="ATBD Version was modified since it was loaded, "
+            "reload it before saving your changes",
+        )
+    return updated
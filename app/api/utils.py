@@ -1,7 +1,10 @@
 """Provides various utilities to the API classes
 """
+import base64
+import datetime
+import json
 import re
-from typing import Tuple, Union
+from typing import Any, Tuple, Union
 
 from boto3 import client
 
@@ -74,3 +77,24 @@ def get_major_from_version_string(version: str) -> Tuple[int, Union[int, None]]:
                 ),
             )
         return int(search.group("major")), int(search.group("minor"))
+
+
+def encode_cursor(value: Any, id: int) -> str:
+    """
+    Encodes the (sort value, id) pair of the last item of a page into an opaque
+    cursor, to be passed back by the client to request the next page
+    """
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    """
+    Decodes a cursor returned by `encode_cursor` into the (sort value, id) pair
+    """
+    try:
+        value, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return value, int(id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail=f"Malformed cursor: {cursor}")
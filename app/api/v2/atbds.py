@@ -9,7 +9,7 @@ from typing import List
 from sqlalchemy import exc
 
 from app import config
-from app.api.utils import s3_client
+from app.api.utils import decode_cursor, encode_cursor, s3_client
 from app.crud.atbds import crud_atbds
 from app.crud.uploads import crud_uploads
 from app.db.db_session import DbSession, get_db_session
@@ -22,16 +22,18 @@ from app.email.notifications import (
 from app.logs import logger  # noqa
 from app.permissions import check_atbd_permissions, filter_atbd_versions
 from app.schemas import atbds, uploads, users
-from app.search.opensearch import remove_atbd_from_index
+from app.search.outbox import signal_search_outbox
 from app.users.auth import get_user, require_user
 from app.users.cognito import (
     get_active_user_principals,
     list_cognito_users,
     update_atbd_contributor_info,
+    update_atbds_contributor_info,
 )
+from app.users.directory import user_directory
 from app.utils import get_task_queue
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response
 
 router = APIRouter()
 
@@ -42,14 +44,28 @@ router = APIRouter()
     response_model=List[atbds.SummaryOutput],
 )
 def list_atbds(
+    response: Response,
     role: str = None,
     status: str = None,
+    sort: str = "last_updated_at",
+    order: str = "desc",
+    limit: int = None,
+    cursor: str = None,
+    fields: str = None,
     user: users.CognitoUser = Depends(get_user),
     db: DbSession = Depends(get_db_session),
     principals: List[str] = Depends(get_active_user_principals),
 ):
     """Lists all ATBDs with summary version info (only versions with status
-    `Published` will be displayed if the user is not logged in)"""
+    `Published` will be displayed if the user is not logged in).
+
+    ATBDs are sorted by `sort` (`last_updated_at`, `created_at` or `title`)
+    in `order` (`asc` or `desc`). If `limit` is provided, only the first
+    `limit` ATBDs are returned, and the `X-Next-Cursor` response header holds
+    the `cursor` to pass to request the next page (the header is absent on the
+    last page). `fields` is an optional comma separated list of the heavy
+    version fields to include (`document`, `citation`, `sections_completed`,
+    `keywords`): fields that aren't listed are returned as `null`."""
     if role:
         if not user:
             raise HTTPException(
@@ -58,20 +74,47 @@ def list_atbds(
             )
         role = f"{role}:{user.sub}"
 
-    # apply permissions filter to remove any versions/
-    # ATBDs that the user does not have access to
-    # TODO: use a generator and only yield non `None` objects?
-
-    atbds = [
-        filter_atbd_versions(principals, atbd, raise_exception=False)
-        for atbd in crud_atbds.scan(db=db, role=role, status=status)
-        if filter_atbd_versions(principals, atbd, raise_exception=False) is not None
-    ]
+    if sort not in crud_atbds.SORT_COLUMNS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid sort: {sort}. Expected one of: "
+            f"{', '.join(crud_atbds.SORT_COLUMNS)}",
+        )
+    if order not in ("asc", "desc"):
+        raise HTTPException(
+            status_code=400, detail=f"Invalid order: {order}. Expected asc or desc"
+        )
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="Limit must be positive")
+
+    after = None
+    if cursor:
+        after_value, after_id = decode_cursor(cursor)
+        try:
+            after = crud_atbds.sort_value(sort, after_value), after_id
+        except ValueError:
+            # eg: a cursor with a malformed datetime, or of another sort
+            raise HTTPException(status_code=400, detail=f"Malformed cursor: {cursor}")
+
+    atbds = crud_atbds.scan(
+        db=db,
+        role=role,
+        status=status,
+        principals=principals,
+        sort=sort,
+        order=order,
+        limit=limit,
+        after=after,
+        fields=[f.strip() for f in fields.split(",")] if fields else None,
+    )
 
-    for atbd in atbds:
-        atbd = update_atbd_contributor_info(principals, atbd)
+    if limit is not None and len(atbds) == limit:
+        last = atbds[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(getattr(last, sort), last.id)
 
-    return atbds
+    # only the versions the user is allowed to view are loaded from the
+    # database (ATBDs without any such version are left out entirely)
+    return update_atbds_contributor_info(principals, atbds)
 
 
 @router.head(
@@ -86,7 +129,7 @@ def atbd_exists(
     """Returns status 200 if ATBD exsits and raises 404 if not (or if the user is
     not logged in and the ATBD has no versions with status `Published`)"""
 
-    atbd = crud_atbds.get(db=db, atbd_id=atbd_id)
+    atbd = crud_atbds.get(db=db, atbd_id=atbd_id, load="metadata")
     atbd = filter_atbd_versions(principals, atbd)
 
     return True
@@ -104,7 +147,7 @@ def get_atbd(
 ):
     """Returns a single ATBD (raises 404 if the ATBD has no versions with
     status `Published` and the user is not logged in)"""
-    atbd = crud_atbds.get(db=db, atbd_id=atbd_id)
+    atbd = crud_atbds.get(db=db, atbd_id=atbd_id, load="summary")
 
     atbd = filter_atbd_versions(principals, atbd)
 
@@ -142,11 +185,11 @@ def create_atbd(
         # For all the curators
         *[
             UserNotification(
-                **user.dict(by_alias=True),
+                **curator.dict(by_alias=True),
                 notification="new_atbd_for_curators",
             )
-            for (user_sub, user) in app_users.items()
-            if user_sub != atbd.created_by and "curator" in user.cognito_groups
+            for curator in user_directory.users_in_group("curator")
+            if curator.sub != atbd.created_by
         ],
     ]
     background_tasks.add_task(
@@ -182,6 +225,29 @@ def rebuild_atbd_index(
     return dict()
 
 
+@router.post("/atbds/reconcile-index")
+def reconcile_atbd_index(
+    principals: List[str] = Depends(get_active_user_principals),
+):
+    """Reconcile the ATBD index with the published ATBD versions (only the
+    missing and stale documents are indexed or removed)"""
+    check_atbd_permissions(
+        principals=principals, action="rebuild_atbd_index", atbd=None
+    )
+    task_queue = get_task_queue()
+    task_queue.send_message(
+        MessageBody=base64.b64encode(
+            pickle.dumps(
+                {
+                    "task_type": "reconcile_atbd_index",
+                    "payload": {},
+                }
+            )
+        ).decode()
+    )
+    return dict()
+
+
 @router.post(
     "/atbds/{atbd_id}",
     responses={200: dict(description="Create a new ATBD")},
@@ -226,6 +292,7 @@ def update_atbd(
                 detail=f"Alias {atbd_input.alias} already exists in database",
             )
 
+    background_tasks.add_task(signal_search_outbox)
     atbd = update_atbd_contributor_info(principals, atbd)
     return atbd
 
@@ -261,7 +328,7 @@ def delete_atbd(
         user=user,
     )
 
-    background_tasks.add_task(remove_atbd_from_index, atbd=atbd)
+    background_tasks.add_task(signal_search_outbox)
     # TODO: this should also remove all associated PDFs in S3.
 
     return {}
@@ -9,10 +9,11 @@ from app.db.db_session import DbSession, get_db_session
 from app.permissions import check_permissions
 from app.schemas import contacts
 from app.schemas.users import User
+from app.search.outbox import signal_search_outbox
 from app.users.auth import require_user
 from app.users.cognito import get_active_user_principals
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 
 router = APIRouter()
 
@@ -93,6 +94,7 @@ def create_contact(
 def update_contact(
     contact_id: int,
     update_contact_input: contacts.Update,
+    background_tasks: BackgroundTasks,
     db: DbSession = Depends(get_db_session),
     user: User = Depends(require_user),
     principals: List[str] = Depends(get_active_user_principals),
@@ -100,7 +102,10 @@ def update_contact(
     """Updates fields within a contact. Raises an exception if the user isn't logged in."""
     check_permissions(principals=principals, action="update_contact", acl=CONTACT_ACLS)
     contact = crud_contacts.get(db_session=db, obj_in=contacts.Lookup(id=contact_id))
-    return crud_contacts.update(db=db, db_obj=contact, obj_in=update_contact_input)
+    contact = crud_contacts.update(db=db, db_obj=contact, obj_in=update_contact_input)
+    # Re-indexes the published versions the contact is linked to
+    background_tasks.add_task(signal_search_outbox)
+    return contact
 
 
 @router.delete(
@@ -113,6 +118,7 @@ def update_contact(
 )
 def delete_contact(
     contact_id: int,
+    background_tasks: BackgroundTasks,
     db: DbSession = Depends(get_db_session),
     user: User = Depends(require_user),
     principals: List[str] = Depends(get_active_user_principals),
@@ -120,4 +126,5 @@ def delete_contact(
     """Deletes a given contact. Raises an exception if the user isn't logged in."""
     check_permissions(principals=principals, action="delete_contact", acl=CONTACT_ACLS)
     crud_contacts.remove(db_session=db, id=contact_id)
+    background_tasks.add_task(signal_search_outbox)
     return {}
@@ -4,6 +4,7 @@ from copy import deepcopy
 from typing import Any, Dict, List
 
 from app.api.utils import get_major_from_version_string
+from app.api.v2.pdf import prerender_pdfs
 from app.api.v2.versions import process_users_input
 from app.crud.atbds import crud_atbds
 from app.crud.comments import crud_comments
@@ -18,7 +19,7 @@ from app.email.notifications import (
 )
 from app.permissions import check_permissions
 from app.schemas import atbds, comments, events, threads, users, versions
-from app.search.opensearch import add_atbd_to_index
+from app.search.outbox import signal_search_outbox
 from app.users.cognito import (
     get_active_user_principals,
     get_user,
@@ -76,12 +77,6 @@ def deny_request_with_comment(next_status: str, notification: str):
             last_updated_at=datetime.datetime.now(datetime.timezone.utc),
         )
 
-        # I'm not sure why this is necessary since the version object hasn't
-        # been updated, but without it, the version object comes up empty
-        # in the `crud_versions.update()` method (therefore skipping the update
-        # and leaving the ATBDVersion in STATUS==`closed_review_requested`)
-        db.refresh(version)
-
         version = crud_versions.update(db=db, db_obj=version, obj_in=version_input)
 
         background_tasks.add_task(
@@ -140,8 +135,6 @@ def accept_closed_review_request_handler(
         ),
     )
 
-    db.refresh(version)
-
     background_tasks.add_task(
         notify_atbd_version_contributors,
         data=dict(
@@ -198,10 +191,9 @@ def publish_handler(
         update_version_contributor_info(principals=principals, version=version)
     ]
 
-    # TODO: is this required? if yes, find a way to export pdf without user's auth token
-    # background_tasks.add_task(save_pdf_to_s3, atbd=atbd, journal=True)
-    # background_tasks.add_task(save_pdf_to_s3, atbd=atbd, journal=False)
-    background_tasks.add_task(add_atbd_to_index, atbd)
+    # Warm the PDF cache for the first readers of the version
+    background_tasks.add_task(prerender_pdfs, atbd_id=atbd.id, major=version.major)
+    background_tasks.add_task(signal_search_outbox)
     return atbd
 
 
@@ -246,10 +238,9 @@ def bump_minor_version_handler(
         update_version_contributor_info(principals=principals, version=version)
     ]
 
-    # TODO: is this required? if yes, find a way to export pdf without user's auth token
-    # background_tasks.add_task(save_pdf_to_s3, atbd=atbd, journal=True)
-    # background_tasks.add_task(save_pdf_to_s3, atbd=atbd, journal=False)
-    background_tasks.add_task(add_atbd_to_index, atbd)
+    # Warm the PDF cache for the first readers of the version
+    background_tasks.add_task(prerender_pdfs, atbd_id=atbd.id, major=version.major)
+    background_tasks.add_task(signal_search_outbox)
 
     # TODO: notify owner
     return atbd
@@ -378,7 +369,7 @@ def event_handler(
 
     [version] = atbd.versions
 
-    check_permissions(principals=principals, action=event.action, acl=version.__acl__())
+    check_permissions(principals=principals, action=event.action, acl=version)
 
     if ACTIONS[event.action].get("custom_handler"):
         return ACTIONS[event.action]["custom_handler"](
@@ -1,42 +1,78 @@
 """opensearch Endpoint."""
-import json
-import os
+import time
+from typing import List
 
-import boto3
-from opensearchpy import OpenSearch, RequestsHttpConnection
-from requests_aws4auth import AWS4Auth
-
-from app.config import OPENSEARCH_PORT, OPENSEARCH_URL
+from app.acls import SEARCH_ACLS
 from app.logs import logger
-from app.schemas.users import User
-from app.search.opensearch import get_opensearch_client
-from app.users.auth import get_user
-
-from fastapi import APIRouter, Depends
+from app.permissions import check_permissions
+from app.schemas.opensearch import SearchOutput, SearchQuery
+from app.search.opensearch import ATBD_INDEX, get_async_opensearch_client
+from app.search.queries import build_search_body, parse_search_response, search_cache
+from app.users.cognito import get_active_user_principals
 
-REGION = os.getenv("AWS_REGION", "us-west-2")
+from fastapi import APIRouter, Depends, Response
 
 router = APIRouter()
 
 
-@router.post("/search")
-def search_opensearch(query: dict, user: User = Depends(get_user)):
+@router.post("/search", response_model=SearchOutput)
+async def search_opensearch(query: SearchQuery, response: Response):
     """
-    Receives the user input query from frontend search field
-    Then uses client to search opensearch search endpoint
+    Searches the published ATBD versions. Only the summary of the matching
+    versions is returned, along with highlighted fragments of the fields
+    that matched the `text`. Results are paginated: the `next_cursor` of a
+    page is passed as `search_after` to get the next page.
+
+    Results are cached for a short time. The `Server-Timing` response header
+    holds the time spent on the search.
     """
+    started_at = time.perf_counter()
+    key = search_cache.key(query)
+    output = search_cache.get(key)
+    cached = output is not None
+    took = None
+
+    if not cached:
+        opensearch_client = await get_async_opensearch_client()
+        result = await opensearch_client.search(
+            body=build_search_body(query), index=ATBD_INDEX
+        )
+        took = result["took"]
+        if result.get("timed_out"):
+            logger.warning("Search timed out, results are partial: %s", key)
+        output = parse_search_response(query, result)
+        if not result.get("timed_out"):
+            search_cache.set(key, output)
 
-    document = query
+    duration = (time.perf_counter() - started_at) * 1000
+    logger.info(
+        "Search: %.1fms (opensearch: %sms, cached: %s, hits: %s/%s) %s",
+        duration,
+        took,
+        cached,
+        len(output.hits),
+        output.total,
+        key,
+    )
+    response.headers[
+        "Server-Timing"
+    ] = f'search;dur={duration:.1f};desc="{"cache" if cached else "opensearch"}"'
+    return output
+
+
+@router.post("/search/raw")
+async def raw_search_opensearch(
+    query: dict,
+    principals: List[str] = Depends(get_active_user_principals),
+):
+    """
+    Forwards a raw OpenSearch query to the ATBD index. Restricted to the
+    curators, since the query is not bounded in any way.
+    """
+    check_permissions(principals=principals, action="raw_search", acl=SEARCH_ACLS)
 
-    opensearch_client = get_opensearch_client()
-    try:
-        response = opensearch_client.search(body=document, index="atbd")
-        # logger.info("status:%s opensearch_client:%s", opensearch_client.status_code, opensearch_client.text)
-        # if not opensearch_client.ok:
-        #     raise HTTPException(status_code=opensearch_client.status_code, detail=opensearch_client.text)
-    except Exception as e:
-        raise e
+    opensearch_client = await get_async_opensearch_client()
+    response = await opensearch_client.search(body=query, index=ATBD_INDEX)
 
-    else:
-        # return value of 'object' is expected
-        return dict(response)
+    # return value of 'object' is expected
+    return dict(response)
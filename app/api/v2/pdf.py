@@ -1,22 +1,25 @@
 """PDF Endpoint."""
 import base64
-import hashlib
-import json
+import datetime
 import os
 import pickle
-from typing import List
+from typing import List, Optional
+
+import botocore
 
 from app import config
 from app.api.utils import get_major_from_version_string, s3_client
 from app.crud.atbds import crud_atbds
+from app.crud.pdf_renders import crud_pdf_renders
 from app.db.db_session import DbSession, get_db_session
-from app.db.models import Atbds, AtbdVersions
+from app.db.models import Atbds, AtbdVersions, PdfRenders
 from app.logs import logger
 from app.permissions import filter_atbd_versions
-from app.schemas import users, versions
+from app.schemas import pdf_renders, users
 from app.schemas.atbds import AtbdDocumentTypeEnum
+from app.schemas.pdf_renders import PdfRenderStatusEnum
 from app.users.auth import get_user
-from app.users.cognito import get_active_user_principals, update_atbd_contributor_info
+from app.users.cognito import get_active_user_principals
 from app.utils import get_task_queue
 
 from fastapi import APIRouter, Depends, Request
@@ -43,21 +46,35 @@ def generate_pdf_key(atbd: Atbds, minor: int = None, journal: bool = False):
     if journal:
         filename = f"{filename}-journal"
 
-    # Generate a hash of the title, version and content of the ATBD to make
-    # sure that the filename is unique for each version of the ATBD.
-    version_json = versions.FullOutput.from_orm(version).json()
-    version_data = {
-        "atbd_id": atbd.id,
-        "title": atbd.title,
-        "version": version_json,
-    }
-    version_hash = hashlib.md5(json.dumps(version_data).encode("utf-8")).hexdigest()
-
-    filename = f"{filename}-{version_hash}.pdf"
+    # The hash of the content of the version (maintained by the database)
+    # makes sure that the filename is unique for each content of the version
+    filename = f"{filename}-{version.content_hash}.pdf"
 
     return os.path.join(str(atbd.id), "pdf", filename)
 
 
+def pdf_exists(key: str) -> bool:
+    """
+    Checks (without downloading it) that the PDF exists in S3
+    """
+    try:
+        s3_client().head_object(Bucket=config.S3_BUCKET, Key=key)
+    except botocore.exceptions.ClientError as error:
+        if error.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+    return True
+
+
+def is_stale(render: PdfRenders) -> bool:
+    """
+    Whether a queued (or rendering) PDF has been waiting for too long, eg:
+    because the task was lost
+    """
+    age = datetime.datetime.utcnow() - render.updated_at
+    return age.total_seconds() > config.PDF_RENDER_TIMEOUT
+
+
 def generate_presigned_url(key: str, file_name: str, content_type: str):
     """
     Generates a presigned URL for the PDF in S3
@@ -86,6 +103,158 @@ def generate_presigned_url(key: str, file_name: str, content_type: str):
     return url
 
 
+def pdf_url_response(key: str) -> JSONResponse:
+    """
+    Returns the presigned URL of a PDF
+    """
+    pdf_url = generate_presigned_url(
+        key=key,
+        file_name=key.split("/")[-1],
+        content_type="application/pdf",
+    )
+    return JSONResponse(status_code=200, content={"pdf_url": pdf_url})
+
+
+def queue_render(
+    db: DbSession,
+    atbd: Atbds,
+    minor: int,
+    journal: bool,
+    auth_data: dict,
+    service_account: bool = False,
+) -> Optional[int]:
+    """
+    Records the PDF as queued in the render manifest, and queues its
+    generation. Returns the id of the render, or None if the PDF is already
+    queued (or being generated)
+    """
+    [atbd_version] = atbd.versions
+    pdf_key = generate_pdf_key(atbd, minor=minor, journal=journal)
+
+    render_id = crud_pdf_renders.queue(
+        db,
+        obj_in=pdf_renders.Create(
+            atbd_id=atbd.id,
+            major=atbd_version.major,
+            minor=minor,
+            journal=journal,
+            content_hash=atbd_version.content_hash,
+            s3_key=pdf_key,
+        ),
+        stale_before=datetime.datetime.utcnow()
+        - datetime.timedelta(seconds=config.PDF_RENDER_TIMEOUT),
+    )
+    if render_id is None:
+        # Another request queued the same PDF in the meantime
+        logger.info(f"PDF generation already in progress: {pdf_key}")
+        return None
+
+    logger.info(f"GENERATING PDF: {pdf_key}")
+    # Queue the PDF generation task into SQS. The PDFs of published versions
+    # and the journal PDFs are rendered ahead of the drafts
+    priority = journal or atbd_version.status == "PUBLISHED"
+    task_queue = get_task_queue(priority=priority)
+    task_queue.send_message(
+        MessageBody=base64.b64encode(
+            pickle.dumps(
+                {
+                    "task_type": "make_pdf",
+                    "payload": {
+                        "atbd_id": atbd.id,
+                        "filepath": pdf_key,
+                        "major": atbd_version.major,
+                        "minor": minor,
+                        "auth_data": auth_data,
+                        "atbd_alias": atbd.alias,
+                        "journal": journal,
+                        "render_id": render_id,
+                        "service_account": service_account,
+                    },
+                }
+            )
+        ).decode()
+    )
+    return render_id
+
+
+def queue_pdf(
+    db: DbSession,
+    atbd: Atbds,
+    minor: int,
+    journal: bool,
+    user: users.CognitoUser,
+    request: Request,
+) -> JSONResponse:
+    """
+    Queues the generation of a PDF requested by a user
+    """
+    # We only use this to generate "Document" PDFs, not "Journal" PDFs for now
+    if user:
+        id_token = request.headers.get("authorization", "").replace("Bearer ", "")
+        access_token = request.headers.get("x-access-token", "")
+        if not id_token or not access_token:
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "message": "Missing authorization headers. "
+                    "Please include the 'authorization' and 'x-access-token' headers in your request."
+                },
+            )
+
+        auth_data = {
+            "id_token": id_token,
+            "access_token": access_token,
+            "user_email": user.email,
+        }
+    else:
+        auth_data = {}
+
+    queue_render(db, atbd, minor=minor, journal=journal, auth_data=auth_data)
+    return JSONResponse(
+        status_code=201,
+        content={
+            "message": "PDF generation in progress",
+            "status": PdfRenderStatusEnum.QUEUED.value,
+        },
+    )
+
+
+def prerender_pdfs(atbd_id: int, major: int):
+    """
+    Queues the generation of the PDFs of a newly published (or bumped)
+    version, rendered as the service account so that the first readers are
+    served from the cache, and the removal of the PDFs it supersedes. Called
+    once the transaction updating the version is committed (eg: as a
+    background task of the request).
+    """
+    db = DbSession()
+    try:
+        atbd = crud_atbds.get(db=db, atbd_id=atbd_id, version=major, load="metadata")
+        if atbd.document_type == AtbdDocumentTypeEnum.PDF:
+            return
+        [atbd_version] = atbd.versions
+        journals = [False]
+        if config.FEATURE_FLAGS.get("JOURNAL_PDF_EXPORT_ENABLED"):
+            journals.append(True)
+        for journal in journals:
+            queue_render(
+                db,
+                atbd,
+                minor=atbd_version.minor,
+                journal=journal,
+                auth_data={},
+                service_account=True,
+            )
+    finally:
+        db.close()
+
+    get_task_queue().send_message(
+        MessageBody=base64.b64encode(
+            pickle.dumps({"task_type": "collect_pdfs", "payload": {"atbd_id": atbd_id}})
+        ).decode()
+    )
+
+
 @router.get("/atbds/{atbd_id}/versions/{version}/pdf")
 def get_pdf(
     atbd_id: str,
@@ -98,33 +267,32 @@ def get_pdf(
     request: Request = None,
 ):
     """
-    Returns a PDF to the user - either as a stream of Bytes from S3 or as a
-    FileResponse object, from a PDF generated and stored locally in the
-    Lambda's runtime memory.
+    Returns the (presigned) URL of the PDF of an ATBD version, stored in S3.
 
     Returns a JSON response with code 404 if the ATBD is not found or if the user
     does not have permission to view the ATBD.
 
-    Returns a JSON response with code 404 if the PDF is not found in S3.
-
-    Return a JSON response with code 200 if PDF generation is successfully requested.
-    When requesting PDF generation, the request must contain the following headers:
-    - `authorization`: the user's Cognito ID token as a Bearer token
-    - `x-access-token`: the user's Cognito access token
-
-
-    The PDF will be served from S3 if either the user specifies a minor version
-    number or if the lastest version has status `Published` or if it was already
-    generated and stored in S3 (eg: when retry=True).
+    The PDFs of HTML ATBDs are generated by the worker, and recorded in the
+    render manifest along with the hash of the content they're generated from
+    and their generation `status` (`QUEUED`, `RENDERING`, `DONE` or `FAILED`),
+    which is included in the responses:
+    - if the PDF of the current content is already generated, its URL is returned
+    - otherwise, its generation is requested (unless it is already in progress)
+      and a JSON response with code 201 is returned. The request must contain
+      the following headers:
+        - `authorization`: the user's Cognito ID token as a Bearer token
+        - `x-access-token`: the user's Cognito access token
+    - with `retry=true` (used by the frontend to poll for a requested PDF), the
+      generation isn't requested: a JSON response with code 404 is returned
+      while the PDF isn't generated, or with code 500 if its generation failed
     """
 
     major, minor = get_major_from_version_string(version)
 
-    atbd: Atbds = crud_atbds.get(db=db, atbd_id=atbd_id, version=major)
+    atbd: Atbds = crud_atbds.get(db=db, atbd_id=atbd_id, version=major, load="metadata")
     atbd = filter_atbd_versions(principals, atbd)
     if atbd is None:
         return JSONResponse(status_code=404, content={"message": "ATBD not found"})
-    atbd = update_atbd_contributor_info(principals, atbd)
 
     # Unpacking the versions list into an array of a single element
     # enforces the assumption that the ATBD will only contain a single
@@ -133,91 +301,64 @@ def get_pdf(
     atbd_version: AtbdVersions
     [atbd_version] = atbd.versions
 
-    if atbd.document_type == AtbdDocumentTypeEnum.PDF:
-        pdf_key = atbd_version.pdf.file_path
-    else:
-        pdf_key = generate_pdf_key(atbd, minor=minor, journal=journal)
-
-    logger.info(f"FETCHING FROM S3: {pdf_key}")
     try:
-        # Check if PDF already exists in S3
-        client = s3_client()
-        client.get_object(Bucket=config.S3_BUCKET, Key=pdf_key)
-        pdf_url = generate_presigned_url(
-            key=pdf_key,
-            file_name=pdf_key.split("/")[-1],
-            content_type="application/pdf",
+        if atbd.document_type == AtbdDocumentTypeEnum.PDF:
+            pdf_key = atbd_version.pdf.file_path
+            if not pdf_exists(pdf_key):
+                logger.info(f"PDF not found in S3: {pdf_key}")
+                return JSONResponse(
+                    status_code=404, content={"message": "PDF not found"}
+                )
+            return pdf_url_response(pdf_key)
+
+        if minor is None:
+            minor = atbd_version.minor
+        render = crud_pdf_renders.lookup(
+            db,
+            atbd_id=atbd.id,
+            major=atbd_version.major,
+            minor=minor,
+            journal=journal,
+            content_hash=atbd_version.content_hash,
         )
-        return JSONResponse(status_code=200, content={"pdf_url": pdf_url})
-    except client.exceptions.NoSuchKey:
+        status = PdfRenderStatusEnum(render.status) if render else None
+
+        if status == PdfRenderStatusEnum.DONE:
+            if pdf_exists(render.s3_key):
+                return pdf_url_response(render.s3_key)
+            # eg: the PDF was deleted from S3
+            logger.info(f"PDF not found in S3: {render.s3_key}")
+            status = None
+        elif status in (PdfRenderStatusEnum.QUEUED, PdfRenderStatusEnum.RENDERING):
+            if is_stale(render):
+                logger.info(f"PDF generation timed out: {render.s3_key}")
+                status = None
+
         if retry:
             # retry is used by the frontend to request a recently generated PDF
-            # If the PDF is not found in S3, that means the PDF generation task
-            # has not yet completed. In this case, we return a 404 response to
-            # the frontend, which will then poll the API until the PDF is found
-            logger.info(f"PDF not found in S3: {pdf_key}")
-            return JSONResponse(status_code=404, content={"message": "PDF not found"})
-        else:
-            # Generate the PDF locally and upload it to S3
-            logger.info(f"GENERATING PDF: {pdf_key}")
-            try:
-                # clean up any existing PDFs for this ATBD version
-                s3_client().delete_object(Bucket=config.S3_BUCKET, Key=pdf_key)
-                # Queue the PDF generation task into SQS
-                # We only use this to generate "Document" PDFs, not "Journal" PDFs for now
-                if user:
-                    id_token = request.headers.get("authorization", "").replace(
-                        "Bearer ", ""
-                    )
-                    access_token = request.headers.get("x-access-token", "")
-                    if not id_token or not access_token:
-                        return JSONResponse(
-                            status_code=400,
-                            content={
-                                "message": "Missing authorization headers. "
-                                "Please include the 'authorization' and 'x-access-token' headers in your request."
-                            },
-                        )
-
-                    auth_data = {
-                        "id_token": id_token,
-                        "access_token": access_token,
-                        "user_email": user.email,
-                    }
-                else:
-                    auth_data = {}
-
-                task_queue = get_task_queue()
-                task_queue.send_message(
-                    MessageBody=base64.b64encode(
-                        pickle.dumps(
-                            {
-                                "task_type": "make_pdf",
-                                "payload": {
-                                    "atbd_id": atbd.id,
-                                    "filepath": pdf_key,
-                                    "major": major,
-                                    "minor": minor,
-                                    "auth_data": auth_data,
-                                    "atbd_alias": atbd.alias,
-                                    "journal": journal,
-                                },
-                            }
-                        )
-                    ).decode()
-                )
-                return JSONResponse(
-                    status_code=201,
-                    content={"message": "PDF generation in progress"},
-                )
-            except Exception as e:
-                logger.exception("Error occurred while generating PDF")
+            if status == PdfRenderStatusEnum.FAILED:
                 return JSONResponse(
                     status_code=500,
-                    content={"message": f"Error occurred while generating PDF: {e}"},
+                    content={"message": "PDF generation failed", "status": status},
                 )
-    except Exception:
-        logger.exception("Could not generate PDF")
+            # The PDF generation task has not yet completed. In this case, we
+            # return a 404 response to the frontend, which will then poll the
+            # API until the PDF is generated
+            return JSONResponse(
+                status_code=404, content={"message": "PDF not found", "status": status}
+            )
+
+        if status in (PdfRenderStatusEnum.QUEUED, PdfRenderStatusEnum.RENDERING):
+            return JSONResponse(
+                status_code=201,
+                content={"message": "PDF generation in progress", "status": status},
+            )
+        return queue_pdf(
+            db, atbd, minor=minor, journal=journal, user=user, request=request
+        )
+    except Exception as e:
+        logger.exception("Error occurred while generating PDF")
         return JSONResponse(
-            status_code=500, content={"message": "Could not generate PDF"}
+            status_code=500,
+            content={"message": f"Error occurred while generating PDF: {e}"},
         )
@@ -112,7 +112,7 @@ def get_threads_stats(
         if check_permissions(
             principals=principals,
             action="view",
-            acl=r.AtbdVersions.__acl__(),
+            acl=r.AtbdVersions,
             raise_exception=False,
         )
     ]
@@ -9,7 +9,8 @@ from app.permissions import check_permissions
 from app.schemas import users
 from app.schemas.users import User
 from app.users.auth import require_user
-from app.users.cognito import get_active_user_principals, list_cognito_users
+from app.users.cognito import get_active_user_principals
+from app.users.directory import user_directory
 
 from fastapi import APIRouter, Depends
 
@@ -35,52 +36,56 @@ def list_users(
     """
     major, _ = get_major_from_version_string(version)
 
-    [atbd_version] = crud_atbds.get(db=db, atbd_id=atbd_id, version=major).versions
-    version_acl = atbd_version.__acl__()
-    app_users, _ = list_cognito_users()
+    [atbd_version] = crud_atbds.get(
+        db=db, atbd_id=atbd_id, version=major, load="metadata"
+    ).versions
+    # Only contributors can receive ownership of, or join the authors or
+    # reviewers of a document, so there is no need to check the eligibility
+    # of users outside of that group
+    contributors = user_directory.users_in_group("contributor")
 
     if user_filter == "transfer_ownership":
         check_permissions(
-            principals=principals, action="offer_ownership", acl=version_acl
+            principals=principals, action="offer_ownership", acl=atbd_version
         )
 
         eligible_users = [
             user
-            for user in app_users.values()
+            for user in contributors
             if check_permissions(
                 principals=get_active_user_principals(user),
                 action="receive_ownership",
-                acl=version_acl,
+                acl=atbd_version,
                 raise_exception=False,
             )
         ]
     if user_filter == "invite_authors":
         check_permissions(
-            principals=principals, action="invite_authors", acl=version_acl
+            principals=principals, action="invite_authors", acl=atbd_version
         )
 
         eligible_users = [
             user
-            for user in app_users.values()
+            for user in contributors
             if check_permissions(
                 principals=get_active_user_principals(user),
                 action="join_authors",
-                acl=version_acl,
+                acl=atbd_version,
                 raise_exception=False,
             )
         ]
     if user_filter == "invite_reviewers":
         check_permissions(
-            principals=principals, action="invite_reviewers", acl=version_acl
+            principals=principals, action="invite_reviewers", acl=atbd_version
         )
 
         eligible_users = [
             user
-            for user in app_users.values()
+            for user in contributors
             if check_permissions(
                 principals=get_active_user_principals(user),
                 action="join_reviewers",
-                acl=version_acl,
+                acl=atbd_version,
                 raise_exception=False,
             )
         ]
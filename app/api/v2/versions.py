@@ -3,6 +3,7 @@ import datetime
 from copy import deepcopy
 from typing import List
 
+from app.api.etags import if_match_row_version, require_unmodified, version_etag
 from app.api.utils import get_major_from_version_string
 from app.crud.atbds import crud_atbds
 from app.crud.contacts import crud_contacts_associations
@@ -16,7 +17,7 @@ from app.schemas import atbds, versions, versions_contacts
 from app.schemas.atbds import AtbdDocumentTypeEnum
 from app.schemas.users import CognitoUser
 from app.schemas.versions_contacts import RolesEnum
-from app.search.opensearch import remove_atbd_from_index
+from app.search.outbox import signal_search_outbox
 from app.users.auth import get_user, require_user
 from app.users.cognito import (
     get_active_user_principals,
@@ -25,7 +26,8 @@ from app.users.cognito import (
     update_atbd_contributor_info,
 )
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Response
+from fastapi.encoders import jsonable_encoder
 
 router = APIRouter()
 
@@ -46,9 +48,9 @@ def version_exists(
     raises a 404 Exception.
     """
     major, _ = get_major_from_version_string(version)
-    atbd = crud_atbds.get(db=db, atbd_id=atbd_id, version=major)
+    atbd = crud_atbds.get(db=db, atbd_id=atbd_id, version=major, load="metadata")
     [atbd_version] = atbd.versions
-    check_permissions(principals=principals, action="view", acl=atbd_version.__acl__())
+    check_permissions(principals=principals, action="view", acl=atbd_version)
 
     return True
 
@@ -61,17 +63,20 @@ def version_exists(
 def get_version(
     atbd_id: str,
     version: str,
+    response: Response,
     db: DbSession = Depends(get_db_session),
     user: CognitoUser = Depends(get_user),
     principals: List[str] = Depends(get_active_user_principals),
 ):
     """
-    Returns an ATBD with a single version
+    Returns an ATBD with a single version (and the version's ETag, to be
+    provided when patching the version)
     """
     major, _ = get_major_from_version_string(version)
     atbd = crud_atbds.get(db=db, atbd_id=atbd_id, version=major)
     [atbd_version] = atbd.versions
-    check_permissions(principals=principals, action="view", acl=atbd_version.__acl__())
+    check_permissions(principals=principals, action="view", acl=atbd_version)
+    response.headers["ETag"] = version_etag(atbd_version.row_version)
     atbd = update_atbd_contributor_info(principals, atbd)
     return atbd
 
@@ -96,7 +101,7 @@ def create_new_version(
     check_permissions(
         principals=principals,
         action="create_new_version",
-        acl=latest_version.__acl__(),
+        acl=latest_version,
     )
     update_document = latest_version.document.copy()
     update_document["version_description"] = None
@@ -129,6 +134,7 @@ def update_atbd_version(  # noqa : C901
     version: str,
     version_input: versions.Update,
     background_tasks: BackgroundTasks,
+    response: Response,
     overwrite: bool = False,
     db: DbSession = Depends(get_db_session),
     user: CognitoUser = Depends(require_user),
@@ -152,11 +158,10 @@ def update_atbd_version(  # noqa : C901
 
     """
     major, _ = get_major_from_version_string(version)
-    atbd = crud_atbds.get(db=db, atbd_id=atbd_id, version=major)
+    atbd = crud_atbds.get(db=db, atbd_id=atbd_id, version=major, load="metadata")
 
     atbd_version: AtbdVersions
     [atbd_version] = atbd.versions
-    version_acl = atbd_version.__acl__()
 
     for attribute in versions.Update.__dict__["__fields__"].keys():
         if attribute in ["journal_status", "owner", "authors", "reviewers"]:
@@ -165,7 +170,7 @@ def update_atbd_version(  # noqa : C901
         try:
             if getattr(version_input, attribute):
                 check_permissions(
-                    principals=principals, action="update", acl=version_acl
+                    principals=principals, action="update", acl=atbd_version
                 )
         except AttributeError:
             continue
@@ -220,7 +225,7 @@ def update_atbd_version(  # noqa : C901
             else "update_journal_publication_status"
         )
 
-        check_permissions(principals=principals, action=action, acl=version_acl)
+        check_permissions(principals=principals, action=action, acl=atbd_version)
 
     if atbd.document_type == AtbdDocumentTypeEnum.PDF:
         # Check if user have enough permission to attach new pdf to the atbd
@@ -240,17 +245,24 @@ def update_atbd_version(  # noqa : C901
         if version_input.pdf_id:
             version_input.pdf_id = None
 
-    if version_input.document and not overwrite:
-        version_input.document = {  # type: ignore
-            **atbd_version.document,
-            **version_input.document.dict(exclude_unset=True),
-        }
-
-    if version_input.sections_completed and not overwrite:
-        version_input.sections_completed = {
-            **atbd_version.sections_completed,
-            **version_input.sections_completed,
-        }
+    # The document and sections completed are merged into the existing
+    # values (or overwrite them) in the database
+    crud_versions.update_content(
+        db=db,
+        version=atbd_version,
+        document=jsonable_encoder(
+            version_input.document,
+            exclude_none=overwrite,
+            exclude_unset=not overwrite,
+        )
+        if version_input.document
+        else None,
+        sections_completed=version_input.sections_completed or None,
+        overwrite=overwrite,
+        commit=False,
+    )
+    version_input.document = None
+    version_input.sections_completed = None
     # # This should act on the update input object, and not the db object
     # atbd_version.last_updated_by = user.sub
     # atbd_version.last_updated_at = datetime.datetime.now(datetime.timezone.utc)
@@ -266,11 +278,72 @@ def update_atbd_version(  # noqa : C901
     )
 
     atbd = crud_atbds.get(db=db, atbd_id=atbd_id, version=atbd_version.major)
+    [atbd_version] = atbd.versions
+    response.headers["ETag"] = version_etag(atbd_version.row_version)
+    if atbd_version.published_at is not None:
+        background_tasks.add_task(signal_search_outbox)
     atbd = update_atbd_contributor_info(principals, atbd)
 
     return atbd
 
 
+@router.patch(
+    "/atbds/{atbd_id}/versions/{version}",
+    response_model=versions.PatchOutput,
+    response_model_exclude_none=True,
+)
+def patch_atbd_version(
+    atbd_id: str,
+    version: str,
+    patch: versions.Patch,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    if_match: str = Header(None),
+    db: DbSession = Depends(get_db_session),
+    user: CognitoUser = Depends(require_user),
+    principals=Depends(get_active_user_principals),
+):
+    """
+    Applies section-level operations to the document of an ATBD version (eg:
+    autosaves from the editor), and merges the provided `sections_completed`
+    into the existing ones. Only the updated sections and the new ETag of the
+    version are returned.
+
+    The `If-Match` header must hold the ETag of the version the changes were
+    made to (as returned by the GET, POST and PATCH requests). Raises an
+    exception if the version was modified since.
+    """
+    row_version = if_match_row_version(if_match)
+
+    major, _ = get_major_from_version_string(version)
+    atbd = crud_atbds.get(db=db, atbd_id=atbd_id, version=major, load="metadata")
+
+    atbd_version: AtbdVersions
+    [atbd_version] = atbd.versions
+    check_permissions(principals=principals, action="update", acl=atbd_version)
+
+    patched = require_unmodified(
+        crud_versions.patch_document(
+            db=db,
+            version=atbd_version,
+            row_version=row_version,
+            operations=[
+                (o.op.value, o.section, jsonable_encoder(o.value))
+                for o in patch.operations
+            ],
+            sections_completed=patch.sections_completed,
+            user_sub=user.sub,
+        )
+    )
+
+    if atbd_version.published_at is not None:
+        background_tasks.add_task(signal_search_outbox)
+
+    etag = version_etag(patched.pop("row_version"))
+    response.headers["ETag"] = etag
+    return {**patched, "etag": etag}
+
+
 @router.put(
     "/atbds/{atbd_id}/versions/{version}/lock", response_model=versions.LockOutput
 )
@@ -289,7 +362,7 @@ def secure_atbd_version_lock(
     Raises an exception if the `locked_by` field belongs to a different user
     """
     major, _ = get_major_from_version_string(version)
-    atbd = crud_atbds.get(db=db, atbd_id=atbd_id, version=major)
+    atbd = crud_atbds.get(db=db, atbd_id=atbd_id, version=major, load="metadata")
 
     atbd_version: AtbdVersions
     [atbd_version] = atbd.versions
@@ -297,7 +370,7 @@ def secure_atbd_version_lock(
     if not override and not check_permissions(
         principals=principals,
         action="secure_lock",
-        acl=atbd_version.__acl__(),
+        acl=atbd_version,
         raise_exception=False,
     ):
         # return exception
@@ -341,7 +414,7 @@ def release_atbd_version_lock(
     user AND the override flag is not set to True
     """
     major, _ = get_major_from_version_string(version)
-    atbd = crud_atbds.get(db=db, atbd_id=atbd_id, version=major)
+    atbd = crud_atbds.get(db=db, atbd_id=atbd_id, version=major, load="metadata")
 
     atbd_version: AtbdVersions
     [atbd_version] = atbd.versions
@@ -355,7 +428,7 @@ def release_atbd_version_lock(
     if not check_permissions(
         principals=principals,
         action="release_lock",
-        acl=atbd_version.__acl__(),
+        acl=atbd_version,
         raise_exception=False,
     ):
         lock_owner = get_cognito_user(atbd_version.locked_by)
@@ -394,13 +467,11 @@ def delete_atbd_version(
     atbd_version: AtbdVersions
     [atbd_version] = atbd.versions
 
-    check_permissions(
-        principals=principals, action="delete", acl=atbd_version.__acl__()
-    )
+    check_permissions(principals=principals, action="delete", acl=atbd_version)
 
     crud_versions.delete(db=db, atbd=atbd, version=atbd_version)
 
-    background_tasks.add_task(remove_atbd_from_index, version=atbd_version)
+    background_tasks.add_task(signal_search_outbox)
     # TODO: this should also remove the associated PDFs in S3
 
     # Send email to users
@@ -8,7 +8,10 @@ import os
 
 import boto3
 
+from app.logs import set_debug
+
 APT_DEBUG = os.environ.get("APT_DEBUG", "false").lower() == "true"
+set_debug(APT_DEBUG)
 
 AWS_REGION = os.environ.get("AWS_REGION", "us-east-1")
 API_VERSION_STRING = os.environ.get("API_VERSION_STRING") or exit(
@@ -98,14 +101,55 @@ COGNITO_KEYS_URL = f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{USER_POOL_I
 if AWS_RESOURCES_ENDPOINT:
     COGNITO_KEYS_URL = f"{AWS_RESOURCES_ENDPOINT}/{USER_POOL_ID}/.well-known/jwks.json"
 
+# How long (in seconds) Cognito's public keys are cached before being re-fetched
+COGNITO_KEYS_CACHE_TTL = int(os.environ.get("COGNITO_KEYS_CACHE_TTL", 60 * 60))
+# Max number of validated tokens (and their claims) kept in memory
+VALIDATED_TOKENS_CACHE_SIZE = int(os.environ.get("VALIDATED_TOKENS_CACHE_SIZE", 1024))
+
+
+# OpenSearch clients are created once per process: max number of pooled HTTP
+# connections, request timeout (in seconds) and max retries of failed requests
+OPENSEARCH_POOL_MAXSIZE = int(os.environ.get("OPENSEARCH_POOL_MAXSIZE", 10))
+OPENSEARCH_TIMEOUT = int(os.environ.get("OPENSEARCH_TIMEOUT", 10))
+OPENSEARCH_MAX_RETRIES = int(os.environ.get("OPENSEARCH_MAX_RETRIES", 3))
+# Settings of the ATBD index (applied when the index is created or rebuilt)
+OPENSEARCH_SHARDS = int(os.environ.get("OPENSEARCH_SHARDS", 1))
+OPENSEARCH_REPLICAS = int(os.environ.get("OPENSEARCH_REPLICAS", 1))
+OPENSEARCH_REFRESH_INTERVAL = os.environ.get("OPENSEARCH_REFRESH_INTERVAL", "1s")
+# Searches: max time spent by OpenSearch on a query, and how long (in seconds)
+# and how many results are cached by each API container
+SEARCH_TIMEOUT = os.environ.get("SEARCH_TIMEOUT", "2s")
+SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL", 30))
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", 256))
+# Rebuilding the ATBD index: number of processes serializing the documents
+# (0 serializes them in the worker process itself, eg: in Lambda, which
+# doesn't support multiprocessing) and of concurrent bulk requests
+REINDEX_PROCESSES = int(os.environ.get("REINDEX_PROCESSES", os.cpu_count() or 1))
+REINDEX_BULK_THREADS = int(os.environ.get("REINDEX_BULK_THREADS", 4))
+# Max number of changes (see `app.search.outbox`) applied to the index at once
+SEARCH_OUTBOX_BATCH_SIZE = int(os.environ.get("SEARCH_OUTBOX_BATCH_SIZE", 500))
+
 
 NOTIFICATIONS_FROM = os.environ.get("NOTIFICATIONS_FROM") or exit(
     "NOTIFICATIONS_FROM env var required"
 )
+# Notifications are sent by the worker: max number of emails per `send_notifications`
+# task, max emails sent per second (by each worker process) and concurrent sends,
+# retries of a send failing with a transient error, and max number of times the
+# emails that still failed are re-queued. The send rate isn't shared between the
+# worker processes (or concurrent Lambda invocations): it must be set to the SES
+# account's max send rate divided by the max number of concurrent workers.
+NOTIFICATIONS_TASK_SIZE = int(os.environ.get("NOTIFICATIONS_TASK_SIZE", 50))
+NOTIFICATIONS_MAX_SEND_RATE = float(os.environ.get("NOTIFICATIONS_MAX_SEND_RATE", 10))
+NOTIFICATIONS_CONCURRENCY = int(os.environ.get("NOTIFICATIONS_CONCURRENCY", 4))
+NOTIFICATIONS_MAX_RETRIES = int(os.environ.get("NOTIFICATIONS_MAX_RETRIES", 3))
+NOTIFICATIONS_MAX_REQUEUES = int(os.environ.get("NOTIFICATIONS_MAX_REQUEUES", 3))
 if APT_DEBUG:
     TASK_QUEUE_NAME = os.environ.get("TASK_QUEUE_NAME") or exit(
         "TASK_QUEUE_NAME env var required"
     )
+    PRIORITY_TASK_QUEUE_NAME = os.environ.get("PRIORITY_TASK_QUEUE_NAME")
+    DEAD_LETTER_TASK_QUEUE_NAME = os.environ.get("DEAD_LETTER_TASK_QUEUE_NAME")
     PDF_PREVIEW_HOST = os.environ.get("PDF_PREVIEW_HOST") or exit(
         "PDF_PREVIEW_HOST env var required"
     )
@@ -113,8 +157,50 @@ else:
     TASK_QUEUE_URL = os.environ.get("TASK_QUEUE_URL") or exit(
         "TASK_QUEUE_URL env var required"
     )
+    PRIORITY_TASK_QUEUE_URL = os.environ.get("PRIORITY_TASK_QUEUE_URL")
+    DEAD_LETTER_TASK_QUEUE_URL = os.environ.get("DEAD_LETTER_TASK_QUEUE_URL")
     PDF_PREVIEW_HOST = FRONTEND_URL
 
+# The worker (when it doesn't run as a Lambda) runs WORKER_PROCESSES processes,
+# each handling up to WORKER_THREADS tasks at once (and PDFs, which are the
+# heaviest, up to PDF_RENDER_CONCURRENCY). The messages of running tasks are
+# kept invisible TASK_VISIBILITY_TIMEOUT seconds at a time. Failed tasks are
+# retried after TASK_RETRY_DELAY seconds (doubled after each attempt) until
+# they've been received TASK_MAX_RECEIVES times, and are then moved to the
+# dead-letter queue. On SIGTERM, running tasks are given WORKER_DRAIN_TIMEOUT
+# seconds to finish
+WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", 1))
+WORKER_THREADS = int(os.environ.get("WORKER_THREADS", 8))
+TASK_VISIBILITY_TIMEOUT = int(os.environ.get("TASK_VISIBILITY_TIMEOUT", 60))
+TASK_RETRY_DELAY = int(os.environ.get("TASK_RETRY_DELAY", 30))
+TASK_MAX_RECEIVES = int(os.environ.get("TASK_MAX_RECEIVES", 3))
+WORKER_DRAIN_TIMEOUT = int(os.environ.get("WORKER_DRAIN_TIMEOUT", 60))
+
+# The PDF worker keeps a headless Chromium running between PDFs: number of PDFs
+# rendered before the browser is recycled, and how long (in seconds) to wait for
+# the preview page to be ready
+PDF_BROWSER_MAX_JOBS = int(os.environ.get("PDF_BROWSER_MAX_JOBS", 50))
+PDF_READY_TIMEOUT = int(os.environ.get("PDF_READY_TIMEOUT", 60))
+# Max number of PDFs rendered concurrently by a worker process (each rendering
+# thread keeps its own browser): by default, one per core
+PDF_RENDER_CONCURRENCY = int(
+    os.environ.get(
+        "PDF_RENDER_CONCURRENCY", max((os.cpu_count() or 1) // WORKER_PROCESSES, 1)
+    )
+)
+# PDFs still queued (or rendering) after that long (in seconds) are considered
+# lost, and are queued again when requested
+PDF_RENDER_TIMEOUT = int(os.environ.get("PDF_RENDER_TIMEOUT", 15 * 60))
+# SecretsManager ARN of the credentials (`username` and `password`) of the
+# Cognito user the worker signs in as to pre-render the PDFs of published
+# versions. If not set, these PDFs are pre-rendered as an anonymous reader
+PDF_SERVICE_CREDENTIALS_ARN = os.environ.get("PDF_SERVICE_CREDENTIALS_ARN")
+
+# How long (in seconds) the in-memory user directory is considered fresh, and
+# how long stale users may be served while the directory refreshes itself
+USER_DIRECTORY_TTL = int(os.environ.get("USER_DIRECTORY_TTL", 60 * 5))
+USER_DIRECTORY_MAX_STALE = int(os.environ.get("USER_DIRECTORY_MAX_STALE", 60 * 60))
+
 # Feature flags
 FEATURE_FLAGS = {
     "MFA_ENABLED": os.environ.get("APT_FEATURE_MFA_ENABLED", "true").lower() != "false",
@@ -124,4 +210,8 @@ FEATURE_FLAGS = {
     != "false",
     "PDF_EXPORT_DEBUG": os.environ.get("APT_FEATURE_PDF_EXPORT_DEBUG", "false").lower()
     != "false",
+    "SHARED_USER_DIRECTORY": os.environ.get(
+        "APT_FEATURE_SHARED_USER_DIRECTORY", "true"
+    ).lower()
+    != "false",
 }
@@ -1,12 +1,16 @@
 """CRUD Operations for Atbds model"""
-from typing import Union
+import datetime
+from typing import Any, Iterable, List, Tuple, Union
 
-from sqlalchemy import exc, func, orm
+from sqlalchemy import asc, desc, exc, func, orm, tuple_, types
+from sqlalchemy.orm.attributes import set_committed_value
 
 from app.crud.base import CRUDBase
 from app.db.db_session import DbSession
 from app.db.models import Atbds, AtbdVersions
+from app.permissions import atbd_versions_filter
 from app.schemas.atbds import Create, FullOutput, Update
+from app.schemas.document import DocumentSummary
 
 from fastapi import HTTPException
 
@@ -14,14 +18,78 @@ from fastapi import HTTPException
 class CRUDAtbds(CRUDBase[Atbds, FullOutput, Create, Update]):
     """CRUDAtbds."""
 
-    def scan(self, db: DbSession, status: str = None, role: str = None):
-        """List operation - uses orm.contains_earger to join Versions only once,
-        as opposed to re-loading the relation everytime the model is loaded."""
-        query = (
-            db.query(Atbds)
-            .join(AtbdVersions, Atbds.id == AtbdVersions.atbd_id)
-            .options(orm.contains_eager(Atbds.versions))
-        )
+    # Columns ATBDs can be sorted (and paginated) by. The ATBD id is always
+    # used as a tie-breaker, so that the (column, id) pair is unique.
+    SORT_COLUMNS = {
+        "last_updated_at": Atbds.last_updated_at,
+        "created_at": Atbds.created_at,
+        "title": Atbds.title,
+    }
+
+    # AtbdVersion columns that can be left out of a summary (see the `fields`
+    # param of `scan`)
+    OPTIONAL_SUMMARY_FIELDS = ("document", "citation", "sections_completed", "keywords")
+
+    # How much of the versions' content `get` loads: the `full` document,
+    # only the document sections included in the `summary` outputs, or only
+    # the `metadata` (status, contributors, lock etc), leaving out the
+    # `document` and `citation` columns entirely
+    LOAD_OPTIONS = ("full", "summary", "metadata")
+
+    @staticmethod
+    def _document_summary():
+        """JSON object holding only the document sections included in the
+        summary outputs (`DocumentSummary`), built by the database so that the
+        (potentially very large) full document is never transferred"""
+        args = []
+        for section in DocumentSummary.__fields__:
+            args.extend([section, AtbdVersions.document[section]])
+        return func.json_build_object(*args)
+
+    def _versions_loader(
+        self, deferred_fields: Iterable[str] = (), summary_document: bool = False
+    ):
+        """Loader option for the versions joined to the ATBDs, leaving out the
+        `deferred_fields` and, if `summary_document` is set, loading the
+        document summary instead of the full document"""
+        loader = orm.contains_eager(Atbds.versions)
+        skipped = set(deferred_fields)
+        if summary_document:
+            skipped.add("document")
+        if skipped:
+            loader = loader.load_only(
+                *[c.key for c in AtbdVersions.__table__.columns if c.key not in skipped]
+            )
+        if summary_document:
+            loader = loader.with_expression(
+                AtbdVersions.document_summary, self._document_summary()
+            )
+        return loader
+
+    @staticmethod
+    def _set_unloaded_fields(atbds: List[Atbds], empty_fields: Iterable[str] = ()):
+        """Sets the `empty_fields` left out by `_versions_loader` to `None` on
+        the loaded versions, without flagging the versions as modified (and
+        without triggering a lazy load of the columns). The document summary
+        is left in `document_summary`, which the summary outputs serialize in
+        place of the unloaded `document`."""
+        for atbd in atbds:
+            for version in atbd.versions:
+                # Versions already present in the session keep the values
+                # they were loaded with
+                for field in empty_fields:
+                    if field not in version.__dict__:
+                        set_committed_value(version, field, None)
+
+    def _filter_versions(
+        self,
+        query: orm.Query,
+        status: str = None,
+        role: str = None,
+        principals: List[str] = None,
+    ) -> orm.Query:
+        if principals is not None:
+            query = query.filter(atbd_versions_filter(principals, action="view"))
 
         if status:
             query = query.filter(AtbdVersions.status == status)
@@ -41,10 +109,107 @@ class CRUDAtbds(CRUDBase[Atbds, FullOutput, Create, Update]):
                     ]
                 )
             )
-        return query.all()
+        return query
+
+    def sort_value(self, sort: str, value: Any) -> Any:
+        """Value of the `sort` column from its JSON representation (eg: in a
+        pagination cursor). Raises a ValueError if it isn't a valid value of
+        the column"""
+        column_type = self.SORT_COLUMNS[sort].type
+        if isinstance(column_type, types.DateTime):
+            if not isinstance(value, str):
+                raise ValueError(f"Invalid datetime: {value!r}")
+            return datetime.datetime.fromisoformat(value)
+        if not isinstance(value, column_type.python_type):
+            raise ValueError(f"Invalid {sort}: {value!r}")
+        return value
+
+    def scan(
+        self,
+        db: DbSession,
+        status: str = None,
+        role: str = None,
+        principals: List[str] = None,
+        sort: str = "last_updated_at",
+        order: str = "desc",
+        limit: int = None,
+        after: Tuple[Any, int] = None,
+        fields: List[str] = None,
+    ):
+        """List operation - uses orm.contains_earger to join Versions only once,
+        as opposed to re-loading the relation everytime the model is loaded.
+
+        If `principals` are provided, only the versions the principals are
+        allowed to view are returned (and ATBDs without any such version are
+        left out), the permission check being performed by the database.
+
+        ATBDs are sorted by `sort` (one of `SORT_COLUMNS`) and id. If `limit`
+        is provided, only a page of `limit` ATBDs is returned, starting after
+        the ATBD with the (`sort` value, id) pair given in `after` (keyset
+        pagination, see `sort_value`). The ATBDs are paginated before joining
+        the versions, so a page never splits the versions of an ATBD.
+
+        Only the document sections included in the summary outputs are
+        loaded. If `fields` is provided, only the listed
+        `OPTIONAL_SUMMARY_FIELDS` are loaded from the database, the others
+        being set to `None`.
+        """
+        sort_column = self.SORT_COLUMNS[sort]
+        direction = desc if order == "desc" else asc
+        ordering = [direction(sort_column), direction(Atbds.id)]
+
+        empty_fields = [
+            f
+            for f in self.OPTIONAL_SUMMARY_FIELDS
+            if fields is not None and f not in fields
+        ]
+        summary_document = "document" not in empty_fields
+
+        query = self._filter_versions(
+            db.query(Atbds)
+            .join(AtbdVersions, Atbds.id == AtbdVersions.atbd_id)
+            .options(
+                self._versions_loader(
+                    deferred_fields=empty_fields, summary_document=summary_document
+                )
+            ),
+            status=status,
+            role=role,
+            principals=principals,
+        )
+
+        if limit is not None or after is not None:
+            page = self._filter_versions(
+                db.query(Atbds.id, sort_column).join(
+                    AtbdVersions, Atbds.id == AtbdVersions.atbd_id
+                ),
+                status=status,
+                role=role,
+                principals=principals,
+            ).distinct()
+
+            if after is not None:
+                after_value, after_id = after
+                keyset = tuple_(sort_column, Atbds.id)
+                page = page.filter(
+                    keyset < tuple_(after_value, after_id)
+                    if order == "desc"
+                    else keyset > tuple_(after_value, after_id)
+                )
+
+            page_ids = page.order_by(*ordering).limit(limit).subquery()
+            query = query.filter(Atbds.id.in_(db.query(page_ids.c.id)))
+
+        atbds = query.order_by(*ordering).all()
+        self._set_unloaded_fields(atbds, empty_fields=empty_fields)
+        return atbds
 
     def _build_lookup_query(
-        self, db: DbSession, atbd_id: Union[str, int], version: int = None
+        self,
+        db: DbSession,
+        atbd_id: Union[str, int],
+        version: int = None,
+        load: str = "full",
     ):
         try:
             int(atbd_id)
@@ -55,7 +220,14 @@ class CRUDAtbds(CRUDBase[Atbds, FullOutput, Create, Update]):
         query = (
             db.query(Atbds)
             .join(AtbdVersions, Atbds.id == AtbdVersions.atbd_id)
-            .options(orm.contains_eager(Atbds.versions))
+            .options(
+                self._versions_loader(
+                    deferred_fields=["document", "citation"]
+                    if load == "metadata"
+                    else [],
+                    summary_document=load == "summary",
+                )
+            )
         )
 
         if version == -1:
@@ -82,16 +254,27 @@ class CRUDAtbds(CRUDBase[Atbds, FullOutput, Create, Update]):
 
         return query
 
-    def get(self, db: DbSession, atbd_id: Union[str, int], version: int = None):
-        """Query a single ATBD."""
-        query = self._build_lookup_query(db=db, atbd_id=atbd_id, version=version)
+    def get(
+        self,
+        db: DbSession,
+        atbd_id: Union[str, int],
+        version: int = None,
+        load: str = "full",
+    ):
+        """Query a single ATBD. `load` (one of `LOAD_OPTIONS`) controls how
+        much of the versions' content is loaded: endpoints returning a summary
+        output, or only checking permissions, don't need the full document."""
+        query = self._build_lookup_query(
+            db=db, atbd_id=atbd_id, version=version, load=load
+        )
         try:
-            return query.one()
+            atbd = query.one()
         except exc.SQLAlchemyError as e:
             print(e)
             raise HTTPException(
                 status_code=404, detail=f"No data found for id/alias: {atbd_id}"
             )
+        return atbd
 
     def create(  # type: ignore
         self, db: DbSession, atbd_input: Create, user_sub: str
@@ -1,9 +1,11 @@
 """Module with Basic CRUD operations - each DB model extends this ."""
-from typing import Generic, List, Tuple, Type, TypeVar, Union
+from typing import Any, Dict, Generic, List, Tuple, Type, TypeVar, Union
 
 from pydantic import BaseModel
+from sqlalchemy import inspect, tuple_, update
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 
 from app.db.base import Base
 
@@ -106,19 +108,89 @@ class CRUDBase(
         if commit:
             db_session.commit()
 
+    def _write(
+        self,
+        db: Session,
+        db_objs: List[ModelType],
+        values: Dict[str, Any],
+        commit: bool,
+    ):
+        """Writes the same `values` to the rows of all the `db_objs` with a
+        single UPDATE ... RETURNING statement, and sets the returned values on
+        the objects, without flagging them as modified, so that they don't
+        need to be refreshed. Along with the updated columns, the columns
+        already loaded on the objects are returned (they may have been changed
+        by the database, eg: by a trigger). Other columns are left to be
+        loaded on access."""
+        if values:
+            # Pending changes need to be written first, since the session
+            # doesn't autoflush
+            db.flush()
+
+            table = self.model.__table__  # type: ignore
+            primary_key = inspect(self.model).primary_key
+            states = [inspect(db_obj) for db_obj in db_objs]
+            returned = [
+                c
+                for c in table.columns
+                if c.primary_key
+                or c.key in values
+                or any(c.key in state.dict for state in states)
+            ]
+
+            rows = db.execute(
+                update(table)
+                .where(tuple_(*primary_key).in_([state.identity for state in states]))
+                .values(**values)
+                .returning(*returned)
+            ).fetchall()
+
+        if commit:
+            db.commit()
+
+        if values:
+            by_identity = {
+                tuple(row[c] for c in primary_key): row for row in rows  # noqa
+            }
+            for state in states:
+                row = by_identity.get(state.identity)
+                if row is None:
+                    continue
+                for c in returned:
+                    set_committed_value(state.obj(), c.key, row[c])
+                # Same event as the one emitted when refreshing the object,
+                # so that the listeners (eg: the `MutableDict` wrapping of the
+                # JSON columns) handle the returned values
+                state.manager.dispatch.refresh(state, None, [c.key for c in returned])
+        return db_objs
+
+    def _diff(self, db_obj: ModelType, update_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns the columns of `update_data` whose value differs from the
+        value loaded on the object (columns that aren't loaded are always
+        included)"""
+        loaded = inspect(db_obj).dict
+        columns = self.model.__table__.columns.keys()  # type: ignore
+        return {
+            key: value
+            for key, value in update_data.items()
+            if key in columns and (key not in loaded or loaded[key] != value)
+        }
+
     def update(
-        self, db: Session, *, db_obj: ModelType, obj_in: UpdateSchemaType
+        self,
+        db: Session,
+        *,
+        db_obj: ModelType,
+        obj_in: UpdateSchemaType,
+        commit: bool = True,
     ) -> ModelType:
-        """Queries the item in the DB, updates the class's attributes and
-        re-inserts into the DB."""
-        obj_data = jsonable_encoder(db_obj)
+        """Updates the columns of the item that differ from the values provided
+        (unset and `None` values are ignored) with a single UPDATE statement,
+        which returns the updated values."""
         update_data = obj_in.dict(exclude_unset=True, exclude_none=True)
-        for field in obj_data:
-            if field in update_data:
-                setattr(db_obj, field, update_data[field])
-        db.add(db_obj)
-        db.commit()
-        db.refresh(db_obj)
+        [db_obj] = self._write(
+            db, [db_obj], self._diff(db_obj, update_data), commit=commit
+        )
         return db_obj
 
     def remove(
@@ -0,0 +1,146 @@
+"""CRUD operations for the PDF render manifest"""
+import datetime
+from typing import Optional, Set
+
+from sqlalchemy import and_, exists, or_
+from sqlalchemy.dialects import postgresql
+
+from app.crud.base import CRUDBase
+from app.db.db_session import DbSession
+from app.db.models import AtbdVersions, PdfRenders
+from app.db.types import utcnow
+from app.schemas.pdf_renders import Create, FullOutput, PdfRenderStatusEnum, Update
+
+
+class CRUDPdfRenders(CRUDBase[PdfRenders, FullOutput, Create, Update]):
+    """CRUDPdfRenders"""
+
+    def lookup(
+        self,
+        db: DbSession,
+        *,
+        atbd_id: int,
+        major: int,
+        minor: int,
+        journal: bool,
+        content_hash: str,
+    ) -> Optional[PdfRenders]:
+        """Returns the render of the given content of a version, if any"""
+        return (
+            db.query(PdfRenders)
+            .filter(
+                PdfRenders.atbd_id == atbd_id,
+                PdfRenders.major == major,
+                PdfRenders.minor == minor,
+                PdfRenders.journal == journal,
+                PdfRenders.content_hash == content_hash,
+            )
+            .one_or_none()
+        )
+
+    def queue(
+        self, db: DbSession, *, obj_in: Create, stale_before: datetime.datetime
+    ) -> Optional[int]:
+        """Records the render as queued and returns its id, or None if the
+        render is already queued (or rendering) and isn't older than
+        `stale_before`: in which case the caller attaches to the render in
+        progress instead of queueing it again.
+
+        Concurrent requests for the same render are coalesced by the insert
+        (only one of them gets the id back)."""
+        values = dict(status=PdfRenderStatusEnum.QUEUED.value, updated_at=utcnow())
+        stmt = postgresql.insert(PdfRenders).values(**obj_in.dict(), **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                PdfRenders.atbd_id,
+                PdfRenders.major,
+                PdfRenders.minor,
+                PdfRenders.journal,
+                PdfRenders.content_hash,
+            ],
+            set_=dict(s3_key=stmt.excluded.s3_key, error=None, **values),
+            where=or_(
+                PdfRenders.status.in_(
+                    [PdfRenderStatusEnum.DONE.value, PdfRenderStatusEnum.FAILED.value]
+                ),
+                PdfRenders.updated_at < stale_before,
+            ),
+        ).returning(PdfRenders.id)
+        render_id = db.execute(stmt).scalar()
+        db.commit()
+        return render_id
+
+    def claim(
+        self, db: DbSession, *, render_id: int, stale_before: datetime.datetime
+    ) -> bool:
+        """Marks a render as rendering. Returns False if the render is done,
+        or is being rendered (eg: by a duplicate task) since `stale_before`.
+        Failed renders are claimed by the retries of their task."""
+        claimed = (
+            db.query(PdfRenders)
+            .filter(
+                PdfRenders.id == render_id,
+                or_(
+                    PdfRenders.status.in_(
+                        [
+                            PdfRenderStatusEnum.QUEUED.value,
+                            PdfRenderStatusEnum.FAILED.value,
+                        ]
+                    ),
+                    and_(
+                        PdfRenders.status == PdfRenderStatusEnum.RENDERING.value,
+                        PdfRenders.updated_at < stale_before,
+                    ),
+                ),
+            )
+            .update(
+                dict(
+                    status=PdfRenderStatusEnum.RENDERING.value,
+                    error=None,
+                    updated_at=utcnow(),
+                ),
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        return claimed == 1
+
+    def set_status(
+        self,
+        db: DbSession,
+        *,
+        render_id: int,
+        status: PdfRenderStatusEnum,
+        error: str = None,
+    ):
+        """Updates the status of a render"""
+        db.query(PdfRenders).filter(PdfRenders.id == render_id).update(
+            dict(status=status.value, error=error, updated_at=utcnow()),
+            synchronize_session=False,
+        )
+        db.commit()
+
+    def delete_superseded(self, db: DbSession, *, atbd_id: int) -> Set[str]:
+        """Deletes the renders of content the versions of an ATBD no longer
+        have (eg: a draft that has since been edited), and returns the content
+        hashes of the versions"""
+        current = exists().where(
+            and_(
+                AtbdVersions.atbd_id == PdfRenders.atbd_id,
+                AtbdVersions.major == PdfRenders.major,
+                AtbdVersions.content_hash == PdfRenders.content_hash,
+            )
+        )
+        db.query(PdfRenders).filter(PdfRenders.atbd_id == atbd_id, ~current).delete(
+            synchronize_session=False
+        )
+        db.commit()
+        return {
+            content_hash
+            for (content_hash,) in db.query(AtbdVersions.content_hash).filter(
+                AtbdVersions.atbd_id == atbd_id
+            )
+        }
+
+
+crud_pdf_renders = CRUDPdfRenders(PdfRenders)
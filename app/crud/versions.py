@@ -1,7 +1,10 @@
 """CRUD operations for ATBD Versions."""
 
-from typing import Union
+import datetime
+from typing import Any, Dict, List, Optional, Tuple, Union
 
+from sqlalchemy import Text, and_, cast, func, literal, update
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import Session
 
 from app.crud.base import CRUDBase
@@ -22,9 +25,127 @@ class CRUDVersions(CRUDBase[AtbdVersions, FullOutput, Create, Update]):
         version.locked_by = locked_by
         db.add(version)
         db.commit()
-        db.refresh(version)
         return {}
 
+    def update_content(
+        self,
+        db: Session,
+        *,
+        version: AtbdVersions,
+        document: Dict[str, Any] = None,
+        sections_completed: Dict[str, Any] = None,
+        overwrite: bool = False,
+        commit: bool = True,
+    ):
+        """Updates the `document` and `sections_completed` of a version with
+        a single UPDATE statement. Unless `overwrite` is set, the provided
+        (top level) sections are merged into the existing values by the
+        database (`||`), so that a one-section edit only sends that section
+        to the database, and never reads the full document back."""
+        values = {}
+        for column, value in (
+            (AtbdVersions.document, document),
+            (AtbdVersions.sections_completed, sections_completed),
+        ):
+            if value is None:
+                continue
+            value = literal(value, type_=postgresql.JSONB)
+            values[column.key] = (
+                value
+                if overwrite
+                else func.coalesce(column, literal({}, type_=postgresql.JSONB)).op(
+                    "||"
+                )(value)
+            )
+        if not values:
+            return
+
+        db.query(AtbdVersions).filter(
+            AtbdVersions.atbd_id == version.atbd_id,
+            AtbdVersions.major == version.major,
+        ).update(values, synchronize_session=False)
+        # The loaded values (if any) are now stale
+        db.expire(version, list(values))
+        if commit:
+            db.commit()
+
+    def patch_document(
+        self,
+        db: Session,
+        *,
+        version: AtbdVersions,
+        row_version: int,
+        operations: List[Tuple[str, str, Any]],
+        sections_completed: Dict[str, Any] = None,
+        user_sub: str,
+    ) -> Optional[Dict[str, Any]]:
+        """Applies the (op, section, value) `operations` to the document of a
+        version, and merges `sections_completed` into the existing values,
+        with a single UPDATE ... RETURNING statement. The update only succeeds
+        if the `row_version` of the version hasn't changed (optimistic
+        concurrency control): returns `None` otherwise.
+
+        Returns the updated sections, the (merged) sections completed, and
+        the new row version."""
+        jsonb = postgresql.JSONB
+        document = func.coalesce(AtbdVersions.document, literal({}, type_=jsonb))
+        for op, section, value in operations:
+            if op == "remove":
+                document = document.op("-")(cast(section, Text))
+            else:
+                document = func.jsonb_set(
+                    document,
+                    literal([section], type_=postgresql.ARRAY(Text)),
+                    literal(value, type_=jsonb),
+                    True,
+                )
+
+        values: Dict[str, Any] = dict(
+            last_updated_by=user_sub,
+            last_updated_at=datetime.datetime.now(datetime.timezone.utc),
+        )
+        if operations:
+            values["document"] = document
+        if sections_completed is not None:
+            values["sections_completed"] = func.coalesce(
+                AtbdVersions.sections_completed, literal({}, type_=jsonb)
+            ).op("||")(literal(sections_completed, type_=jsonb))
+
+        sections = sorted({section for _, section, _ in operations})
+        updated_document = func.jsonb_build_object(
+            *[a for s in sections for a in (s, AtbdVersions.document[s])]
+        )
+        stmt = (
+            update(AtbdVersions)
+            .where(
+                and_(
+                    AtbdVersions.atbd_id == version.atbd_id,
+                    AtbdVersions.major == version.major,
+                    AtbdVersions.row_version == row_version,
+                )
+            )
+            .values(**values)
+            .returning(
+                updated_document.label("document"),
+                AtbdVersions.sections_completed,
+                AtbdVersions.last_updated_at,
+                AtbdVersions.row_version,
+            )
+        )
+        result = db.execute(stmt).first()
+        db.commit()
+        if result is None:
+            return None
+
+        return dict(
+            document=result.document,
+            sections_completed=result.sections_completed
+            if sections_completed is not None
+            else None,
+            last_updated_at=result.last_updated_at,
+            row_version=result.row_version,
+        )
+
     def delete(self, db: DbSession, atbd: Atbds, version: AtbdVersions):
         """
         Delete atbd version - if it was the last AtbdVersion in the Atbd,
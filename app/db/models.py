@@ -10,12 +10,13 @@ from sqlalchemy import (
     ForeignKeyConstraint,
     Integer,
     String,
+    UniqueConstraint,
     types,
 )
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.ext.mutable import MutableDict
-from sqlalchemy.orm import backref, relationship
+from sqlalchemy.orm import backref, query_expression, relationship
 
 from app import acls
 from app.db.base import Base
@@ -71,7 +72,7 @@ class AtbdVersions(Base):
     major = Column(Integer(), primary_key=True, server_default="1")
     minor = Column(Integer(), server_default="0")
     status = Column(String(), server_default="DRAFT", nullable=False)
-    document = Column(MutableDict.as_mutable(postgresql.JSON), server_default="{}")
+    document = Column(MutableDict.as_mutable(postgresql.JSONB), server_default="{}")
     pdf_id = Column(
         Integer(),
         ForeignKey("pdf_uploads.id"),
@@ -81,7 +82,7 @@ class AtbdVersions(Base):
         MutableDict.as_mutable(postgresql.JSON), server_default="{}"
     )
     sections_completed = Column(
-        MutableDict.as_mutable(postgresql.JSON), server_default="{}"
+        MutableDict.as_mutable(postgresql.JSONB), server_default="{}"
     )
     published_by = Column(String())
     published_at = Column(types.DateTime)
@@ -90,13 +91,24 @@ class AtbdVersions(Base):
     last_updated_by = Column(String(), nullable=False)
     last_updated_at = Column(types.DateTime, server_default=utcnow(), nullable=False)
     doi = Column(String())
-    citation = Column(MutableDict.as_mutable(postgresql.JSON), server_default="{}")
+    citation = Column(MutableDict.as_mutable(postgresql.JSONB), server_default="{}")
     owner = Column(String(), nullable=False)
     authors = Column(postgresql.ARRAY(String()), server_default="{{}}")
     reviewers = Column(postgresql.ARRAY(postgresql.JSONB), server_default="{{}}")
     journal_status = Column(String())
     keywords = Column(postgresql.ARRAY(postgresql.JSONB), server_default="{{}}")
     locked_by = Column(String(), nullable=True)
+    # Incremented (by the database) whenever the content changes. Used as the
+    # version's ETag
+    row_version = Column(Integer(), server_default="1", nullable=False)
+    # Hash of the content the version's PDF is rendered from, maintained by the
+    # database whenever that content changes (see `PdfRenders`)
+    content_hash = Column(String())
+
+    # Only populated by queries that load the sections of the document
+    # included in the summary outputs instead of the full `document`
+    # (see `CRUDAtbds`)
+    document_summary = query_expression()
 
     pdf = relationship(
         "PDFUpload",
@@ -432,3 +444,76 @@ class PDFUpload(Upload):
             f" storage={self.storage}, created_by={self.created_by},"
             f" created_at={self.created_at},"
         )
+
+
+class CognitoUsers(Base):
+    """Shared copy of the app's Cognito users (see `app.users.directory`),
+    used to warm up the user directory of new API containers"""
+
+    __tablename__ = "cognito_users"
+    sub = Column(String(), primary_key=True)
+    email = Column(String(), nullable=False)
+    preferred_username = Column(String(), nullable=False)
+    cognito_groups = Column(postgresql.ARRAY(String()), server_default="{}")
+    updated_at = Column(types.DateTime, server_default=utcnow(), nullable=False)
+
+    def __repr__(self):
+        """String representation"""
+        return (
+            f"<CognitoUsers(sub={self.sub}, email={self.email},"
+            f" preferred_username={self.preferred_username},"
+            f" cognito_groups={self.cognito_groups}, updated_at={self.updated_at})>"
+        )
+
+
+class SearchOutbox(Base):
+    """Change to be applied to the search index, recorded by the database
+    triggers in the same transaction as the change (see `app.search.outbox`).
+    A `None` major stands for all the versions of the ATBD."""
+
+    __tablename__ = "search_outbox"
+    id = Column(types.BigInteger(), primary_key=True, autoincrement=True)
+    atbd_id = Column(Integer(), nullable=False)
+    major = Column(Integer())
+    created_at = Column(types.DateTime, server_default=utcnow(), nullable=False)
+
+    def __repr__(self):
+        """String representation"""
+        return (
+            f"<SearchOutbox(id={self.id}, atbd_id={self.atbd_id},"
+            f" major={self.major}, created_at={self.created_at})>"
+        )
+
+
+class PdfRenders(Base):
+    """PDF rendered (or being rendered) by the worker from the content of an
+    ATBD version with the given `content_hash`, stored at `s3_key`"""
+
+    __tablename__ = "pdf_renders"
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["atbd_id", "major"],
+            ["atbd_versions.atbd_id", "atbd_versions.major"],
+            ondelete="CASCADE",
+        ),
+        UniqueConstraint("atbd_id", "major", "minor", "journal", "content_hash"),
+    )
+    id = Column(Integer(), primary_key=True, autoincrement=True)
+    atbd_id = Column(Integer(), nullable=False)
+    major = Column(Integer(), nullable=False)
+    minor = Column(Integer(), nullable=False)
+    journal = Column(types.Boolean(), server_default="false", nullable=False)
+    content_hash = Column(String(), nullable=False)
+    s3_key = Column(String(), nullable=False)
+    status = Column(String(), server_default="QUEUED", nullable=False)
+    error = Column(String())
+    created_at = Column(types.DateTime, server_default=utcnow(), nullable=False)
+    updated_at = Column(types.DateTime, server_default=utcnow(), nullable=False)
+
+    def __repr__(self):
+        """String representation"""
+        return (
+            f"<PdfRenders(id={self.id}, atbd_id={self.atbd_id},"
+            f" version=v{self.major}.{self.minor}, journal={self.journal},"
+            f" status={self.status}, s3_key={self.s3_key})>"
+        )
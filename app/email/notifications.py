@@ -1,17 +1,35 @@
-"""Email notifications module"""
-import json
+"""Email notifications module
+
+Notifications are rendered when the event occurs, and the resulting emails
+are sent by the worker (`send_notifications` tasks), so that fanning out a
+notification to many users doesn't hold the API request (or Lambda) open.
+"""
 import os
-from string import Template
+import threading
 from typing import Any, Dict, List, Mapping, Optional
 
 from app import config
 from app.api.utils import ses_client
 from app.db.models import AtbdVersions
+from app.email.sender import EmailSender, Message
+from app.email.templates import EmailTemplate, TemplateRegistry
+from app.logs import logger
 from app.schemas.users import CognitoUser
+from app.task_runtime import (
+    MAX_MESSAGE_BYTES,
+    batch_entries,
+    chunk_by_size,
+    encode_task,
+)
 from app.users import cognito
+from app.users.directory import user_directory
+from app.utils import get_task_queue
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
-EMAIL_TEMPLATES = json.load(open(os.path.join(dir_path, "email_templates.json"), "r"))
+# Compiled (and validated) once, at startup
+email_templates = TemplateRegistry.from_file(
+    os.path.join(dir_path, "email_templates.json")
+)
 
 
 class UserNotification(Dict):
@@ -51,13 +69,7 @@ def notify_atbd_version_contributors(
 
         # If curator exists
         if "curators" in mentioned_users:
-            recipient_user_ids.extend(
-                [
-                    user_id
-                    for (user_id, user) in app_users.items()
-                    if "curator" in user.cognito_groups
-                ]
-            )
+            recipient_user_ids.extend(user_directory.subs_in_group("curator"))
     else:
         recipient_user_ids.append(atbd_version.owner)
         recipient_user_ids.extend(atbd_version.authors)
@@ -98,34 +110,107 @@ def notify_users(
     ownership of the document has been removed and the new owner is notified that they have
     been granted ownership)
     """
+    # Values shared by all the notifications of the event, substituted only
+    # once per notification type
+    shared_kwargs = dict(
+        # System configs
+        frontend_url=config.FRONTEND_URL,
+        # User performing the action:
+        app_user=user.preferred_username,
+        role=" ".join(user.cognito_groups),
+        atbd_title=atbd_title,
+        atbd_version=atbd_version,
+        atbd_version_link=f"{config.FRONTEND_URL}/documents/{atbd_id}/{atbd_version}",
+    )
+    bound_templates: Dict[str, EmailTemplate] = {}
+
+    messages: List[Message] = []
     for user_to_notify in user_notifications:
+        notification = user_to_notify["notification"]
+        if notification not in bound_templates:
+            bound_templates[notification] = email_templates[notification].bind(
+                shared_kwargs
+            )
+
+        subject_content, body_content = bound_templates[notification].render(
+            dict(
+                # User being notified:
+                preferred_username=user_to_notify["preferred_username"],
+                **(user_to_notify.get("data") or {}),
+            )
+        )
+
+        messages.append(
+            {
+                "to": user_to_notify["email"],
+                "subject": subject_content,
+                "html": body_content,
+            }
+        )
 
-        message = EMAIL_TEMPLATES[user_to_notify["notification"]]
-
-        subject_t = Template(message["subject"])
-        body_t = Template(message["content"])
-
-        template_kwargs = dict(
-            # System configs
-            frontend_url=config.FRONTEND_URL,
-            # User performing the action:
-            app_user=user.preferred_username,
-            role=" ".join(user.cognito_groups),
-            # User being notified:
-            preferred_username=user_to_notify["preferred_username"],
-            atbd_title=atbd_title,
-            atbd_version=atbd_version,
-            atbd_version_link=f"{config.FRONTEND_URL}/documents/{atbd_id}/{atbd_version}",
-            **user_to_notify.get("data", {}),
+    enqueue_notifications(messages)
+
+
+def enqueue_notifications(messages: List[Message], attempt: int = 0, delay: int = 0):
+    """Queues `send_notifications` tasks for the worker, with as few SQS
+    requests as possible. A task holds up to `NOTIFICATIONS_TASK_SIZE` emails,
+    and no more than fit in a single SQS message (the emails are rendered, so
+    their size varies a lot, eg: with the comment of the notification)."""
+    bodies = []
+    for chunk in chunk_by_size(messages, config.NOTIFICATIONS_TASK_SIZE):
+        body = encode_task(
+            "send_notifications", {"messages": chunk, "attempt": attempt}
         )
-        subject_content = subject_t.substitute(**template_kwargs)
-        body_content = body_t.substitute(**template_kwargs)
-
-        ses_client().send_email(
-            Source=config.NOTIFICATIONS_FROM,
-            Destination={"ToAddresses": [user_to_notify["email"]]},
-            Message={
-                "Subject": {"Data": subject_content},
-                "Body": {"Html": {"Data": body_content}},
-            },
+        if len(body) > MAX_MESSAGE_BYTES:
+            logger.error(
+                "Notification too large to be queued: %s", [m["to"] for m in chunk]
+            )
+            continue
+        bodies.append(body)
+
+    if not bodies:
+        return
+    task_queue = get_task_queue()
+    for entries in batch_entries(bodies, delay=delay):
+        response = task_queue.send_messages(Entries=entries)
+        for failure in response.get("Failed", []):
+            logger.error("Unable to queue notifications: %s", failure)
+
+
+_sender_lock = threading.Lock()
+_sender: EmailSender = None
+
+
+def get_email_sender() -> EmailSender:
+    """Email sender (and SES client) shared by all the tasks of the process"""
+    global _sender
+    if _sender is None:
+        with _sender_lock:
+            if _sender is None:
+                _sender = EmailSender(
+                    ses=ses_client(),
+                    source=config.NOTIFICATIONS_FROM,
+                    max_send_rate=config.NOTIFICATIONS_MAX_SEND_RATE,
+                    concurrency=config.NOTIFICATIONS_CONCURRENCY,
+                    max_retries=config.NOTIFICATIONS_MAX_RETRIES,
+                )
+    return _sender
+
+
+def send_notifications(messages: List[Message], attempt: int = 0):
+    """Worker task: sends the emails. The emails that couldn't be sent because
+    of a transient error are re-queued (with a growing delay), up to
+    `NOTIFICATIONS_MAX_REQUEUES` times."""
+    failed = get_email_sender().send(messages)
+    logger.info("Sent %s/%s emails", len(messages) - len(failed), len(messages))
+    if not failed:
+        return
+    if attempt >= config.NOTIFICATIONS_MAX_REQUEUES:
+        logger.error(
+            "Giving up on %s emails: %s", len(failed), [m["to"] for m in failed]
         )
+        return
+    # SQS delays are capped at 15 minutes
+    enqueue_notifications(
+        failed, attempt=attempt + 1, delay=min(60 * 2**attempt, 900)
+    )
@@ -0,0 +1,178 @@
+"""Sends batches of emails through SES, concurrently and under the account's
+max send rate.
+
+- a single (thread-safe) SES client is shared by all the sends
+- sends are spread over a pool of threads, each send first taking a token
+  from a rate limiter shared by the threads
+- sends that fail with a transient error (throttling, SES unavailable) are
+  retried with a backoff; the messages that still fail are returned to the
+  caller, which can re-queue them
+- sends failing because of the credentials or configuration of the sender
+  (which fail every send) raise an `EmailConfigurationError`, so that the
+  task fails instead of dropping the emails. The first email of a batch is
+  sent alone, so that a misconfigured sender fails before sending any email
+- the rate limiter is per process: with concurrent workers (eg: Lambda
+  invocations), the account's send rate is shared by all of them, and
+  `NOTIFICATIONS_MAX_SEND_RATE` must be set accordingly
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from botocore.exceptions import ClientError
+
+from app.logs import logger
+
+# An email to send: `to` (address), `subject` and `html` (body)
+Message = Dict[str, str]
+
+# Errors returned by SES for which the send can be retried
+TRANSIENT_ERRORS = {
+    "Throttling",
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailable",
+    "InternalFailure",
+}
+
+# Errors returned by SES (or the AWS auth layer) when the sender itself can't
+# send emails: missing permissions, invalid credentials or SES configuration
+CONFIGURATION_ERRORS = {
+    "AccessDenied",
+    "AccessDeniedException",
+    "UnrecognizedClientException",
+    "InvalidClientTokenId",
+    "SignatureDoesNotMatch",
+    "ExpiredToken",
+    "ExpiredTokenException",
+    "MissingAuthenticationToken",
+    "MailFromDomainNotVerifiedException",
+    "ConfigurationSetDoesNotExist",
+    "AccountSendingPausedException",
+}
+
+
+class EmailConfigurationError(Exception):
+    """The sender can't send emails (eg: it isn't allowed to use SES)"""
+
+
+class RateLimiter:
+    """Token bucket: allows `rate` acquisitions per second (and bursts of up
+    to `rate` acquisitions), shared by all the threads of the process"""
+
+    def __init__(
+        self,
+        rate: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        """Init limiter, with a full bucket"""
+        self.rate = rate
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = rate
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available, and takes it"""
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(
+                    self.rate, self._tokens + (now - self._updated_at) * self.rate
+                )
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+class EmailSender:
+    """Sends emails from `source` with the `ses` client"""
+
+    # Base delay (in seconds) before retrying a send, doubled on each retry
+    RETRY_BACKOFF = 0.5
+
+    def __init__(
+        self,
+        ses: Any,
+        source: str,
+        max_send_rate: float,
+        concurrency: int,
+        max_retries: int,
+    ):
+        """Init sender"""
+        self.ses = ses
+        self.source = source
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.limiter = RateLimiter(max_send_rate)
+
+    def _send(self, message: Message) -> bool:
+        """Sends a single email. Returns False if the send failed with a
+        transient error (even after retrying), and raises an
+        `EmailConfigurationError` if the sender can't send emails."""
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                self.ses.send_email(
+                    Source=self.source,
+                    Destination={"ToAddresses": [message["to"]]},
+                    Message={
+                        "Subject": {"Data": message["subject"]},
+                        "Body": {"Html": {"Data": message["html"]}},
+                    },
+                )
+                return True
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code")
+                if code in CONFIGURATION_ERRORS:
+                    raise EmailConfigurationError(
+                        f"Unable to send emails from {self.source}: {e}"
+                    ) from e
+                if code not in TRANSIENT_ERRORS:
+                    # eg: a rejected or invalid address, which retrying
+                    # won't fix
+                    logger.error("Unable to send email to %s: %s", message["to"], e)
+                    return True
+                if attempt < self.max_retries:
+                    time.sleep(self.RETRY_BACKOFF * 2**attempt)
+        logger.warning("Unable to send email to %s after retrying", message["to"])
+        return False
+
+    def send(self, messages: List[Message]) -> List[Message]:
+        """Sends the emails. Returns the messages that couldn't be sent.
+
+        The first email is sent on its own: if the sender can't send emails,
+        an `EmailConfigurationError` is raised before any email is sent (the
+        task fails, and is retried). If the configuration breaks while the
+        other emails are being sent, the remaining sends are stopped and the
+        unsent messages are returned along with the ones that failed with a
+        transient error, so that only they are re-queued."""
+        if not messages:
+            return []
+        sent = [self._send(messages[0])]
+
+        stopped = threading.Event()
+
+        def _send(message: Message) -> bool:
+            if stopped.is_set():
+                return False
+            try:
+                return self._send(message)
+            except EmailConfigurationError as e:
+                logger.error("Stopping the sends: %s", e)
+                stopped.set()
+                return False
+
+        rest = messages[1:]
+        if rest:
+            with ThreadPoolExecutor(
+                max_workers=min(self.concurrency, len(rest))
+            ) as executor:
+                sent.extend(executor.map(_send, rest))
+        return [message for message, ok in zip(messages, sent) if not ok]
@@ -0,0 +1,149 @@
+"""Registry of the (pre-compiled) email templates.
+
+The templates of `email_templates.json` are parsed once, at startup, into
+lists of static text and placeholders, and their placeholders are validated
+(a typo in a template fails at startup, instead of when the notification is
+sent). Rendering a notification for many recipients then only substitutes
+the values that differ between recipients: the values shared by all the
+recipients of an event (ATBD, user performing the action, links) are bound
+to the template once per event (see `EmailTemplate.bind`).
+"""
+import json
+from string import Template
+from typing import Dict, List, Mapping, Set, Tuple, Union
+
+# Values shared by all the recipients of an event
+SHARED_FIELDS = {
+    "frontend_url",
+    "app_user",
+    "role",
+    "atbd_title",
+    "atbd_version",
+    "atbd_version_link",
+}
+# Values specific to each recipient: the recipient's name, and the `data` of
+# the notification
+RECIPIENT_FIELDS = {"preferred_username", "comment", "section", "transferred_to"}
+
+# Static text, or the (name,) of a placeholder
+Part = Union[str, Tuple[str]]
+
+
+def _merge(parts: List[Part]) -> List[Part]:
+    """Merges adjacent static texts (and drops empty ones)"""
+    merged: List[Part] = []
+    for part in parts:
+        if isinstance(part, str):
+            if not part:
+                continue
+            if merged and isinstance(merged[-1], str):
+                merged[-1] += part
+                continue
+        merged.append(part)
+    return merged
+
+
+def _compile(text: str) -> List[Part]:
+    """Parses a `string.Template` into static text and placeholders"""
+    parts: List[Part] = []
+    position = 0
+    for match in Template.pattern.finditer(text):
+        parts.append(text[position : match.start()])
+        name = match.group("named") or match.group("braced")
+        if name:
+            parts.append((name,))
+        elif match.group("escaped") is not None:
+            parts.append(Template.delimiter)
+        else:
+            raise ValueError(f"Invalid placeholder at position {match.start()}")
+        position = match.end()
+    parts.append(text[position:])
+    return _merge(parts)
+
+
+def _substitute(parts: List[Part], values: Mapping[str, object]) -> List[Part]:
+    return _merge(
+        [
+            str(values[part[0]])
+            if not isinstance(part, str) and part[0] in values
+            else part
+            for part in parts
+        ]
+    )
+
+
+def _render(parts: List[Part], values: Mapping[str, object]) -> str:
+    return "".join(
+        part if isinstance(part, str) else str(values[part[0]]) for part in parts
+    )
+
+
+class EmailTemplate:
+    """Compiled subject and (HTML) content of a notification"""
+
+    def __init__(self, name: str, subject: List[Part], content: List[Part]):
+        """Init template, from compiled parts"""
+        self.name = name
+        self.subject = subject
+        self.content = content
+
+    @classmethod
+    def compile(cls, name: str, subject: str, content: str) -> "EmailTemplate":
+        """Compiles the subject and content templates"""
+        try:
+            return cls(name, _compile(subject), _compile(content))
+        except ValueError as e:
+            raise ValueError(f"Email template {name}: {e}")
+
+    @property
+    def placeholders(self) -> Set[str]:
+        """Names of the values still to be substituted"""
+        return {
+            part[0] for part in self.subject + self.content if not isinstance(part, str)
+        }
+
+    def bind(self, values: Mapping[str, object]) -> "EmailTemplate":
+        """Returns a copy of the template with the provided values substituted,
+        the other placeholders being left to be rendered"""
+        return EmailTemplate(
+            self.name,
+            _substitute(self.subject, values),
+            _substitute(self.content, values),
+        )
+
+    def render(self, values: Mapping[str, object]) -> Tuple[str, str]:
+        """Renders the (subject, content) of the email. Raises a `KeyError` if
+        a placeholder has no value."""
+        return _render(self.subject, values), _render(self.content, values)
+
+
+class TemplateRegistry:
+    """The compiled email templates, by notification"""
+
+    def __init__(self, templates: Mapping[str, Mapping[str, str]]):
+        """Compiles (and validates) all the templates"""
+        self._templates: Dict[str, EmailTemplate] = {}
+        for name, message in templates.items():
+            template = EmailTemplate.compile(
+                name, message["subject"], message["content"]
+            )
+            unknown = template.placeholders - SHARED_FIELDS - RECIPIENT_FIELDS
+            if unknown:
+                raise ValueError(
+                    f"Email template {name}: unknown placeholders {sorted(unknown)}"
+                )
+            self._templates[name] = template
+
+    @classmethod
+    def from_file(cls, path: str) -> "TemplateRegistry":
+        """Loads the templates of a JSON file"""
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+    def __getitem__(self, name: str) -> EmailTemplate:
+        """Returns the template of a notification"""
+        return self._templates[name]
+
+    def __contains__(self, name: str) -> bool:
+        """Whether the notification has a template"""
+        return name in self._templates
@@ -2,17 +2,20 @@
 Provides logging functionality for the APT API
 - TODO: implement the use of this logging class throughout the API, instead
         of relying on a mixture of `logs.info()` and `print()` statements
+
+The logger doesn't require the app's config, so that the modules logging
+through it can be used (and tested) without it: the debug level is set once
+the config is loaded (see `app.config`).
 """
 import logging
 
-from app.config import APT_DEBUG
-
 logging.basicConfig()
 logging.getLogger("sqlalchemy.engine").setLevel(logging.ERROR)
 
 logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
 
-if APT_DEBUG:
-    logger.setLevel(logging.DEBUG)
-else:
-    logger.setLevel(logging.INFO)
+def set_debug(debug: bool):
+    """Sets the level of the logger to DEBUG (or INFO)"""
+    logger.setLevel(logging.DEBUG if debug else logging.INFO)
@@ -3,6 +3,7 @@
 
 from app import config
 from app.api.v2.api import api_router
+from app.search.opensearch import close_async_opensearch_client
 
 from fastapi import FastAPI
 
@@ -25,8 +26,9 @@ if config.BACKEND_CORS_ORIGINS:
         CORSMiddleware,
         allow_origins=origins,
         allow_credentials=True,
-        allow_methods=["HEAD", "GET", "POST", "PUT", "DELETE"],
+        allow_methods=["HEAD", "GET", "POST", "PUT", "PATCH", "DELETE"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "ETag"],
     )
 
 app.add_middleware(GZipMiddleware, minimum_size=0)
@@ -37,3 +39,9 @@ app.include_router(api_router, prefix=config.API_VERSION_STRING)
 def ping():
     """Health check."""
     return {"ping": "pong!"}
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Closes the pooled connections to OpenSearch."""
+    await close_async_opensearch_client()
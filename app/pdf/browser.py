@@ -0,0 +1,168 @@
+"""Headless Chromium kept running between the PDFs rendered by a worker
+process.
+
+Launching Chromium dominates the time it takes to render a PDF, so the
+browser is launched once and every PDF is rendered in its own (isolated)
+browser context, which holds the storage state of the user requesting it.
+The browser is recycled after `max_jobs` PDFs (bounding the memory it
+leaks), or as soon as it crashes.
+
+The Playwright sync API isn't thread safe: a pool must only be used by the
+thread that created it. PDFs are rendered concurrently by a
+`BrowserThreadPool`, whose threads each keep their own browser.
+"""
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from playwright.sync_api import Browser
+from playwright.sync_api import Error as PlaywrightError
+from playwright.sync_api import Page, Playwright
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+from playwright.sync_api import sync_playwright
+
+from app.logs import logger
+
+CHROMIUM_ARGS = [
+    "--single-process",
+    "--no-zygote",
+    "--no-sandbox",
+    "--disable-setuid-sandbox",
+    "--disable-dev-shm-usage",
+]
+
+
+class BrowserPool:
+    """Long-lived headless Chromium, launched on first use"""
+
+    def __init__(self, max_jobs: int, args: List[str] = CHROMIUM_ARGS):
+        """Init pool (without launching the browser)"""
+        self.max_jobs = max_jobs
+        self.args = args
+        self.jobs = 0
+        self._playwright: Optional[Playwright] = None
+        self._browser: Optional[Browser] = None
+
+    def _get_browser(self) -> Browser:
+        """Returns the running browser, (re-)launching it if it crashed or
+        rendered its share of PDFs"""
+        if self._browser is not None and (
+            self.jobs >= self.max_jobs or not self._browser.is_connected()
+        ):
+            self.close_browser()
+        if self._browser is None:
+            if self._playwright is None:
+                self._playwright = sync_playwright().start()
+            logger.info("Launching headless browser")
+            self._browser = self._playwright.chromium.launch(
+                headless=True, args=self.args, devtools=False
+            )
+            self.jobs = 0
+        return self._browser
+
+    @contextmanager
+    def page(self, storage_state: Optional[dict] = None) -> Iterator[Page]:
+        """Opens a page in a new browser context (with the given storage
+        state), closed on exit"""
+        browser = self._get_browser()
+        self.jobs += 1
+        context = browser.new_context(storage_state=storage_state)
+        crashed = False
+        try:
+            yield context.new_page()
+        except PlaywrightTimeoutError:
+            raise
+        except PlaywrightError:
+            # eg: the page or the browser crashed
+            crashed = True
+            raise
+        finally:
+            try:
+                context.close()
+            except PlaywrightError:
+                crashed = True
+            if crashed:
+                self.close_browser()
+
+    def close_browser(self):
+        """Closes the browser (a new one is launched on next use)"""
+        if self._browser is None:
+            return
+        logger.info(f"Closing headless browser after {self.jobs} job(s)")
+        try:
+            self._browser.close()
+        except PlaywrightError:
+            logger.exception("Error closing the headless browser")
+        self._browser = None
+
+    def close(self):
+        """Closes the browser and stops Playwright"""
+        self.close_browser()
+        if self._playwright is not None:
+            self._playwright.stop()
+            self._playwright = None
+
+
+class BrowserThreadPool:
+    """Threads rendering PDFs concurrently, each keeping its own browser
+    (launched on first use)"""
+
+    def __init__(self, workers: int, max_jobs: int, args: List[str] = CHROMIUM_ARGS):
+        """Init pool (without starting the threads)"""
+        self.workers = max(workers, 1)
+        self.max_jobs = max_jobs
+        self.args = args
+        self._local = threading.local()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def browser(self) -> BrowserPool:
+        """Returns the browser of the calling thread"""
+        pool = getattr(self._local, "pool", None)
+        if pool is None:
+            pool = self._local.pool = BrowserPool(self.max_jobs, self.args)
+        return pool
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Returns the pool's threads, started on first use"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="pdf"
+            )
+        return self._executor
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Calls `fn` from one of the pool's threads"""
+        return self._get_executor().submit(fn, *args, **kwargs)
+
+    def map(self, fn: Callable, items: Iterable) -> list:
+        """Calls `fn` on each item from the pool's threads, and returns the
+        results"""
+        return list(self._get_executor().map(fn, items))
+
+    def _close_thread_browser(self, barrier: threading.Barrier):
+        """Closes the browser of the calling thread, once every thread of
+        the pool is closing its own"""
+        try:
+            barrier.wait(timeout=60)
+        except threading.BrokenBarrierError:
+            logger.warning("Closing the headless browsers: some threads are busy")
+        pool = getattr(self._local, "pool", None)
+        if pool is not None:
+            pool.close()
+            self._local.pool = None
+
+    def close(self):
+        """Closes the browsers (from the threads that launched them) and
+        stops the threads"""
+        if self._executor is not None:
+            # The barrier makes sure each thread runs exactly one of the jobs
+            barrier = threading.Barrier(self.workers)
+            for _ in range(self.workers):
+                self._executor.submit(self._close_thread_browser, barrier)
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        pool = getattr(self._local, "pool", None)
+        if pool is not None:
+            pool.close()
+            self._local.pool = None
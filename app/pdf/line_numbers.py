@@ -0,0 +1,427 @@
+"""Adds line numbers to (journal) PDFs.
+
+- the text lines of the pages are extracted by pdfplumber, by far the
+  slowest step, in a pool of processes each handling a range of pages. The
+  chars are read from the layout of the page, instead of `page.chars`, for
+  which pdfplumber resolves many attributes (colors, fonts) the lines don't
+  depend on
+- the numbers of each page are drawn by a content stream appended to the
+  page, and the updated pages are written as an incremental update of the
+  PDF: the original PDF is copied as is to the output file, followed by the
+  new and updated objects, so its content streams are never parsed, merged
+  or re-compressed, and the pages are written as soon as their lines are
+  extracted
+"""
+import os
+import shutil
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from multiprocessing import get_context
+from typing import BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+
+import pdfplumber
+from pdfminer.layout import LTChar, LTContainer
+from pdfplumber.page import Page
+from pdfplumber.utils import chars_to_textmap
+from pypdf import PageObject, PdfReader
+from pypdf.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+)
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from app.logs import logger
+
+# Line numbers are right aligned on `NUMBERS_X`
+NUMBERS_X = 30
+FONT = "Helvetica"
+FONT_SIZE = 7
+# Lines too close to the previous line aren't numbered: equations are often
+# rendered as multiple lines, which pdfplumber returns as multiple lines
+LINE_SPACING_THRESHOLD = 0.1
+# shift the line number up by a few pixels to adjust alignment
+OFFSET = 2
+# Number of pages extracted by each task of the process pool
+CHUNK_SIZE = 10
+
+
+def _layout_chars(container: LTContainer) -> Iterator[LTChar]:
+    for obj in container:
+        if isinstance(obj, LTChar):
+            yield obj
+        elif isinstance(obj, LTContainer):
+            yield from _layout_chars(obj)
+
+
+def _text_lines(page: Page) -> List[Dict]:
+    """Text lines of the page, as returned by `page.extract_text_lines()`"""
+    chars = []
+    for char in _layout_chars(page.layout):
+        top = page.height - char.y1
+        chars.append(
+            {
+                "text": char.get_text(),
+                "x0": char.x0,
+                "x1": char.x1,
+                "top": top,
+                "bottom": page.height - char.y0,
+                "doctop": page.initial_doctop + top,
+                "upright": char.upright,
+            }
+        )
+    textmap = chars_to_textmap(
+        chars,
+        x_shift=page.bbox[0],
+        y_shift=page.bbox[1],
+        layout_width=page.width,
+        layout_height=page.height,
+    )
+    return textmap.extract_text_lines(strip=True, return_chars=False)
+
+
+def _numbered_lines(
+    path: str, page_numbers: List[int], ignore_line_texts: Optional[Set[str]]
+) -> List[List[float]]:
+    """Returns, for each of the (1-based) pages, the y coordinates of the
+    lines to number"""
+    positions = []
+    with pdfplumber.open(path, pages=page_numbers) as pdf:
+        for page in pdf.pages:
+            page_positions = []
+            # reset previous line bottom on new page
+            prev_line_bottom = 0
+            for i, line in enumerate(_text_lines(page)):
+                if ignore_line_texts and line["text"] in ignore_line_texts:
+                    continue
+                line_spacing = line["top"] - prev_line_bottom
+                if line_spacing > LINE_SPACING_THRESHOLD:
+                    page_positions.append(page.height - line["bottom"] + OFFSET)
+                else:
+                    logger.info(
+                        f"Skipping line {i+1} on page {page.page_number}"
+                        f" because it is too close to the previous line"
+                        f" (line spacing: {line_spacing})"
+                    )
+                prev_line_bottom = line["bottom"]
+            positions.append(page_positions)
+            # release the parsed page
+            page.flush_cache()
+            page.get_textmap.cache_clear()
+    return positions
+
+
+def extract_numbered_lines(
+    path: str,
+    page_count: int,
+    ignore_line_texts: Optional[Set[str]] = None,
+    workers: Optional[int] = None,
+) -> Iterator[List[float]]:
+    """Yields, in order, the y coordinates of the lines to number of each
+    page, extracted by `workers` processes (one per CPU by default)"""
+    chunks = [
+        list(range(start + 1, min(start + CHUNK_SIZE, page_count) + 1))
+        for start in range(0, page_count, CHUNK_SIZE)
+    ]
+    workers = min(workers or os.cpu_count() or 1, len(chunks))
+    executor = None
+    if workers > 1:
+        try:
+            # The worker process may run threads (eg: boto3's), which aren't
+            # safe to fork
+            executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=get_context("spawn")
+            )
+        except (OSError, NotImplementedError):
+            # eg: AWS Lambda, which lacks the shared memory multiprocessing
+            # requires
+            logger.warning("Process pool unavailable, extracting lines serially")
+
+    if executor is None:
+        for chunk in chunks:
+            yield from _numbered_lines(path, chunk, ignore_line_texts)
+        return
+    with executor:
+        for positions in executor.map(
+            _numbered_lines, repeat(path), chunks, repeat(ignore_line_texts)
+        ):
+            yield from positions
+
+
+def _startxref(stream: BinaryIO) -> Tuple[int, bool]:
+    """Offset of the last cross-reference section of a PDF, and whether it's a
+    cross-reference stream (instead of a classic `xref` table)"""
+    stream.seek(0, os.SEEK_END)
+    stream.seek(max(0, stream.tell() - 1024))
+    tail = stream.read()
+    position = tail.rfind(b"startxref")
+    if position < 0:
+        raise ValueError("startxref not found")
+    offset = int(tail[position + len(b"startxref") :].split()[0])
+    stream.seek(offset)
+    return offset, not stream.read(32).lstrip().startswith(b"xref")
+
+
+def _subsections(numbers: List[int]) -> Iterator[List[int]]:
+    """Runs of consecutive object numbers of the (sorted) `numbers`"""
+    start = 0
+    for end in range(1, len(numbers) + 1):
+        if end < len(numbers) and numbers[end] == numbers[end - 1] + 1:
+            continue
+        yield numbers[start:end]
+        start = end
+
+
+def _inherited(page: DictionaryObject, key: str):
+    """(Unresolved) value of an inheritable attribute of a page, set on the
+    page or on the closest of its `/Pages` ancestors which has it"""
+    node: Optional[DictionaryObject] = page
+    while node is not None:
+        if key in node:
+            return node.raw_get(key)
+        node = node["/Parent"] if "/Parent" in node else None
+    return None
+
+
+class IncrementalUpdate:
+    """Objects appended to a PDF (after its original bytes), replacing the
+    objects of the PDF with the same numbers"""
+
+    def __init__(
+        self,
+        reader: PdfReader,
+        stream: BinaryIO,
+        prev: int,
+        xref_stream: bool = False,
+    ):
+        """Init update, written at the end of `stream` (a copy of the PDF
+        read by `reader`, whose last cross-reference section is at `prev`).
+        The cross-reference section of the update is a stream if the one at
+        `prev` is (a classic table can't precede a PDF 1.5 xref stream)"""
+        self.reader = reader
+        self.stream = stream
+        self.prev = prev
+        self.xref_stream = xref_stream
+        self.offsets: Dict[int, Tuple[int, int]] = {}
+        self.size = int(reader.trailer["/Size"])
+
+    def reference(self) -> IndirectObject:
+        """Reserves the number of a new object"""
+        self.size += 1
+        return IndirectObject(self.size - 1, 0, self.reader)
+
+    def _start(self, reference: IndirectObject):
+        if not self.offsets:
+            self.stream.write(b"\n")
+        self.offsets[reference.idnum] = (self.stream.tell(), reference.generation)
+        self.stream.write(f"{reference.idnum} {reference.generation} obj\n".encode())
+
+    def write(self, reference: IndirectObject, obj):
+        """Writes an (updated or new) object"""
+        self._start(reference)
+        obj.write_to_stream(self.stream)
+        self.stream.write(b"\nendobj\n")
+
+    def write_stream(self, reference: IndirectObject, data: bytes):
+        """Writes a new (compressed) stream"""
+        data = zlib.compress(data)
+        self._start(reference)
+        self.stream.write(
+            f"<< /Length {len(data)} /Filter /FlateDecode >>\nstream\n".encode()
+        )
+        self.stream.write(data)
+        self.stream.write(b"\nendstream\nendobj\n")
+
+    def _trailer(self) -> DictionaryObject:
+        trailer = DictionaryObject(
+            {
+                NameObject(key): self.reader.trailer.raw_get(key)
+                for key in ("/Root", "/Info", "/ID")
+                if key in self.reader.trailer
+            }
+        )
+        trailer[NameObject("/Prev")] = NumberObject(self.prev)
+        return trailer
+
+    def _write_xref_table(self):
+        # The head of the free objects list, as in the original PDF
+        self.stream.write(b"xref\n0 1\n0000000000 65535 f\r\n")
+        for numbers in _subsections(sorted(self.offsets)):
+            self.stream.write(f"{numbers[0]} {len(numbers)}\n".encode())
+            for number in numbers:
+                offset, generation = self.offsets[number]
+                self.stream.write(f"{offset:010} {generation:05} n\r\n".encode())
+
+        trailer = self._trailer()
+        trailer[NameObject("/Size")] = NumberObject(self.size)
+        self.stream.write(b"trailer\n")
+        trailer.write_to_stream(self.stream)
+        self.stream.write(b"\n")
+
+    def _write_xref_stream(self):
+        reference = self.reference()
+        self.offsets[reference.idnum] = (self.stream.tell(), reference.generation)
+        numbers = sorted(self.offsets)
+        offset_width = max(1, (self.stream.tell().bit_length() + 7) // 8)
+        data = zlib.compress(
+            b"".join(
+                b"\x01"
+                + self.offsets[number][0].to_bytes(offset_width, "big")
+                + self.offsets[number][1].to_bytes(2, "big")
+                for number in numbers
+            )
+        )
+
+        xref = self._trailer()
+        index = [(numbers[0], len(numbers)) for numbers in _subsections(numbers)]
+        xref.update(
+            {
+                NameObject("/Type"): NameObject("/XRef"),
+                NameObject("/Size"): NumberObject(self.size),
+                NameObject("/Index"): ArrayObject(
+                    NumberObject(value) for subsection in index for value in subsection
+                ),
+                NameObject("/W"): ArrayObject(
+                    NumberObject(width) for width in (1, offset_width, 2)
+                ),
+                NameObject("/Filter"): NameObject("/FlateDecode"),
+                NameObject("/Length"): NumberObject(len(data)),
+            }
+        )
+        self.stream.write(f"{reference.idnum} {reference.generation} obj\n".encode())
+        xref.write_to_stream(self.stream)
+        self.stream.write(b"\nstream\n")
+        self.stream.write(data)
+        self.stream.write(b"\nendstream\nendobj\n")
+
+    def close(self):
+        """Writes the cross-reference section and trailer of the update"""
+        if not self.offsets:
+            return
+        xref = self.stream.tell()
+        if self.xref_stream:
+            self._write_xref_stream()
+        else:
+            self._write_xref_table()
+        self.stream.write(f"startxref\n{xref}\n%%EOF\n".encode())
+
+
+class LineNumbering:
+    """Draws the line numbers on the pages of a PDF, written as an
+    incremental update"""
+
+    def __init__(self, update: IncrementalUpdate):
+        """Init numbering"""
+        self.update = update
+        self.font: Optional[IndirectObject] = None
+        self.save_state: Optional[IndirectObject] = None
+
+    def _font_name(self, page: PageObject) -> NameObject:
+        """Returns the name of the line numbers' font in the resources of the
+        page, adding it (and writing the updated resources) if required"""
+        if self.font is None:
+            self.font = self.update.reference()
+            self.update.write(
+                self.font,
+                DictionaryObject(
+                    {
+                        NameObject("/Type"): NameObject("/Font"),
+                        NameObject("/Subtype"): NameObject("/Type1"),
+                        NameObject("/BaseFont"): NameObject(f"/{FONT}"),
+                        NameObject("/Encoding"): NameObject("/WinAnsiEncoding"),
+                    }
+                ),
+            )
+
+        # The resources (and fonts) may be (shared) indirect objects, each
+        # updated only once. Direct dictionaries are copied: they may be
+        # inherited from (and shared with) an ancestor of the page
+        owner, owner_ref = page, None
+        resources = _inherited(page, "/Resources")
+        if isinstance(resources, IndirectObject):
+            owner, owner_ref = resources.get_object(), resources
+        else:
+            resources = DictionaryObject(resources or {})
+        page[NameObject("/Resources")] = resources
+        resources = resources.get_object()
+        fonts = resources.raw_get("/Font") if "/Font" in resources else None
+        if isinstance(fonts, IndirectObject):
+            owner, owner_ref = fonts.get_object(), fonts
+        else:
+            resources[NameObject("/Font")] = DictionaryObject(fonts or {})
+        fonts = resources["/Font"]
+
+        for name, font in fonts.items():
+            if font == self.font:
+                return name
+        name = NameObject("/LineNumbers")
+        while name in fonts:
+            name = NameObject(f"{name}_")
+        fonts[name] = self.font
+        if owner_ref is not None:
+            self.update.write(owner_ref, owner)
+        return name
+
+    def add(self, page: PageObject, positions: List[float], first_number: int):
+        """Numbers the lines at the `positions` (y coordinates) of the page,
+        starting from `first_number`"""
+        font_name = self._font_name(page)
+        numbers = [f"BT\n{font_name} {FONT_SIZE} Tf"]
+        for number, y in enumerate(positions, start=first_number):
+            x = NUMBERS_X - stringWidth(str(number), FONT, FONT_SIZE)
+            numbers.append(f"1 0 0 1 {x:.2f} {y:.2f} Tm ({number}) Tj")
+        numbers.append("ET")
+        numbers_ref = self.update.reference()
+        # The original content may not restore the graphics state it changes:
+        # it's saved before the content, and restored before the numbers
+        self.update.write_stream(numbers_ref, "\n".join(["Q", *numbers]).encode())
+        if self.save_state is None:
+            self.save_state = self.update.reference()
+            self.update.write_stream(self.save_state, b"q")
+
+        contents = page.raw_get("/Contents") if "/Contents" in page else None
+        if isinstance(contents, IndirectObject) and isinstance(
+            contents.get_object(), ArrayObject
+        ):
+            contents = contents.get_object()
+        if contents is None:
+            contents = []
+        elif not isinstance(contents, ArrayObject):
+            contents = [contents]
+        page[NameObject("/Contents")] = ArrayObject(
+            [self.save_state, *contents, numbers_ref]
+        )
+        self.update.write(page.indirect_reference, page)
+
+
+def add_line_numbers(
+    input_pdf_path: str,
+    output_pdf_path: str,
+    ignore_line_texts: Optional[Set[str]] = None,
+    workers: Optional[int] = None,
+):
+    """Add line numbers to Journal PDF"""
+    logger.info("Adding line numbers to PDF")
+    reader = PdfReader(input_pdf_path)
+    positions = extract_numbered_lines(
+        input_pdf_path, len(reader.pages), ignore_line_texts, workers
+    )
+
+    with open(input_pdf_path, "rb") as input_pdf, open(
+        output_pdf_path, "wb"
+    ) as output_pdf:
+        prev, xref_stream = _startxref(input_pdf)
+        input_pdf.seek(0)
+        shutil.copyfileobj(input_pdf, output_pdf)
+
+        update = IncrementalUpdate(reader, output_pdf, prev, xref_stream)
+        numbering = LineNumbering(update)
+        line_number = 1
+        for page, page_positions in zip(reader.pages, positions):
+            if page_positions:
+                numbering.add(page, page_positions, line_number)
+                line_number += len(page_positions)
+        update.close()
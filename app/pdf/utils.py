@@ -1,20 +1,38 @@
 """ Utility functions for generating PDFs through Playwright"""
 
+import atexit
+import datetime
 import json
 import pathlib
+import re
 import tempfile
+import threading
 import time
-from io import BytesIO
-
-import pdfplumber
-from playwright.sync_api import sync_playwright
-from pypdf import PdfReader, PdfWriter
-from reportlab.pdfgen import canvas
+from typing import Optional
 
 from app import config
 from app.api.utils import s3_client
+from app.crud.pdf_renders import crud_pdf_renders
+from app.db.db_session import DbSession
 from app.db.models import Atbds
 from app.logs import logger  # noqa
+from app.pdf.browser import BrowserThreadPool
+from app.pdf.line_numbers import add_line_numbers
+from app.schemas.pdf_renders import PdfRenderStatusEnum
+
+# Threads rendering the PDFs of the worker process, each keeping its browser
+render_threads = BrowserThreadPool(
+    workers=config.PDF_RENDER_CONCURRENCY, max_jobs=config.PDF_BROWSER_MAX_JOBS
+)
+atexit.register(render_threads.close)
+
+# Tokens of the service account, reused until they're about to expire
+_service_auth_lock = threading.Lock()
+_service_auth: dict = {}
+
+# Generated PDFs (and debug screenshots) are named after the content hash of
+# the version they're generated from (see `app.api.v2.pdf.generate_pdf_key`)
+HASHED_PDF_KEY = re.compile(r"-([0-9a-f]{32})\.(pdf|png)$")
 
 
 def save_pdf_to_s3(local_pdf_path: str, remote_pdf_path: str):
@@ -28,6 +46,37 @@ def save_pdf_to_s3(local_pdf_path: str, remote_pdf_path: str):
         )
     except Exception:
         logger.exception("PDF upload failed.")
+        raise
+
+
+def claim_render(render_id: int) -> bool:
+    """
+    Marks the PDF as rendering in the render manifest, unless it is already
+    rendered (or being rendered)
+    """
+    db = DbSession()
+    try:
+        return crud_pdf_renders.claim(
+            db,
+            render_id=render_id,
+            stale_before=datetime.datetime.utcnow()
+            - datetime.timedelta(seconds=config.PDF_RENDER_TIMEOUT),
+        )
+    finally:
+        db.close()
+
+
+def set_render_status(
+    render_id: int, status: PdfRenderStatusEnum, error: Optional[str] = None
+):
+    """
+    Updates the status of the PDF in the render manifest
+    """
+    db = DbSession()
+    try:
+        crud_pdf_renders.set_status(db, render_id=render_id, status=status, error=error)
+    finally:
+        db.close()
 
 
 def make_pdf(
@@ -38,9 +87,124 @@ def make_pdf(
     auth_data: dict,
     atbd_alias: str = None,
     journal: bool = False,
+    render_id: int = None,
+    service_account: bool = False,
+):
+    """
+    Generates a PDF for a given ATBD, and records its generation status in
+    the render manifest (if queued with a `render_id`). PDFs pre-rendered by
+    the worker are rendered as the `service_account`, instead of a user
+    """
+    if render_id is not None and not claim_render(render_id):
+        # eg: a duplicate task already rendered the PDF, or is rendering it
+        # (or the render was collected as superseded)
+        logger.info(f"PDF already rendered or rendering: {filepath}")
+        return
+    try:
+        if service_account:
+            auth_data = get_service_auth_data()
+        render_pdf(atbd_id, major, minor, filepath, auth_data, atbd_alias, journal)
+    except Exception as e:
+        if render_id is not None:
+            set_render_status(render_id, PdfRenderStatusEnum.FAILED, error=str(e))
+        raise
+    if render_id is not None:
+        set_render_status(render_id, PdfRenderStatusEnum.DONE)
+
+
+def get_service_auth_data() -> dict:
+    """
+    Signs in as the service account (whose credentials are stored in
+    SecretsManager) and returns its tokens. Returns no tokens if no service
+    account is set up: the PDFs are then rendered as an anonymous reader,
+    which can only access the published versions
+    """
+    if not config.PDF_SERVICE_CREDENTIALS_ARN:
+        return {}
+    with _service_auth_lock:
+        if _service_auth.get("expires_at", 0) > time.time() + 5 * 60:
+            return _service_auth["auth_data"]
+
+        credentials = json.loads(
+            config.secrets_manager.get_secret_value(
+                SecretId=config.PDF_SERVICE_CREDENTIALS_ARN
+            )["SecretString"]
+        )
+        response = config.cognito.initiate_auth(
+            ClientId=config.APP_CLIENT_ID,
+            AuthFlow="USER_PASSWORD_AUTH",
+            AuthParameters={
+                "USERNAME": credentials["username"],
+                "PASSWORD": credentials["password"],
+            },
+        )
+        if "AuthenticationResult" not in response:
+            # eg: MFA is enabled for the service account
+            raise Exception(
+                f"Unable to sign in as the service account: {response.get('ChallengeName')}"
+            )
+        result = response["AuthenticationResult"]
+        _service_auth["auth_data"] = {
+            "user_email": credentials["username"],
+            "access_token": result["AccessToken"],
+            "id_token": result["IdToken"],
+        }
+        _service_auth["expires_at"] = time.time() + result["ExpiresIn"]
+        return _service_auth["auth_data"]
+
+
+def collect_pdfs(atbd_id: int):
+    """
+    Deletes the PDFs (and debug screenshots) generated from content that the
+    versions of an ATBD no longer have, and their renders
+    """
+    client = s3_client()
+    # Listed before the content hashes are read: a PDF generated meanwhile is
+    # named after a hash that is read
+    keys = [
+        (item["Key"], match.group(1))
+        for page in client.get_paginator("list_objects_v2").paginate(
+            Bucket=config.S3_BUCKET, Prefix=f"{atbd_id}/pdf/"
+        )
+        for item in page.get("Contents", [])
+        for match in [HASHED_PDF_KEY.search(item["Key"])]
+        if match
+    ]
+
+    db = DbSession()
+    try:
+        content_hashes = crud_pdf_renders.delete_superseded(db, atbd_id=atbd_id)
+    finally:
+        db.close()
+
+    superseded = [
+        key for key, content_hash in keys if content_hash not in content_hashes
+    ]
+    # S3 deletes up to 1000 objects per request
+    for start in range(0, len(superseded), 1000):
+        response = client.delete_objects(
+            Bucket=config.S3_BUCKET,
+            Delete={
+                "Objects": [{"Key": key} for key in superseded[start : start + 1000]],
+                "Quiet": True,
+            },
+        )
+        for error in response.get("Errors", []):
+            logger.error(f"Unable to delete PDF: {error}")
+    logger.info(f"Deleted {len(superseded)} superseded PDF(s) of ATBD {atbd_id}")
+
+
+def render_pdf(
+    atbd_id: int,
+    major: str,
+    minor: str,
+    filepath: str,
+    auth_data: dict,
+    atbd_alias: str = None,
+    journal: bool = False,
 ):
     """
-    Generates a PDF for a given ATBD using Playwright
+    Generates a PDF for a given ATBD using Playwright, and uploads it to S3
     """
     logger.info("Generating PDF")
 
@@ -58,51 +222,41 @@ def make_pdf(
         </span>
     """
 
+    # set up the browser context with the localStorage state
+    storage_state = None
+    if auth_data:
+        storage_state = build_storage_state(
+            auth_data["user_email"],
+            auth_data["access_token"],
+            auth_data["id_token"],
+        )
+
     # create a temp directory to store the PDF and related files
     with tempfile.TemporaryDirectory() as tmp_dir:
         local_path = pathlib.Path(tmp_dir, filepath)
-        with sync_playwright() as p:
-            # launch a headless browser
-            browser = p.chromium.launch(
-                headless=True,
-                args=[
-                    "--single-process",
-                    "--no-zygote",
-                    "--no-sandbox",
-                    "--disable-setuid-sandbox",
-                    "--disable-dev-shm-usage",
-                ],
-                devtools=False,
-            )
-            # set up the browser context with the localStorage state
-            if auth_data:
-                storage_state = build_storage_state(
-                    tmp_dir,
-                    auth_data["user_email"],
-                    auth_data["access_token"],
-                    auth_data["id_token"],
-                )
-                context = browser.new_context(storage_state=storage_state)
-            else:
-                context = browser.new_context()
-            page = context.new_page()
+        with render_threads.browser().page(storage_state=storage_state) as page:
             page.goto(atbd_link)
-            # wait for a specific marker element to be rendered before generating the PDF
-            time.sleep(5)
-
-            # if debugging is enabled, save a screenshot of the page to S3
-            if config.FEATURE_FLAGS.get("PDF_EXPORT_DEBUG"):
-                logger.info(f"Page URL: {atbd_link}")
-                screenshot_filepath = filepath.replace(".pdf", ".png")
-                local_screenshot_path = pathlib.Path(tmp_dir, screenshot_filepath)
-                page.screenshot(path=local_screenshot_path)
-                save_pdf_to_s3(str(local_screenshot_path), screenshot_filepath)
-                logger.info(
-                    f"Screenshot generated at path: {local_screenshot_path} and saved "
-                    f"to S3 at path: {screenshot_filepath}"
+            try:
+                # wait for a specific marker element to be rendered before
+                # generating the PDF
+                page.wait_for_selector(
+                    "#pdf-preview-ready",
+                    state="attached",
+                    timeout=config.PDF_READY_TIMEOUT * 1000,
                 )
+            finally:
+                # if debugging is enabled, save a screenshot of the page to S3
+                if config.FEATURE_FLAGS.get("PDF_EXPORT_DEBUG"):
+                    logger.info(f"Page URL: {atbd_link}")
+                    screenshot_filepath = filepath.replace(".pdf", ".png")
+                    local_screenshot_path = pathlib.Path(tmp_dir, screenshot_filepath)
+                    page.screenshot(path=local_screenshot_path)
+                    save_pdf_to_s3(str(local_screenshot_path), screenshot_filepath)
+                    logger.info(
+                        f"Screenshot generated at path: {local_screenshot_path} and saved "
+                        f"to S3 at path: {screenshot_filepath}"
+                    )
 
-            page.wait_for_selector("#pdf-preview-ready", state="attached")
             if journal:
                 page.pdf(
                     path=local_path,
@@ -114,7 +268,6 @@ def make_pdf(
                 )
             else:
                 page.pdf(path=local_path, format="A4")
-            browser.close()
 
         logger.info(f"PDF generated at path: {local_path}")
         if journal:
@@ -129,19 +282,14 @@ def make_pdf(
             save_pdf_to_s3(str(local_path), filepath)
 
 
-def build_storage_state(
-    tmp_dir: str, user_email: str, access_token: str, id_token: str
-):
+def build_storage_state(user_email: str, access_token: str, id_token: str) -> dict:
     """Set up localStorage state for Playwright
 
     We store the user's access token and id token in localStorage so that
     the PDF preview page can make authenticated requests to the API.
     """
-    # create a temp file with the localStorage state
-    temp_file = pathlib.Path(tmp_dir, "storage_state.json")
-    temp_file.touch()
-
-    state = {
+    return {
+        "cookies": [],
         "origins": [
             {
                 "origin": f"{config.PDF_PREVIEW_HOST}",
@@ -160,75 +308,5 @@ def build_storage_state(
                     },
                 ],
             }
-        ]
+        ],
     }
-    with open(temp_file, "w") as f:
-        json.dump(state, f)
-    return temp_file
-
-
-def add_line_numbers(input_pdf_path: str, output_pdf_path: str, ignore_line_texts=None):
-    """Add line numbers to Journal PDF"""
-    logger.info("Adding line numbers to PDF")
-
-    # Load the PDF into PyPDF2 and pdfplumber
-    input_pdf = PdfReader(open(input_pdf_path, "rb"))
-    plumber_pdf = pdfplumber.open(input_pdf_path)
-    line_number = 1
-    line_spacing_threshold = 0.1
-    # shift the line number up by a few pixels to adjust alignment
-    offset = 2
-
-    for page_index, page in enumerate(input_pdf.pages):
-        print(f"Processing page {page_index + 1}")
-        plumber_page = plumber_pdf.pages[page_index]
-        lines = plumber_page.extract_text_lines()
-        page_height = plumber_page.height
-        packet = BytesIO()
-        # Create a new PDF with Reportlab
-        can = canvas.Canvas(
-            packet, pagesize=(page.mediabox.width, page.mediabox.height)
-        )
-
-        # reset previous line bottom on new page
-        prev_line_bottom = 0
-
-        for i, line in enumerate(lines):
-            if ignore_line_texts and line["text"] in ignore_line_texts:
-                continue
-            # Coordinates where to write, you can adjust as per your needs
-            x = 30
-            y = page_height - line["bottom"] + offset
-            # If the line is too close to the previous line, skip it
-            # This is mostly useful for equations, which are often rendered
-            # as multiple lines and pdfplumber gets confused by them and
-            # returns multiple lines for a single equation
-            line_spacing = line["top"] - prev_line_bottom
-            if line_spacing > line_spacing_threshold:
-                can.setFont("Helvetica", 7)
-                can.drawRightString(x, y, f"{line_number}")
-                line_number += 1
-            else:
-                logger.info(
-                    f"Skipping line {i+1} on page {page_index + 1}"
-                    f" because it is too close to the previous line"
-                    f" (line spacing: {line_spacing})"
-                )
-            prev_line_bottom = line["bottom"]
-        can.save()
-
-        # Move to the beginning of the BytesIO buffer
-        packet.seek(0)
-        new_pdf = PdfReader(packet)
-        if new_pdf.pages:  # Sometimes the last page is blank; skip it
-            page.merge_page(new_pdf.pages[0])
-
-    # Finally, save the resulting PDF to disk
-    output = PdfWriter()
-    output.append(input_pdf)
-    for page in output.pages:
-        # cpu intensive; but reduces file size quite a bit
-        page.compress_content_streams()
-    output_stream = open(output_pdf_path, "wb")
-    output.write(output_stream)
-    output_stream.close()
@@ -1,8 +1,12 @@
 """Functionality related to permissions model"""
 
-from typing import List, Tuple
+from typing import Any, List, Set, Tuple, Union
 
-from app.db.models import Atbds
+from sqlalchemy import and_, case, false, func, literal, or_, true
+from sqlalchemy.dialects import postgresql
+
+from app.acls import COMPILED_ATBD_VERSION_ACLS
+from app.db.models import Atbds, AtbdVersions
 
 import fastapi_permissions
 from fastapi import HTTPException
@@ -23,7 +27,7 @@ def filter_atbd_versions(
         if check_permissions(
             principals=principals,
             action="view",
-            acl=version.__acl__(),
+            acl=version,
             raise_exception=False,
         )
     ]
@@ -37,6 +41,80 @@ def filter_atbd_versions(
     return atbd
 
 
+def _statuses_clause(statuses: Set[Any]):
+    """SQL equivalent of a set of statuses (including `OTHER_STATUS`)"""
+    acl = COMPILED_ATBD_VERSION_ACLS
+    if acl.OTHER_STATUS in statuses:
+        # Any status, except for the ones explicitly not allowed
+        denied = acl.statuses - statuses
+        return ~AtbdVersions.status.in_(denied) if denied else true()
+    if statuses:
+        return AtbdVersions.status.in_(statuses)
+    return false()
+
+
+def _allowed_states_clause(states: Set[Tuple[Any, bool]]):
+    """SQL equivalent of a set of (status, locked) combinations"""
+    locked = {status for status, _locked in states if _locked}
+    unlocked = {status for status, _locked in states if not _locked}
+    if locked == unlocked:
+        return _statuses_clause(locked)
+    return or_(
+        and_(AtbdVersions.locked_by.isnot(None), _statuses_clause(locked)),
+        and_(AtbdVersions.locked_by.is_(None), _statuses_clause(unlocked)),
+    )
+
+
+def _grantee_clause(grantee: str, subs: List[str]):
+    """SQL predicate matching the versions for which one of the subs is part
+    of a contributor grantee (owner, authors, etc)"""
+    if grantee == "lock_owner":
+        return AtbdVersions.locked_by.in_(subs)
+    if grantee == "owner":
+        return AtbdVersions.owner.in_(subs)
+    if grantee == "authors":
+        return or_(*[AtbdVersions.authors.any(sub) for sub in subs])
+    if grantee == "reviewers":
+        return or_(
+            *[
+                func.to_jsonb(AtbdVersions.reviewers).op("@>")(
+                    literal([{"sub": sub}], type_=postgresql.JSONB)
+                )
+                for sub in subs
+            ]
+        )
+    raise ValueError(f"Unknown contributor grantee: {grantee}")
+
+
+def atbd_versions_filter(principals: List[str], action: str = "view"):
+    """
+    Translates the ATBD version ACL into an SQL predicate on the
+    `atbd_versions` table, matching only the versions for which the
+    principals are allowed to perform the action. Equivalent to
+    filtering the versions with `check_permissions`, but lets the
+    database discard the versions the user does not have access to.
+    """
+    subs = [p[len("user:") :] for p in principals if p.startswith("user:")]
+    whens = []
+    default = false()
+    for grantee, states in COMPILED_ATBD_VERSION_ACLS.grantee_rules(action):
+        if grantee in COMPILED_ATBD_VERSION_ACLS.CONTRIBUTOR_GRANTEES:
+            if subs:
+                whens.append(
+                    (_grantee_clause(grantee, subs), _allowed_states_clause(states))
+                )
+            continue
+        if grantee in principals:
+            # The first matching grantee decides: grantees with lower
+            # precedence can never match
+            default = _allowed_states_clause(states)
+            break
+
+    if not whens:
+        return default
+    return case(whens, else_=default)
+
+
 def check_atbd_permissions(
     principals: List[str],
     action: str,
@@ -80,7 +158,7 @@ def check_atbd_permissions(
         check_permissions(
             principals=principals,
             action=action,
-            acl=version.__acl__(),
+            acl=version,
             raise_exception=False,
         )
         for version in atbd.versions
@@ -97,15 +175,27 @@ def check_atbd_permissions(
     return True
 
 
+def has_permission(
+    principals: List[str], action: str, acl: Union[List[Tuple], AtbdVersions]
+) -> bool:
+    """Returns wether or not the principals are allowed to perform the action.
+    AtbdVersions are checked against the pre-compiled ATBD version ACL, instead
+    of expanding and scanning the version's full ACL"""
+    if isinstance(acl, AtbdVersions):
+        return COMPILED_ATBD_VERSION_ACLS.has_permission(principals, action, acl)
+    return fastapi_permissions.has_permission(principals, action, acl)
+
+
 def check_permissions(
     principals: List[str],
     action: str,
-    acl: List[Tuple],
+    acl: Union[List[Tuple], AtbdVersions],
     raise_exception=True,
 ) -> bool:
     """Applies permission check for the requested action. Can be configured to either
-    raise an exception or return a boolean"""
-    if not fastapi_permissions.has_permission(principals, action, acl):
+    raise an exception or return a boolean. `acl` is either a list of ACL tuples or
+    an AtbdVersion (which is checked using the compiled ATBD version ACL)"""
+    if not has_permission(principals, action, acl):
         # don't raise an exception, return bool
         if not raise_exception:
             return False
@@ -3,9 +3,10 @@
 from __future__ import annotations
 
 from enum import Enum, unique
-from typing import Dict, List, Literal, Optional, Union
+from typing import Any, Dict, List, Literal, Optional, Union
 
 from pydantic import AnyUrl, BaseModel, validator
+from pydantic.utils import GetterDict
 
 
 @unique
@@ -288,6 +289,21 @@ class DocumentSummary(BaseModel):
     version_description: Optional[SectionWrapper]
 
 
+class DocumentSummaryGetterDict(GetterDict):
+    """Reads the `document` of the summary outputs from the version's
+    `document_summary`, when the version was loaded with only the sections
+    included in the `DocumentSummary` (see `CRUDAtbds`), rather than from the
+    (unloaded) full document"""
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """Get attribute"""
+        if key == "document":
+            summary = getattr(self._obj, "__dict__", {}).get("document_summary")
+            if summary is not None:
+                return summary
+        return super().get(key, default)
+
+
 class Document(DocumentSummary):
     """Top level `document` node"""
 
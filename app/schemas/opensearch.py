@@ -1,13 +1,12 @@
 """Pydantic Models for data that get's indexed and searched in OpenSearch"""
-import re
-from typing import Any, List, Optional
+from enum import Enum
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel, validator
 
-from app.schemas import document as _document
-from app.schemas.document import Document
 from app.schemas.versions import Keyword
 from app.schemas.versions_contacts import ContactsLinkOutput
+from app.search.text import extract_document_text
 
 
 class OpensearchAtbdVersion(BaseModel):
@@ -18,7 +17,7 @@ class OpensearchAtbdVersion(BaseModel):
     version: Optional[str]
     citation: Optional[dict]
     keywords: Optional[List[Keyword]] = []
-    document: Optional[Document]
+    document: Optional[dict]
     doi: Optional[str]
     contacts_link: Optional[List[ContactsLinkOutput]]
 
@@ -32,66 +31,90 @@ class OpensearchAtbdVersion(BaseModel):
     def _generate_semver(cls, v, values) -> str:
         return f"v{values['major']}.{values['minor']}"
 
-    @validator("document")
-    def _cleanup_document(cls, v: _document.Document) -> dict:
-        def _clean(d: Any) -> Any:
-            if not d:
-                return
-            if isinstance(d, _document.PublicationReference):
-                return d.dict(exclude_none=True, exclude_unset=True)
-            if isinstance(d, str):
+    @validator("document", pre=True)
+    def _cleanup_document(cls, v: Optional[dict]) -> Optional[dict]:
+        if not v:
+            return None
+        return extract_document_text(v)
 
-                return " ".join(re.findall(r"\w+", d))
 
-            if isinstance(d, list):
-                return [_clean(_d) for _d in d]
+class OpensearchAtbd(BaseModel):
+    """Opensearch document representing an ATBD"""
 
-            if isinstance(d, _document.AlgorithmVariable):
-                return [_clean(d.name), _clean(d.unit)]
+    id: str
+    title: str
+    alias: Optional[str]
+    version: OpensearchAtbdVersion
 
-            if isinstance(d, _document.DataAccessUrl):
-                return [_clean(d.url), _clean(d.description)]
+    class Config:
+        """Config."""
+
+        title = "OpensearchAtbdVersion"
+        orm_mode = True
 
-            if isinstance(d, _document.TextLeaf):
-                return _clean(d.text)
 
-            # Skipping equation indexing because those
-            # are all latex code
-            if isinstance(d, _document.EquationNode):
-                return
+class SearchSortEnum(str, Enum):
+    """Orders in which the search results can be sorted"""
 
-            if isinstance(d, _document.EquationInlineNode):
-                return
+    relevance = "relevance"
+    title = "title"
+    version = "version"
 
-            if any(
-                isinstance(d, i)
-                for i in (
-                    _document.SectionWrapper,
-                    _document.DivWrapperNode,
-                    _document.BaseNode,
-                )
-            ):
-                return _clean(d.children)
 
-            raise Exception("Unhandled Node! ", d)
+class SearchOrderEnum(str, Enum):
+    """Sort direction of the search results"""
 
-        return {
-            field: _clean(getattr(v, field))
-            for field in v.__fields__
-            if field not in ["version_description"]
-        }
+    asc = "asc"
+    desc = "desc"
 
 
-class OpensearchAtbd(BaseModel):
-    """Opensearch document representing an ATBD"""
+class SearchQuery(BaseModel):
+    """Search query. All the provided criteria must match."""
+
+    # Free text, matched against the title, document, citation and contacts
+    text: Optional[str]
+    # Labels of the keywords the ATBD versions must all have
+    keywords: List[str] = []
+    # eg: `v1.2`
+    version: Optional[str]
+    sort: SearchSortEnum = SearchSortEnum.relevance
+    order: SearchOrderEnum = SearchOrderEnum.desc
+    limit: int = 20
+    # `next_cursor` of the previous page of results
+    search_after: Optional[str]
+
+    @validator("text", "version")
+    def _strip(cls, v):
+        return (v or "").strip() or None
+
+    @validator("keywords")
+    def _normalize_keywords(cls, v):
+        return sorted({k.strip() for k in v if k.strip()})
+
+    @validator("limit")
+    def _validate_limit(cls, v):
+        if not 1 <= v <= 100:
+            raise ValueError("limit must be between 1 and 100")
+        return v
+
+
+class SearchHit(BaseModel):
+    """Summary of an indexed ATBD version matching the search query"""
 
     id: str
     title: str
     alias: Optional[str]
-    version: OpensearchAtbdVersion
+    version: dict
+    score: Optional[float]
+    # Highlighted fragments of the fields that matched the text, by field
+    highlight: Dict[str, List[str]] = {}
 
-    class Config:
-        """Config."""
 
-        title = "OpensearchAtbdVersion"
-        orm_mode = True
+class SearchOutput(BaseModel):
+    """A page of search results"""
+
+    total: int
+    hits: List[SearchHit]
+    # To be passed as `search_after` to get the next page (absent on the
+    # last page)
+    next_cursor: Optional[str]
@@ -0,0 +1,49 @@
+"""Schemas for the PDF render manifest"""
+import enum
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class PdfRenderStatusEnum(str, enum.Enum):
+    """Generation status of a PDF"""
+
+    QUEUED = "QUEUED"
+    RENDERING = "RENDERING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+
+
+class Create(BaseModel):
+    """PDF render to queue"""
+
+    atbd_id: int
+    major: int
+    minor: int
+    journal: bool
+    content_hash: str
+    s3_key: str
+
+
+class Update(BaseModel):
+    """PDF render status update"""
+
+    status: PdfRenderStatusEnum
+    error: Optional[str]
+
+
+class FullOutput(Create):
+    """PDF render"""
+
+    id: int
+    status: PdfRenderStatusEnum
+    error: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        """Config."""
+
+        title = "PdfRender"
+        orm_mode = True
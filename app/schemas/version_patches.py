@@ -0,0 +1,56 @@
+"""Pydantic models of the section-level updates (patches) of AtbdVersions"""
+import enum
+from datetime import datetime
+from typing import Any, List, Optional
+
+from pydantic import BaseModel, validator
+
+from app.schemas import document as _document
+
+
+class SectionOperationEnum(str, enum.Enum):
+    """Operations that can be applied to a section of the document"""
+
+    SET = "set"
+    REMOVE = "remove"
+
+
+class SectionOperation(BaseModel):
+    """Operation on a single (top level) section of an ATBD Version's
+    document"""
+
+    op: SectionOperationEnum
+    section: str
+    value: Optional[Any]
+
+    @validator("section")
+    def _known_section(cls, section):
+        if section not in _document.Document.__fields__:
+            raise ValueError(f"Unknown document section: {section}")
+        return section
+
+    @validator("value", always=True)
+    def _validate_section_value(cls, value, values):
+        # The value must be valid for the section it's set to
+        if values.get("op") == SectionOperationEnum.SET and values.get("section"):
+            section = values["section"]
+            return getattr(_document.Document(**{section: value}), section)
+        return value
+
+
+class Patch(BaseModel):
+    """Section-level update of an ATBD Version's document (eg: an autosave
+    from the editor). The operations are applied in order."""
+
+    operations: List[SectionOperation] = []
+    sections_completed: Optional[dict]
+
+
+class PatchOutput(BaseModel):
+    """Output of a section-level update: only the updated sections, and the
+    ETag of the updated version"""
+
+    document: dict
+    sections_completed: Optional[dict]
+    last_updated_at: datetime
+    etag: str
@@ -7,6 +7,7 @@ from datetime import datetime
 from typing import Any, Dict, List, Optional, Union
 
 from pydantic import BaseModel, validator
+from pydantic.utils import GetterDict
 
 # import document as _document to avoid namespace collision with the
 # `document` field of the AtbdVersion's SummaryOutput and FullOutput classes
@@ -18,6 +19,12 @@ from app.schemas.users import (
     CognitoUser,
     ReviewerUser,
 )
+from app.schemas.version_patches import (  # noqa: F401
+    Patch,
+    PatchOutput,
+    SectionOperation,
+    SectionOperationEnum,
+)
 
 
 class JournalStatusEnum(str, enum.Enum):
@@ -144,6 +151,7 @@ class AtbdVersionSummaryOutput(BaseModel):
 
         title = "AtbdVersion"
         orm_mode = True
+        getter_dict = _document.DocumentSummaryGetterDict
 
 
 class FullOutput(AtbdVersionSummaryOutput):
@@ -156,6 +164,11 @@ class FullOutput(AtbdVersionSummaryOutput):
     contacts_link: Optional[List[versions_contacts.ContactsLinkOutput]]
     publication_units: Optional[PublicationUnits]
 
+    class Config:
+        """Config (the full document is never read from the summary)"""
+
+        getter_dict = GetterDict
+
     @validator("publication_units", always=True)
     def _generate_publication_units(cls, v, values: Dict[str, Any]) -> PublicationUnits:
         if not values.get("document"):
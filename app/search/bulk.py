@@ -0,0 +1,70 @@
+"""Bulk requests to the search index, shared by the rebuild (and reconcile) of
+the index and the search outbox"""
+import time
+from typing import Iterator, List, Optional, Tuple
+
+from opensearchpy import OpenSearch
+
+from app.logs import logger
+
+# Limits of a single bulk request
+BULK_MAX_ACTIONS = 500
+BULK_MAX_BYTES = 10 * 1024 * 1024
+# Retries of the items of a bulk request that failed with a transient error
+BULK_MAX_RETRIES = 3
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# (action, document) lines of a bulk request (delete actions have no document)
+BulkItem = Tuple[str, Optional[str]]
+
+
+def chunk_bulk_items(items: Iterator[BulkItem]) -> Iterator[List[BulkItem]]:
+    """Groups the items into chunks of at most `BULK_MAX_ACTIONS` items and
+    (roughly) `BULK_MAX_BYTES` bytes"""
+    chunk: List[BulkItem] = []
+    size = 0
+    for item in items:
+        item_size = len(item[0]) + len(item[1] or "") + 2
+        if chunk and (
+            len(chunk) >= BULK_MAX_ACTIONS or size + item_size > BULK_MAX_BYTES
+        ):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(item)
+        size += item_size
+    if chunk:
+        yield chunk
+
+
+def send_bulk_chunk(client: OpenSearch, index: str, chunk: List[BulkItem]) -> int:
+    """Sends a bulk request, retrying (with a backoff) the items that failed
+    with a transient error. Returns the number of items that failed. Deleting
+    a document that isn't indexed isn't a failure."""
+    failed = 0
+    for attempt in range(BULK_MAX_RETRIES + 1):
+        body = "".join(
+            f"{action}\n" if document is None else f"{action}\n{document}\n"
+            for action, document in chunk
+        )
+        response = client.bulk(body=body, index=index)
+        if not response["errors"]:
+            return failed
+
+        retry = []
+        for item, result in zip(chunk, response["items"]):
+            [(operation, result)] = result.items()
+            status = result["status"]
+            if status < 300 or (operation == "delete" and status == 404):
+                continue
+            if status in RETRY_STATUSES:
+                retry.append(item)
+            else:
+                failed += 1
+                logger.error("Unable to %s %s: %s", operation, item[0], result)
+        if not retry:
+            return failed
+        if attempt < BULK_MAX_RETRIES:
+            time.sleep(2**attempt)
+        chunk = retry
+    logger.error("Unable to send %s items after retrying", len(chunk))
+    return failed + len(chunk)
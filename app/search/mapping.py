@@ -0,0 +1,143 @@
+"""Explicit mapping and settings of the ATBD index.
+
+Without a mapping, every string of the (large) indexed documents is mapped
+dynamically as both `text` and `keyword`, which inflates the index and slows
+down the queries. Instead:
+
+- the document sections (and other free text) are analyzed `text`, without
+  `keyword` subfields
+- identifiers (keywords, DOIs, alias, version) are `keyword` fields
+- fields that aren't mapped are kept in the `_source`, but not indexed
+
+`ATBD_MAPPING_VERSION` must be bumped whenever the mapping changes: the
+version is recorded in the `_meta` of the index, and existing indices must
+be rebuilt (see `app.search.reindex`) to use the new mapping.
+"""
+from typing import Any, Dict
+
+from app.schemas.document import Document, PublicationReference
+from app.schemas.versions_contacts import ContactsBase
+
+ATBD_MAPPING_VERSION = 1
+
+TEXT_ANALYZER = "atbd_text"
+
+TEXT: Dict[str, Any] = {"type": "text", "analyzer": TEXT_ANALYZER}
+KEYWORD: Dict[str, Any] = {"type": "keyword"}
+
+# Document sections that aren't indexed (see `OpensearchAtbdVersion`)
+SKIPPED_SECTIONS = ("version_description",)
+
+# Fields that are searchable, but not returned with the search results
+SOURCE_EXCLUDES = ["version.contacts_link.contact.mechanisms"]
+
+ANALYSIS = {
+    "filter": {
+        "atbd_stemmer": {"type": "stemmer", "language": "light_english"},
+    },
+    "analyzer": {
+        TEXT_ANALYZER: {
+            "type": "custom",
+            "tokenizer": "standard",
+            "filter": ["lowercase", "asciifolding", "atbd_stemmer"],
+        },
+    },
+}
+
+
+def _document_properties() -> Dict[str, Any]:
+    properties: Dict[str, Any] = {
+        section: TEXT
+        for section in Document.__fields__
+        if section not in SKIPPED_SECTIONS
+    }
+    properties["publication_references"] = {
+        "properties": {
+            **{field: TEXT for field in PublicationReference.__fields__},
+            "id": KEYWORD,
+            "doi": KEYWORD,
+            "isbn": KEYWORD,
+            "year": KEYWORD,
+            "online_resource": KEYWORD,
+        }
+    }
+    return properties
+
+
+def atbd_mappings() -> Dict[str, Any]:
+    """Mapping of the `OpensearchAtbd` documents"""
+    return {
+        "dynamic": False,
+        "_meta": {"mapping_version": ATBD_MAPPING_VERSION},
+        "_source": {"excludes": SOURCE_EXCLUDES},
+        # Strings of the objects that are dynamically mapped (the citation)
+        "dynamic_templates": [
+            {"strings": {"match_mapping_type": "string", "mapping": TEXT}}
+        ],
+        "properties": {
+            "id": KEYWORD,
+            # Titles are also sorted on
+            "title": {**TEXT, "fields": {"raw": KEYWORD}},
+            "alias": KEYWORD,
+            "version": {
+                "properties": {
+                    "major": {"type": "integer"},
+                    "minor": {"type": "integer"},
+                    "version": KEYWORD,
+                    "doi": KEYWORD,
+                    "citation": {"type": "object", "dynamic": True},
+                    "keywords": {
+                        "properties": {
+                            "id": {"type": "integer"},
+                            "label": KEYWORD,
+                            "path": KEYWORD,
+                            "value": KEYWORD,
+                        }
+                    },
+                    "document": {"properties": _document_properties()},
+                    "contacts_link": {
+                        "properties": {
+                            "roles": KEYWORD,
+                            "affiliations": TEXT,
+                            "contact": {
+                                "properties": {
+                                    **{
+                                        field: TEXT for field in ContactsBase.__fields__
+                                    },
+                                    "id": {"type": "integer"},
+                                    "uuid": KEYWORD,
+                                    "url": KEYWORD,
+                                    "mechanisms": {
+                                        "properties": {
+                                            "mechanism_type": KEYWORD,
+                                            "mechanism_value": KEYWORD,
+                                        }
+                                    },
+                                }
+                            },
+                        }
+                    },
+                }
+            },
+        },
+    }
+
+
+def atbd_index_body(
+    shards: int, replicas: int, refresh_interval: str, aliases: Dict = None
+) -> Dict[str, Any]:
+    """Body of the request creating an ATBD index"""
+    body = {
+        "settings": {
+            "index": {
+                "number_of_shards": shards,
+                "number_of_replicas": replicas,
+                "refresh_interval": refresh_interval,
+            },
+            "analysis": ANALYSIS,
+        },
+        "mappings": atbd_mappings(),
+    }
+    if aliases:
+        body["aliases"] = aliases
+    return body
@@ -1,192 +1,182 @@
 """Provide functionality for indexing and searching documents in OpenSearch"""
+import asyncio
 import datetime
-import json
 import os
-from typing import Any, Dict, List
+import threading
+from typing import Any, Dict
 
 import boto3
-from opensearchpy import OpenSearch, RequestsHttpConnection
-from opensearchpy.exceptions import NotFoundError
-from requests_aws4auth import AWS4Auth
-from sqlalchemy import orm
-
-from app.config import OPENSEARCH_PORT, OPENSEARCH_URL
-from app.db.db_session import DbSession
-from app.db.models import Atbds, AtbdVersions
+from opensearchpy import (
+    AIOHttpConnection,
+    AsyncOpenSearch,
+    AWSV4SignerAsyncAuth,
+    AWSV4SignerAuth,
+    OpenSearch,
+    RequestsHttpConnection,
+)
+
+from app.config import (
+    OPENSEARCH_MAX_RETRIES,
+    OPENSEARCH_POOL_MAXSIZE,
+    OPENSEARCH_PORT,
+    OPENSEARCH_REFRESH_INTERVAL,
+    OPENSEARCH_REPLICAS,
+    OPENSEARCH_SHARDS,
+    OPENSEARCH_TIMEOUT,
+    OPENSEARCH_URL,
+)
 from app.logs import logger
-from app.schemas.opensearch import OpensearchAtbd
+from app.search.mapping import ATBD_MAPPING_VERSION, atbd_index_body
 from app.utils import run_once
 
-from fastapi import HTTPException
-
 logger.info("OPENSEARCH_URL %s", OPENSEARCH_URL)
 
 REGION = os.getenv("AWS_REGION", "us-west-2")
 
 
-@run_once
-def create_search_indices(opensearch_client):
-    """
-    Create atbd index if it doesn't exists
-    """
-    if not opensearch_client.indices.exists("atbd"):
-        logger.info("Creating index: atbd")
-        opensearch_client.indices.create("atbd")
+# Alias of the index holding the ATBDs. The index itself is timestamped, so
+# that it can be rebuilt from scratch without downtime (see `app.search.reindex`)
+ATBD_INDEX = "atbd"
 
 
-def get_opensearch_client():
-    """
-    Outputs an Opensearch service client. Low level client authorizes against the boto3 session and associated AWS credentials
-    host is hardcoded as to reference the container within the same network
-    """
-    logger.info("Getting AWS Auth Credentials")
-    credentials = boto3.Session(region_name=REGION).get_credentials()
-    service = "es"
-    awsauth = AWS4Auth(
-        credentials.access_key,
-        credentials.secret_key,
-        REGION,
-        service,
-        session_token=credentials.token,
+def new_atbd_index_name() -> str:
+    """Returns the name of a new (timestamped) index for the ATBDs"""
+    return (
+        f"{ATBD_INDEX}-v{ATBD_MAPPING_VERSION}-"
+        f"{datetime.datetime.utcnow():%Y%m%d%H%M%S%f}"
     )
-    opensearch_client = OpenSearch(
-        hosts=[{"host": OPENSEARCH_URL, "port": OPENSEARCH_PORT}],
-        http_auth=awsauth,
-        use_ssl=False,
-        verify_certs=False,
-        connection_class=RequestsHttpConnection,
+
+
+def new_atbd_index_body(**overrides) -> Dict[str, Any]:
+    """Mapping and (configured) settings of a new ATBD index. The settings
+    can be overriden, eg: while the index is being built."""
+    return atbd_index_body(
+        **{
+            "shards": OPENSEARCH_SHARDS,
+            "replicas": OPENSEARCH_REPLICAS,
+            "refresh_interval": OPENSEARCH_REFRESH_INTERVAL,
+            **overrides,
+        }
     )
-    logger.info("AWS Auth: %s", awsauth)
-    create_search_indices(opensearch_client)
-    return opensearch_client
 
 
-def _default(i: Any):
-    if isinstance(i, (datetime.date, datetime.datetime)):
-        return i.isoformat()
-    return str(i)
+def _check_mapping_version(mappings: Dict[str, Any]):
+    for index, mapping in mappings.items():
+        version = mapping["mappings"].get("_meta", {}).get("mapping_version")
+        if version != ATBD_MAPPING_VERSION:
+            logger.warning(
+                "Index %s uses mapping version %s (current: %s), "
+                "the ATBD index needs to be rebuilt",
+                index,
+                version,
+                ATBD_MAPPING_VERSION,
+            )
 
 
-def send_to_opensearch(data: List[Dict]):
+@run_once
+def create_search_indices(opensearch_client):
     """
-    Receives the data for bulk indexing
-    Then uses client to bulk index documents to open search
+    Create atbd index (and its alias) if it doesn't exists, or warn if the
+    existing index uses an outdated mapping. Runs once per process, for both
+    the sync and async clients.
     """
-    # bulk commands must end with newline
-    data_string = "\n".join(json.dumps(d, default=_default) for d in data) + "\n"
+    if not opensearch_client.indices.exists(ATBD_INDEX):
+        index = new_atbd_index_name()
+        logger.info("Creating index: %s", index)
+        opensearch_client.indices.create(
+            index, body=new_atbd_index_body(aliases={ATBD_INDEX: {}})
+        )
+    else:
+        _check_mapping_version(opensearch_client.indices.get_mapping(index=ATBD_INDEX))
 
-    try:
-        # init client
-        opensearch_client = get_opensearch_client()
-        # bulk index
-        response = opensearch_client.bulk(body=data_string, index="atbd")
 
-    except Exception as e:
-        raise e
+_client_lock = threading.Lock()
+_client: OpenSearch = None
+_async_client_lock: asyncio.Lock = None
+_async_client: AsyncOpenSearch = None
 
-    else:
-        # return value of 'object' is expected
-        return dict(response)
 
+def _client_options() -> Dict[str, Any]:
+    """
+    Options shared by the sync and async clients. The requests are signed with
+    the credentials of the boto3 session: temporary credentials (eg: from the
+    task role) are refreshed by botocore before they expire, so the clients
+    never need to be re-created.
+    """
+    return dict(
+        hosts=[{"host": OPENSEARCH_URL, "port": OPENSEARCH_PORT}],
+        use_ssl=False,
+        verify_certs=False,
+        timeout=OPENSEARCH_TIMEOUT,
+        max_retries=OPENSEARCH_MAX_RETRIES,
+        retry_on_timeout=True,
+    )
 
-def remove_atbd_from_index(atbd: Atbds = None, version: AtbdVersions = None):
-    """Deletes documents indexed in opensearch that correspond to
-    either a single version or all versions belonging to an ATBD"""
 
-    # init client
-    opensearch_client = get_opensearch_client()
+def _credentials():
+    logger.info("Getting AWS Auth Credentials")
+    return boto3.Session(region_name=REGION).get_credentials()
 
-    if version:
-        try:
-            # directly delete the document
-            # TODO Verify how to get correct atbd id
-            response = opensearch_client.delete(
-                index="atbd", id=f"{version.atbd_id}_v{version.major}"
-            )
-            return dict(response)
-        except NotFoundError:
-            return dict()
-
-    if not atbd:
-        raise HTTPException(
-            status_code=500,
-            detail="Unable to delete ATBD/ATBDVersion from opensearch",
-        )
 
-    try:
-        for version in atbd.versions:
-            # TODO use Opensearch DSL query lang to cover expected documents
+def get_opensearch_client() -> OpenSearch:
+    """
+    Outputs an Opensearch service client. Low level client authorizes against the boto3 session and associated AWS credentials
+    host is hardcoded as to reference the container within the same network.
 
-            response = opensearch_client.delete(
-                index="atbd", id=f"{atbd.id}_v{version.major}"
-            )
-    except NotFoundError:
-        pass
-    return dict()
-
-
-def generate_add_atbd_to_index_es_commands(atbd: Atbds):
-    """Generate Indexes command for an ATBD in opensearch. If the ATBD metadata (title, alias) is
-    to be updated, then the `atbd` input param will contain all associated versions,
-    which will all be updated in the opensearch. If the ATBD version data (document,
-    citation, etc) has been updated, then the `atbd` input param
-    will only contain a single version, and only that version will be updated."""
-    es_commands = []
-    for version in atbd.versions:
-
-        atbd.version = version
-
-        es_commands.append(
-            {
-                "index": {
-                    "_index": "atbd",
-                    # "_type": "atbd", specifying types in bulk requests is deprecated in >ES7
-                    "_id": f"{atbd.id}_v{version.major}",
-                }
-            }
-        )
-        es_commands.append(
-            OpensearchAtbd.from_orm(atbd).dict(by_alias=True, exclude_none=True)
-        )
+    The client is created once per process, and keeps a pool of (up to
+    `OPENSEARCH_POOL_MAXSIZE`) HTTP connections open between requests.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                client = OpenSearch(
+                    **_client_options(),
+                    http_auth=AWSV4SignerAuth(_credentials(), REGION),
+                    connection_class=RequestsHttpConnection,
+                    pool_maxsize=OPENSEARCH_POOL_MAXSIZE,
+                )
+                create_search_indices(client)
+                _client = client
+    return _client
+
+
+async def get_async_opensearch_client() -> AsyncOpenSearch:
+    """
+    Async version of `get_opensearch_client`, for use from async endpoints.
+    The indices are set up by `create_search_indices`, as for the sync client.
+    """
+    global _async_client, _async_client_lock
+    if _async_client is None:
+        # Created lazily, to be bound to the running event loop
+        if _async_client_lock is None:
+            _async_client_lock = asyncio.Lock()
+        async with _async_client_lock:
+            if _async_client is None:
+                client = AsyncOpenSearch(
+                    **_client_options(),
+                    http_auth=AWSV4SignerAsyncAuth(_credentials(), REGION),
+                    connection_class=AIOHttpConnection,
+                    maxsize=OPENSEARCH_POOL_MAXSIZE,
+                )
+                # The index is created (or its mapping version checked) once
+                # per process, by the sync client
+                await asyncio.get_running_loop().run_in_executor(
+                    None, get_opensearch_client
+                )
+                _async_client = client
+    return _async_client
+
+
+async def close_async_opensearch_client():
+    """Closes the connections of the async client (on shutdown)"""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
 
-    return es_commands
-
-
-def add_atbd_to_index(atbd: Atbds):
-    """Indexes single ATBD to opensearch."""
-    return send_to_opensearch(generate_add_atbd_to_index_es_commands(atbd))
-
-
-def add_atbds_to_index(atbds: List[Atbds]):
-    """Indexes multiple ATBDs to opensearch."""
-    es_commands = []
-    for atbd in atbds:
-        es_commands.extend(generate_add_atbd_to_index_es_commands(atbd))
-    if es_commands:
-        return send_to_opensearch(es_commands)
-
-
-def rebuild_atbd_index():
-    """Rebuild atbd index from scratch using published ATBDs"""
-    db = DbSession()
-    # Clean up everything
-    opensearch_client = get_opensearch_client()
-    opensearch_client.indices.delete("atbd")
-    opensearch_client.indices.create("atbd")
-    del opensearch_client
-    # Index all published atbds in chunks
-    limit = 100
-    atbds_query = (
-        db.query(Atbds)
-        .filter(Atbds.versions.any(AtbdVersions.published_at != None))  # noqa:E711
-        .join(AtbdVersions, Atbds.id == AtbdVersions.atbd_id)
-        .options(orm.contains_eager(Atbds.versions))
-        .limit(limit)
-    )
-    offset = 0
-    while True:
-        atbds = atbds_query.offset(offset).all()
-        if not atbds:
-            break
-        add_atbds_to_index(atbds)
-        offset += limit
+
+def _default(i: Any):
+    if isinstance(i, (datetime.date, datetime.datetime)):
+        return i.isoformat()
+    return str(i)
@@ -0,0 +1,104 @@
+"""Applies the changes recorded in the search outbox to the ATBD index.
+
+Writes to the ATBDs, their versions and contacts record the (ATBD id, major)
+pairs that need to be re-indexed in the `search_outbox` table. The records
+are written by database triggers, in the same transaction as the writes, so
+no change can be lost (or indexed before being committed). The worker drains
+the outbox in batches:
+
+- the changes of a batch are coalesced, so that a version changed many
+  times is only indexed once
+- published versions are (re-)indexed, the others deleted from the index,
+  with a single bulk request per batch
+- the records are deleted in the same transaction that reads them, which is
+  only committed once the bulk request has been sent: if the request fails,
+  the records are kept and retried on the next drain
+"""
+import base64
+import pickle
+
+from sqlalchemy import func
+
+from app.config import SEARCH_OUTBOX_BATCH_SIZE
+from app.db.db_session import DbSession
+from app.db.models import SearchOutbox
+from app.logs import logger
+from app.search.bulk import chunk_bulk_items, send_bulk_chunk
+from app.search.opensearch import ATBD_INDEX, get_opensearch_client
+from app.search.reindex import version_bulk_items
+from app.utils import get_task_queue
+
+# Arbitrary key of the advisory lock held while draining a batch: batches
+# are applied one at a time, in order, so that an older state of a version
+# is never indexed after a newer one
+DRAIN_LOCK_KEY = 0x5EA2C4
+
+
+def _drain_batch(db: DbSession) -> int:
+    """Applies (and deletes) the oldest batch of changes. Returns the number
+    of changes applied."""
+    db.execute(func.pg_advisory_xact_lock(DRAIN_LOCK_KEY))
+    records = (
+        db.query(SearchOutbox)
+        .order_by(SearchOutbox.id)
+        .limit(SEARCH_OUTBOX_BATCH_SIZE)
+        .all()
+    )
+    if not records:
+        db.rollback()
+        return 0
+
+    changes = {(r.atbd_id, r.major) for r in records}
+    items = version_bulk_items(db, changes)
+    client = get_opensearch_client()
+    # Only split if the batch exceeds the size limits of a bulk request.
+    # Items that fail with a non transient error (eg: an invalid document)
+    # are logged and dropped: retrying them wouldn't succeed either.
+    failed = sum(
+        send_bulk_chunk(client, ATBD_INDEX, chunk) for chunk in chunk_bulk_items(items)
+    )
+
+    db.query(SearchOutbox).filter(SearchOutbox.id.in_([r.id for r in records])).delete(
+        synchronize_session=False
+    )
+    db.commit()
+    db.expunge_all()
+    logger.info(
+        "Applied %s search index changes (%s actions, %s failed)",
+        len(records),
+        len(items),
+        failed,
+    )
+    return len(records)
+
+
+def drain_search_outbox():
+    """Applies all the changes recorded in the search outbox to the index"""
+    db = DbSession()
+    try:
+        while _drain_batch(db):
+            pass
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def signal_search_outbox():
+    """Asks the worker to drain the search outbox, if there are changes to
+    apply. Called once the transaction recording the changes is committed
+    (eg: as a background task of the request): if the signal is lost, the
+    changes are applied on the next drain."""
+    db = DbSession()
+    try:
+        pending = db.query(db.query(SearchOutbox).exists()).scalar()
+    finally:
+        db.close()
+    if not pending:
+        return
+    get_task_queue().send_message(
+        MessageBody=base64.b64encode(
+            pickle.dumps({"task_type": "drain_search_outbox", "payload": {}})
+        ).decode()
+    )
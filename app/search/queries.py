@@ -0,0 +1,176 @@
+"""Builds (and caches) the searches of the ATBD index.
+
+Search requests are structured (`SearchQuery`): the OpenSearch query is
+built server side, so it's always bounded (page size, fields, timeout) and
+can be cached. Results are cached for a short time, keyed on the
+normalized query, since many users run the same searches (eg: the default,
+empty search of the search page).
+"""
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, SEARCH_TIMEOUT
+from app.schemas.opensearch import SearchOutput, SearchQuery
+
+from fastapi import HTTPException
+
+# Fields of the hits returned to the client
+SUMMARY_FIELDS = [
+    "id",
+    "title",
+    "alias",
+    "version.major",
+    "version.minor",
+    "version.version",
+    "version.doi",
+    "version.keywords",
+]
+
+# Fields the text is matched against (boosted)
+TEXT_FIELDS = [
+    "title^3",
+    "version.keywords.label^2",
+    "version.document.*",
+    "version.citation.*",
+    "version.contacts_link.contact.first_name",
+    "version.contacts_link.contact.last_name",
+]
+
+HIGHLIGHT = {
+    "fields": {"title": {}, "version.document.*": {}},
+    "fragment_size": 150,
+    "number_of_fragments": 3,
+}
+
+SORTS = {
+    "relevance": ["_score"],
+    "title": ["title.raw"],
+    "version": ["version.major", "version.minor"],
+}
+
+
+def _encode_cursor(sort_values: List[Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(sort_values).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> List[Any]:
+    try:
+        sort_values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        sort_values = None
+    if not isinstance(sort_values, list):
+        raise HTTPException(status_code=400, detail=f"Malformed cursor: {cursor}")
+    return sort_values
+
+
+def build_search_body(query: SearchQuery) -> Dict[str, Any]:
+    """OpenSearch request body of a search query"""
+    must: List[Dict] = []
+    filters: List[Dict] = []
+    if query.text:
+        must.append(
+            {
+                "multi_match": {
+                    "query": query.text,
+                    "fields": TEXT_FIELDS,
+                    # Skip the (non text) fields the text can't be matched against
+                    "lenient": True,
+                }
+            }
+        )
+    filters.extend({"term": {"version.keywords.label": k}} for k in query.keywords)
+    if query.version:
+        filters.append({"term": {"version.version": query.version}})
+
+    order = query.order.value
+    # The (ATBD id, major) pair identifies an indexed version, so that
+    # `search_after` never skips or repeats results
+    sort = [{field: order} for field in SORTS[query.sort.value]] + [
+        {"id": "asc"},
+        {"version.major": "asc"},
+    ]
+
+    body: Dict[str, Any] = {
+        "query": {"bool": {"must": must or [{"match_all": {}}], "filter": filters}},
+        "_source": SUMMARY_FIELDS,
+        "sort": sort,
+        "size": query.limit,
+        "timeout": SEARCH_TIMEOUT,
+        "track_total_hits": True,
+    }
+    if query.text:
+        body["highlight"] = HIGHLIGHT
+    if query.search_after:
+        body["search_after"] = _decode_cursor(query.search_after)
+    return body
+
+
+def parse_search_response(query: SearchQuery, response: Dict) -> SearchOutput:
+    """Search results of an OpenSearch response"""
+    hits = response["hits"]["hits"]
+    next_cursor = None
+    if len(hits) == query.limit:
+        next_cursor = _encode_cursor(hits[-1]["sort"])
+    return SearchOutput(
+        total=response["hits"]["total"]["value"],
+        next_cursor=next_cursor,
+        hits=[
+            {
+                **hit["_source"],
+                "score": hit.get("_score"),
+                "highlight": hit.get("highlight", {}),
+            }
+            for hit in hits
+        ],
+    )
+
+
+class SearchCache:
+    """
+    Bounded LRU of search results, keyed on the normalized query. Entries
+    expire after `ttl` seconds, which bounds how long an (re-)indexed ATBD
+    can be missing from cached results.
+    """
+
+    def __init__(self, maxsize: int, ttl: int):
+        """Init cache"""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._results: "OrderedDict[str, Tuple[float, SearchOutput]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(query: SearchQuery) -> str:
+        """Normalized query: the `SearchQuery` validators strip the text and
+        sort the keywords, so that equivalent queries share the same key"""
+        return json.dumps(query.dict(), sort_keys=True)
+
+    def get(self, key: str) -> Optional[SearchOutput]:
+        """Returns the cached results, or None if absent or expired"""
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is None:
+                return None
+            cached_at, output = entry
+            if time.monotonic() - cached_at > self.ttl:
+                del self._results[key]
+                return None
+            self._results.move_to_end(key)
+            return output
+
+    def set(self, key: str, output: SearchOutput):
+        """Caches the results of a query"""
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._results[key] = (time.monotonic(), output)
+            self._results.move_to_end(key)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+
+search_cache = SearchCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
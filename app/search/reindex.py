@@ -0,0 +1,374 @@
+"""Rebuilds the ATBD index from scratch, without search downtime.
+
+The ATBDs are indexed into a new (timestamped) index while the current one
+keeps serving searches. Once all the ATBDs are indexed, the `atbd` alias is
+atomically swapped to the new index, and the previous index is deleted.
+
+- ATBDs are read in pages, using keyset pagination on the ATBD id (so that a
+  page never splits the versions of an ATBD, and that late pages aren't
+  slower than early ones)
+- The (CPU bound) validation and cleanup of the documents is done in a
+  process pool
+- The bulk requests are chunked by number of actions and size, sent
+  concurrently, and the items that fail with a transient error are retried
+
+The index can also be reconciled with the database in place (see
+`reconcile_atbd_index`), which only sends the differences.
+"""
+import datetime
+import json
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from opensearchpy import OpenSearch, helpers
+from sqlalchemy import orm
+
+from app.config import (
+    OPENSEARCH_REFRESH_INTERVAL,
+    OPENSEARCH_REPLICAS,
+    REINDEX_BULK_THREADS,
+    REINDEX_PROCESSES,
+)
+from app.db.db_session import DbSession
+from app.db.models import (
+    Atbds,
+    AtbdVersions,
+    AtbdVersionsContactsAssociation,
+)
+from app.logs import logger
+from app.schemas.opensearch import OpensearchAtbd
+from app.schemas.versions_contacts import ContactsLinkOutput
+from app.search.bulk import BulkItem, chunk_bulk_items, send_bulk_chunk
+from app.search.opensearch import (
+    ATBD_INDEX,
+    _default,
+    get_opensearch_client,
+    new_atbd_index_body,
+    new_atbd_index_name,
+)
+
+PAGE_SIZE = 100
+# Share of the published versions (at least one) that may be missing from a
+# rebuilt index (eg: invalid documents) before it's discarded instead of
+# swapped in
+MAX_FAILED_RATIO = 0.01
+
+
+def _published_atbds(db: DbSession) -> Iterator[List[Atbds]]:
+    """Yields the ATBDs with at least one published version (along with their
+    published versions and contacts), one page at a time"""
+    last_id = 0
+    while True:
+        ids = [
+            atbd_id
+            for (atbd_id,) in db.query(Atbds.id)
+            .filter(Atbds.versions.any(AtbdVersions.published_at != None))  # noqa:E711
+            .filter(Atbds.id > last_id)
+            .order_by(Atbds.id)
+            .limit(PAGE_SIZE)
+        ]
+        if not ids:
+            return
+        last_id = ids[-1]
+
+        yield (
+            db.query(Atbds)
+            .filter(Atbds.id.in_(ids))
+            .join(AtbdVersions, Atbds.id == AtbdVersions.atbd_id)
+            .filter(AtbdVersions.published_at != None)  # noqa:E711
+            .options(
+                orm.contains_eager(Atbds.versions)
+                .selectinload(AtbdVersions.contacts_link)
+                .joinedload(AtbdVersionsContactsAssociation.contact)
+            )
+            .order_by(Atbds.id)
+            .all()
+        )
+        # The page is no longer needed: don't keep it in the session
+        db.expunge_all()
+
+
+def _snapshot(atbd: Atbds, version: AtbdVersions) -> Dict[str, Any]:
+    """Plain (picklable) copy of the data indexed for a version"""
+    return dict(
+        id=atbd.id,
+        title=atbd.title,
+        alias=atbd.alias,
+        version=dict(
+            major=version.major,
+            minor=version.minor,
+            citation=version.citation,
+            keywords=version.keywords,
+            document=version.document,
+            doi=version.doi,
+            contacts_link=[
+                ContactsLinkOutput.from_orm(link) for link in version.contacts_link
+            ],
+        ),
+    )
+
+
+def _serialize(snapshot: Dict[str, Any]) -> BulkItem:
+    """Validates (and cleans up) the document of a version, and serializes it
+    into the lines of a bulk index request. Runs in the process pool."""
+    document = OpensearchAtbd.parse_obj(snapshot).dict(by_alias=True, exclude_none=True)
+    action = {"index": {"_id": f"{snapshot['id']}_v{snapshot['version']['major']}"}}
+    return json.dumps(action), json.dumps(document, default=_default)
+
+
+def version_bulk_items(
+    db: DbSession, changes: Set[Tuple[int, Optional[int]]]
+) -> List[BulkItem]:
+    """Bulk actions bringing the indexed documents of the (ATBD id, major)
+    versions in sync with the database: the published versions are
+    indexed, the others (unpublished or deleted) removed. A `None` major
+    stands for all the versions of the ATBD."""
+    atbd_ids = {atbd_id for atbd_id, _ in changes}
+    all_versions = {atbd_id for atbd_id, major in changes if major is None}
+
+    atbds = (
+        db.query(Atbds)
+        .filter(Atbds.id.in_(atbd_ids))
+        .join(AtbdVersions, Atbds.id == AtbdVersions.atbd_id)
+        .filter(AtbdVersions.published_at != None)  # noqa:E711
+        .options(
+            orm.contains_eager(Atbds.versions)
+            .selectinload(AtbdVersions.contacts_link)
+            .joinedload(AtbdVersionsContactsAssociation.contact)
+        )
+        .all()
+    )
+
+    items: List[BulkItem] = []
+    indexed = set()
+    for atbd in atbds:
+        for version in atbd.versions:
+            if atbd.id in all_versions or (atbd.id, version.major) in changes:
+                indexed.add((atbd.id, version.major))
+                items.append(_serialize(_snapshot(atbd, version)))
+
+    removed = {(a, m) for a, m in changes if m is not None} - indexed
+    for atbd_id, major in sorted(removed):
+        items.append((json.dumps({"delete": {"_id": f"{atbd_id}_v{major}"}}), None))
+    return items
+
+
+def _serializer() -> Executor:
+    if REINDEX_PROCESSES > 0:
+        try:
+            return ProcessPoolExecutor(max_workers=REINDEX_PROCESSES)
+        except (OSError, NotImplementedError):
+            # eg: in Lambda, which doesn't support multiprocessing
+            logger.warning("Multiprocessing unavailable, serializing in process")
+    return ThreadPoolExecutor(max_workers=1)
+
+
+def _swap_alias(client: OpenSearch, index: str) -> List[str]:
+    """Atomically points the `atbd` alias to `index`. Returns the indices
+    the alias previously pointed to."""
+    actions: List[Dict] = []
+    previous: List[str] = []
+    if client.indices.exists_alias(name=ATBD_INDEX):
+        previous = list(client.indices.get_alias(name=ATBD_INDEX))
+        actions.extend({"remove": {"index": i, "alias": ATBD_INDEX}} for i in previous)
+    elif client.indices.exists(ATBD_INDEX):
+        # A (legacy) concrete index is in the way of the alias: it gets
+        # deleted in the same (atomic) operation
+        actions.append({"remove_index": {"index": ATBD_INDEX}})
+    actions.append({"add": {"index": index, "alias": ATBD_INDEX}})
+    client.indices.update_aliases(body={"actions": actions})
+    return previous
+
+
+def _published_versions(db: DbSession) -> Set[Tuple[int, int]]:
+    """(ATBD id, major) pairs of the published versions"""
+    return set(
+        db.query(AtbdVersions.atbd_id, AtbdVersions.major).filter(
+            AtbdVersions.published_at != None  # noqa:E711
+        )
+    )
+
+
+def _check_rebuilt_index(indexed: int, failed: int, published: int):
+    """Raises if too many of the published versions are missing from the
+    rebuilt index, which then mustn't replace the current one"""
+    allowed = max(1, MAX_FAILED_RATIO * published)
+    if failed > allowed or indexed - failed < published - allowed:
+        raise Exception(
+            f"Rebuilt index is incomplete: {indexed - failed} documents indexed "
+            f"({failed} failed) for {published} published versions"
+        )
+
+
+def _catch_up(
+    db: DbSession, started_at: datetime.datetime, built: Set[Tuple[int, int]]
+):
+    """Applies the changes made while the index was being built: the
+    versions (and ATBDs) updated since are re-indexed, and the versions
+    built into the index that are no longer published are removed"""
+    changes: Set[Tuple[int, Optional[int]]] = set(
+        db.query(AtbdVersions.atbd_id, AtbdVersions.major).filter(
+            AtbdVersions.last_updated_at >= started_at
+        )
+    )
+    changes.update(
+        (atbd_id, None)
+        for (atbd_id,) in db.query(Atbds.id).filter(Atbds.last_updated_at >= started_at)
+    )
+    changes.update(built - _published_versions(db))
+    if not changes:
+        return
+    items = version_bulk_items(db, changes)
+    client = get_opensearch_client()
+    failed = sum(
+        send_bulk_chunk(client, ATBD_INDEX, chunk) for chunk in chunk_bulk_items(items)
+    )
+    logger.info(
+        "Caught up with %s changes (%s actions, %s failed)",
+        len(changes),
+        len(items),
+        failed,
+    )
+
+
+def rebuild_atbd_index():
+    """Rebuild atbd index from scratch using published ATBDs. The rebuilt
+    index only replaces the current one if (almost) all the published
+    versions could be indexed."""
+    started_at = datetime.datetime.utcnow()
+    client = get_opensearch_client()
+    index = new_atbd_index_name()
+    logger.info("Rebuilding the ATBD index into: %s", index)
+    # Refreshing (and replicating) the index while it's being built is
+    # wasted work
+    client.indices.create(
+        index, body=new_atbd_index_body(refresh_interval="-1", replicas=0)
+    )
+
+    db = DbSession()
+    indexed = failed = 0
+    built: Set[Tuple[int, int]] = set()
+    try:
+        with _serializer() as serializer, ThreadPoolExecutor(
+            max_workers=REINDEX_BULK_THREADS
+        ) as senders:
+
+            def _items() -> Iterator[BulkItem]:
+                for atbds in _published_atbds(db):
+                    snapshots = [
+                        _snapshot(atbd, version)
+                        for atbd in atbds
+                        for version in atbd.versions
+                    ]
+                    built.update((s["id"], s["version"]["major"]) for s in snapshots)
+                    yield from serializer.map(_serialize, snapshots, chunksize=10)
+
+            pending = []
+            for chunk in chunk_bulk_items(_items()):
+                pending.append(senders.submit(send_bulk_chunk, client, index, chunk))
+                indexed += len(chunk)
+                # Don't read the database faster than the chunks can be sent
+                while len(pending) > REINDEX_BULK_THREADS * 2:
+                    failed += pending.pop(0).result()
+            failed += sum(f.result() for f in pending)
+
+        _check_rebuilt_index(indexed, failed, len(_published_versions(db)))
+        client.indices.put_settings(
+            index=index,
+            body={
+                "index": {
+                    "refresh_interval": OPENSEARCH_REFRESH_INTERVAL,
+                    "number_of_replicas": OPENSEARCH_REPLICAS,
+                }
+            },
+        )
+        client.indices.refresh(index=index)
+    except Exception:
+        logger.exception("Unable to rebuild the ATBD index, deleting: %s", index)
+        client.indices.delete(index=index)
+        raise
+    finally:
+        db.close()
+
+    previous = _swap_alias(client, index)
+    for i in previous:
+        client.indices.delete(index=i)
+    logger.info(
+        "Rebuilt the ATBD index: %s (%s documents, %s failed)",
+        index,
+        indexed - failed,
+        failed,
+    )
+
+    db = DbSession()
+    try:
+        _catch_up(db, started_at, built)
+    finally:
+        db.close()
+
+
+def _parse_document_id(document_id: str) -> Optional[Tuple[int, int]]:
+    """(ATBD id, major) of an indexed document id (`<atbd_id>_v<major>`)"""
+    atbd_id, _, major = document_id.partition("_v")
+    if not (atbd_id.isdigit() and major.isdigit()):
+        return None
+    return int(atbd_id), int(major)
+
+
+def reconcile_atbd_index():
+    """Compares the documents of the ATBD index with the published versions
+    in the database, and (in bulk) indexes the missing versions and removes
+    the stale documents (eg: left behind by a failed removal)"""
+    client = get_opensearch_client()
+    indexed = {
+        hit["_id"]
+        for hit in helpers.scan(
+            client,
+            index=ATBD_INDEX,
+            query={"query": {"match_all": {}}, "_source": False},
+            size=1000,
+        )
+    }
+
+    db = DbSession()
+    try:
+        published = {
+            f"{atbd_id}_v{major}": (atbd_id, major)
+            for atbd_id, major in db.query(
+                AtbdVersions.atbd_id, AtbdVersions.major
+            ).filter(
+                AtbdVersions.published_at != None  # noqa:E711
+            )
+        }
+        missing = [published[i] for i in published.keys() - indexed]
+        stale = sorted(indexed - published.keys())
+
+        items: List[BulkItem] = [
+            (json.dumps({"delete": {"_id": document_id}}), None)
+            for document_id in stale
+            # Documents that don't belong to a version are deleted as is,
+            # the others in case their version was (concurrently) published
+            if _parse_document_id(document_id) is None
+        ]
+        stale_versions = {_parse_document_id(i) for i in stale} - {None}
+        pages = [stale_versions] + [
+            set(missing[start : start + PAGE_SIZE])
+            for start in range(0, len(missing), PAGE_SIZE)
+        ]
+        for page in pages:
+            if page:
+                items.extend(version_bulk_items(db, page))  # type: ignore
+                db.expunge_all()
+    finally:
+        db.close()
+
+    failed = sum(
+        send_bulk_chunk(client, ATBD_INDEX, chunk) for chunk in chunk_bulk_items(items)
+    )
+    logger.info(
+        "Reconciled the ATBD index: %s missing, %s stale documents (%s failed)",
+        len(missing),
+        len(stale),
+        failed,
+    )
+    return {"missing": len(missing), "stale": len(stale), "failed": failed}
@@ -0,0 +1,93 @@
+"""Extraction of the indexed text of the version documents (see
+`OpensearchAtbdVersion`). Only the words of the document are indexed."""
+import re
+from typing import Any, Dict, List, Optional
+
+from app.schemas import document as _document
+from app.search.mapping import SKIPPED_SECTIONS
+
+# Non-word characters, replaced by a single space (only the words of the
+# document are indexed)
+_NON_WORDS = re.compile(r"[^\w]+")
+
+INDEXED_SECTIONS = [
+    section
+    for section in _document.Document.__fields__
+    if section not in SKIPPED_SECTIONS
+]
+
+# Sections holding lists of objects, and the (text) fields of the objects
+# that are indexed
+OBJECT_SECTIONS = {
+    "algorithm_input_variables": ("name", "unit"),
+    "algorithm_output_variables": ("name", "unit"),
+    "algorithm_implementations": ("url", "description"),
+    "data_access_input_data": ("url", "description"),
+    "data_access_output_data": ("url", "description"),
+    "data_access_related_urls": ("url", "description"),
+}
+
+# Types of the WYSIWYG nodes whose text isn't indexed (equations are all
+# latex code). The text of all other nodes is the text of their children.
+SKIPPED_NODE_TYPES = {
+    _document.TypesEnum.equation.value,
+    _document.TypesEnum.equation_inline.value,
+}
+
+
+def _collect_text(value: Any, texts: List[str]):
+    """Appends the text of a WYSIWYG (sub-)tree of the raw document to
+    `texts`, walking the tree iteratively (with an explicit stack)"""
+    stack = [value]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            texts.append(node)
+        elif isinstance(node, list):
+            # reversed, so that the text is collected in document order
+            stack.extend(reversed(node))
+        elif isinstance(node, dict):
+            if node.get("type") in SKIPPED_NODE_TYPES:
+                continue
+            text = node.get("text")
+            if text:
+                texts.append(text)
+            children = node.get("children")
+            if children:
+                stack.extend(reversed(children))
+
+
+def _words(texts: List[str]) -> Optional[str]:
+    return _NON_WORDS.sub(" ", " ".join(texts)).strip() or None
+
+
+def extract_document_text(document: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extracts the indexed text of each section of a (raw, JSON) version
+    document: the words of the section, separated by single spaces. The
+    document isn't validated (nor parsed into a `Document`), and the text of
+    a section is collected in a single list, joined and cleaned up at once.
+    Publication references are indexed as is.
+    """
+    sections: Dict[str, Any] = {}
+    for section in INDEXED_SECTIONS:
+        value = document.get(section)
+        if not value:
+            continue
+        if section == "publication_references":
+            sections[section] = [
+                {k: v for k, v in reference.items() if v is not None}
+                for reference in value
+            ]
+            continue
+
+        texts: List[str] = []
+        fields = OBJECT_SECTIONS.get(section)
+        if fields:
+            for item in value:
+                for field in fields:
+                    _collect_text(item.get(field), texts)
+        else:
+            _collect_text(value, texts)
+        sections[section] = _words(texts)
+    return sections
@@ -0,0 +1,377 @@
+"""Runtime of the worker: receives the background tasks from SQS and handles
+them concurrently.
+
+- Tasks are handled by an executor (eg: a thread pool) per task type, which
+  bounds the concurrency of each type of task: eg: PDFs are rendered by a few
+  threads, each keeping a browser, while lighter tasks run wider
+- Messages are received in batches, as long as the runtime has capacity for
+  them, from the queues in order of priority
+- The visibility timeout of the messages being handled is extended
+  periodically (heartbeats): long tasks aren't redelivered while they're
+  running, but the tasks of a crashed worker are, soon after
+- Messages are only deleted once their task succeeded. Failed tasks are
+  retried (after a backoff) until their retry budget is spent, and are then
+  moved to the dead-letter queue
+- Once stopped (eg: on SIGTERM), the runtime stops receiving messages. The
+  tasks that haven't started yet are cancelled, and their messages released
+  for other workers, while the running tasks are waited for (for up to
+  `drain_timeout` seconds). The messages of the ones that don't finish in time
+  are released as well
+
+The runtime only relies on a small subset of the SQS resource API of boto3
+(`receive_messages`, `change_message_visibility_batch` and `send_message` of
+the queues, `delete` and `change_visibility` of the messages), so that it can
+be run against a local stand-in of SQS.
+"""
+import base64
+import pickle
+import signal
+import threading
+import time
+from concurrent.futures import Future
+from functools import partial
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from app.logs import logger
+
+# SQS returns (and sends) up to 10 messages at once, caps their visibility
+# timeout, and caps the size of a message (and of a batch of messages)
+MAX_MESSAGES = 10
+MAX_VISIBILITY_TIMEOUT = 12 * 60 * 60
+MAX_MESSAGE_BYTES = 256 * 1024
+
+
+def encode_task(task_type: str, payload: dict) -> str:
+    """Encodes a task into the body of a message"""
+    return base64.b64encode(
+        pickle.dumps({"task_type": task_type, "payload": payload})
+    ).decode()
+
+
+def decode_task(body: str) -> dict:
+    """Decodes the task sent as the body of a message"""
+    return pickle.loads(base64.b64decode(body.encode()))
+
+
+def chunk_by_size(
+    items: Iterable[Any], max_items: int, max_bytes: int = MAX_MESSAGE_BYTES
+) -> Iterator[List[Any]]:
+    """Groups the items (of a task's payload) into chunks of at most
+    `max_items` items, each small enough for the chunk to be sent in a
+    message of up to `max_bytes` bytes once encoded. The size of a chunk is
+    estimated from the pickled size of its items (plus 1 KB for the rest of
+    the task), and base64 grows the pickled bytes by a third. An item too
+    large for a message on its own is yielded alone."""
+    budget = max_bytes * 3 // 4 - 1024
+    chunk: List[Any] = []
+    size = 0
+    for item in items:
+        item_size = len(pickle.dumps(item))
+        if chunk and (len(chunk) >= max_items or size + item_size > budget):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(item)
+        size += item_size
+    if chunk:
+        yield chunk
+
+
+def batch_entries(bodies: List[str], delay: int = 0) -> Iterator[List[Dict]]:
+    """Groups message bodies into the entries of `send_messages` requests,
+    each of at most `MAX_MESSAGES` messages and `MAX_MESSAGE_BYTES` bytes"""
+    entries: List[Dict] = []
+    size = 0
+    for i, body in enumerate(bodies):
+        if entries and (
+            len(entries) >= MAX_MESSAGES or size + len(body) > MAX_MESSAGE_BYTES
+        ):
+            yield entries
+            entries, size = [], 0
+        entries.append({"Id": str(i), "DelaySeconds": delay, "MessageBody": body})
+        size += len(body)
+    if entries:
+        yield entries
+
+
+class InFlight(NamedTuple):
+    """Message whose task is being handled"""
+
+    queue: Any
+    message: Any
+    key: Optional[str]
+    future: Optional[Future] = None
+
+
+class TaskRuntime:
+    """Receives the tasks from the queues, and handles them until stopped"""
+
+    def __init__(
+        self,
+        queues: List[Any],
+        handlers: Dict[str, Callable],
+        executors: Dict[str, Any],
+        default_executor: Any,
+        capacity: int,
+        visibility_timeout: int = 60,
+        max_receives: int = 3,
+        retry_delay: int = 30,
+        dead_letter_queue: Any = None,
+        wait_time: int = 20,
+        drain_timeout: int = 60,
+        coalesce_key: Callable[[dict], Optional[str]] = None,
+        on_idle: Callable[[], None] = None,
+    ):
+        """Init runtime.
+
+        `queues` are polled in order of priority (only the last one is long
+        polled, for up to `wait_time` seconds). Tasks are handled by the
+        executor of their type in `executors` (anything with a `submit`
+        method returning a future), or by `default_executor`, and at most
+        `capacity` tasks are received at once. Tasks with the same (not None)
+        `coalesce_key` as a running task are dropped as duplicates. `on_idle`
+        is called when no message is received."""
+        self.queues = queues
+        self.handlers = handlers
+        self.executors = executors
+        self.default_executor = default_executor
+        self.capacity = capacity
+        self.visibility_timeout = visibility_timeout
+        self.max_receives = max_receives
+        self.retry_delay = retry_delay
+        self.dead_letter_queue = dead_letter_queue
+        self.wait_time = wait_time
+        self.drain_timeout = drain_timeout
+        self.coalesce_key = coalesce_key
+        self.on_idle = on_idle
+        self._lock = threading.Condition()
+        self._in_flight: Dict[str, InFlight] = {}
+        # Held by the heartbeat while it extends the visibility of the
+        # messages, and while a message is settled: a heartbeat can't extend
+        # (and override the retry backoff of) a message once it's settled
+        self._settle_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._stopped = threading.Event()
+
+    def stop(self, *args):
+        """Stops receiving messages (the running tasks are drained)"""
+        self._stopping.set()
+        with self._lock:
+            self._lock.notify_all()
+
+    def install_signal_handlers(self):
+        """Stops the runtime on SIGTERM (and SIGINT)"""
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self.stop)
+
+    def run(self):
+        """Handles the tasks until the runtime is stopped"""
+        heartbeat = threading.Thread(
+            target=self._heartbeat, name="heartbeat", daemon=True
+        )
+        heartbeat.start()
+        try:
+            while not self._stopping.is_set():
+                capacity = self._wait_for_capacity()
+                if not capacity:
+                    continue
+                try:
+                    received = self._receive(min(capacity, MAX_MESSAGES))
+                except Exception:
+                    logger.exception("Error receiving messages")
+                    self._stopping.wait(self.retry_delay)
+                    continue
+                if not received:
+                    if self.on_idle is not None:
+                        try:
+                            self.on_idle()
+                        except Exception:
+                            logger.exception("Error running the idle task")
+                    continue
+                for queue, message in received:
+                    self._dispatch(queue, message)
+        finally:
+            self._drain()
+            self._stopped.set()
+
+    def _wait_for_capacity(self) -> int:
+        """Waits for running tasks to finish, if the runtime is at capacity,
+        and returns the number of tasks it can receive"""
+        with self._lock:
+            while len(self._in_flight) >= self.capacity and not self._stopping.is_set():
+                self._lock.wait()
+            if self._stopping.is_set():
+                return 0
+            return self.capacity - len(self._in_flight)
+
+    def _receive(self, max_messages: int) -> List[Tuple[Any, Any]]:
+        """Receives the next batch of messages, from the first queue (in
+        order of priority) with messages available"""
+        for i, queue in enumerate(self.queues):
+            last = i == len(self.queues) - 1
+            messages = queue.receive_messages(
+                MaxNumberOfMessages=max_messages,
+                WaitTimeSeconds=self.wait_time if last else 0,
+                AttributeNames=["ApproximateReceiveCount"],
+            )
+            if messages:
+                return [(queue, message) for message in messages]
+        return []
+
+    def _dispatch(self, queue: Any, message: Any):
+        """Submits the task of a message to the executor of its type"""
+        try:
+            task = decode_task(message.body)
+            executor = self.executors.get(task["task_type"], self.default_executor)
+        except Exception:
+            logger.exception(f"Unable to decode message: {message.message_id}")
+            self._dead_letter(message)
+            return
+
+        key = self.coalesce_key(task) if self.coalesce_key is not None else None
+        with self._lock:
+            duplicate = key is not None and any(
+                key == entry.key for entry in self._in_flight.values()
+            )
+            if not duplicate:
+                self._in_flight[message.message_id] = InFlight(queue, message, key)
+        if duplicate:
+            logger.info(f"Coalescing duplicate task: {key}")
+            message.delete()
+            return
+
+        try:
+            future = executor.submit(self._handle, task)
+        except Exception:
+            logger.exception(f"Unable to submit task: {task['task_type']}")
+            future = Future()
+            future.cancel()
+        with self._lock:
+            entry = self._in_flight.get(message.message_id)
+            if entry is not None:
+                self._in_flight[message.message_id] = entry._replace(future=future)
+        future.add_done_callback(partial(self._settle, message))
+
+    def _handle(self, task: dict):
+        """Handles a task"""
+        try:
+            logger.info(f"Handling task: {task['task_type']}")
+            self.handlers[task["task_type"]](**task["payload"])
+        except Exception:
+            logger.exception(f"Error handling task: {task['task_type']}")
+            raise
+
+    def _settle(self, message: Any, future: Future):
+        """Deletes the message of a task that succeeded, and retries (or
+        dead-letters) the message of a task that failed"""
+        with self._settle_lock:
+            with self._lock:
+                self._in_flight.pop(message.message_id, None)
+                self._lock.notify_all()
+            try:
+                if future.cancelled():
+                    message.change_visibility(VisibilityTimeout=0)
+                elif future.exception() is None:
+                    message.delete()
+                else:
+                    self._retry(message)
+            except Exception:
+                logger.exception(f"Error settling message: {message.message_id}")
+
+    def _retry(self, message: Any):
+        """Makes the message of a failed task visible again after a backoff, or
+        dead-letters it once its retry budget is spent"""
+        receives = int((message.attributes or {}).get("ApproximateReceiveCount", 1))
+        if receives >= self.max_receives:
+            self._dead_letter(message)
+            return
+        delay = min(self.retry_delay * 2 ** (receives - 1), MAX_VISIBILITY_TIMEOUT)
+        logger.info(
+            f"Retrying message {message.message_id} in {delay}s "
+            f"(attempt {receives} of {self.max_receives})"
+        )
+        message.change_visibility(VisibilityTimeout=delay)
+
+    def _dead_letter(self, message: Any):
+        """Moves a message to the dead-letter queue"""
+        if self.dead_letter_queue is None:
+            logger.error(
+                f"Dropping message {message.message_id}: no dead-letter queue is set up"
+            )
+        else:
+            logger.error(
+                f"Moving message {message.message_id} to the dead-letter queue"
+            )
+            self.dead_letter_queue.send_message(MessageBody=message.body)
+        message.delete()
+
+    def _heartbeat(self):
+        """Extends the visibility timeout of the messages being handled, until
+        the runtime is drained"""
+        while not self._stopped.wait(self.visibility_timeout / 3):
+            try:
+                self._extend_visibility()
+            except Exception:
+                logger.exception("Error extending the visibility of the messages")
+
+    def _extend_visibility(self):
+        """Extends the visibility timeout of the messages being handled"""
+        with self._settle_lock:
+            with self._lock:
+                in_flight = list(self._in_flight.values())
+            by_queue: Dict[int, Tuple[Any, List[Any]]] = {}
+            for entry in in_flight:
+                by_queue.setdefault(id(entry.queue), (entry.queue, []))[1].append(
+                    entry.message
+                )
+            for queue, messages in by_queue.values():
+                for start in range(0, len(messages), MAX_MESSAGES):
+                    response = queue.change_message_visibility_batch(
+                        Entries=[
+                            {
+                                "Id": str(i),
+                                "ReceiptHandle": message.receipt_handle,
+                                "VisibilityTimeout": self.visibility_timeout,
+                            }
+                            for i, message in enumerate(
+                                messages[start : start + MAX_MESSAGES]
+                            )
+                        ]
+                    )
+                    for failure in response.get("Failed", []):
+                        # eg: the task finished meanwhile
+                        logger.info(f"Unable to extend visibility: {failure}")
+
+    def _drain(self):
+        """Cancels the tasks that haven't started (their messages are released
+        once cancelled), waits for the running tasks to finish, and releases
+        the messages of the ones that don't finish in time"""
+        deadline = time.monotonic() + self.drain_timeout
+        with self._lock:
+            futures = [
+                e.future for e in self._in_flight.values() if e.future is not None
+            ]
+        cancelled = sum(future.cancel() for future in futures)
+        if cancelled:
+            logger.info(f"Cancelled {cancelled} task(s) that hadn't started")
+        with self._lock:
+            if self._in_flight:
+                logger.info(f"Draining {len(self._in_flight)} running task(s)")
+            while self._in_flight and time.monotonic() < deadline:
+                self._lock.wait(deadline - time.monotonic())
+            unfinished = list(self._in_flight.values())
+        for entry in unfinished:
+            logger.warning(f"Releasing unfinished message: {entry.message.message_id}")
+            try:
+                entry.message.change_visibility(VisibilityTimeout=0)
+            except Exception:
+                logger.exception(f"Error releasing message: {entry.message.message_id}")
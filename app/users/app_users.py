@@ -0,0 +1,148 @@
+"""In-memory directory of the app's users, indexed by sub and by group.
+
+Listing users from Cognito requires paging through `list_users_in_group` for
+every group, which is too slow to do on every request. The directory keeps
+the users in memory for `ttl` seconds and, once expired, keeps serving the
+(stale) users while a single background thread re-fetches them
+(stale-while-revalidate). Users fetched from Cognito are also saved to a
+shared store, which new containers read from on a cold start instead of
+paging through Cognito (see `app.users.directory`).
+"""
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from app.logs import logger
+from app.schemas.users import CognitoUser
+
+
+class AppUsers(dict):
+    """Dict of CognitoUsers keyed by sub. Returns a placeholder user for subs
+    that don't exist (anymore) in Cognito"""
+
+    def __missing__(self, key):
+        """Placeholder for dangling users"""
+        # NOTE: This is for showing dangling users which aren't available in cognito
+        logger.warning(f"Dangling user found: sub={key}")
+        return CognitoUser(
+            **{
+                "sub": key,
+                "preferred_username": "User Not Found",
+                "email": "unknown-user@apt.com",
+                "cognito:groups": [],
+                "is_dangling": True,
+            },
+        )
+
+
+class UserDirectory:
+    """Process-wide, TTL-bounded directory of app users. The users are fetched
+    (from Cognito) by `fetch` and, if the directory is `shared`, loaded from
+    and saved to the shared store by `load_shared` (which returns None if the
+    store is empty, or older than its `max_age`) and `save_shared`."""
+
+    def __init__(
+        self,
+        ttl: int,
+        max_stale: int,
+        shared: bool,
+        fetch: Callable[[], Dict[str, CognitoUser]],
+        load_shared: Callable[[int], Optional[Dict[str, CognitoUser]]],
+        save_shared: Callable[[Dict[str, CognitoUser]], None],
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Init directory. Users are loaded on first use."""
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.shared = shared
+        self._fetch = fetch
+        self._load_shared = load_shared
+        self._save_shared = save_shared
+        self._clock = clock
+        self._users: AppUsers = AppUsers()
+        self._by_group: Dict[str, List[str]] = {}
+        self._loaded_at: float = 0
+        self._request_id: str = ""
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _set(self, app_users: Dict[str, CognitoUser]):
+        by_group: Dict[str, List[str]] = {}
+        for sub, user in app_users.items():
+            for group in user.cognito_groups:
+                by_group.setdefault(group, []).append(sub)
+        # Swap references rather than mutating, so that readers never see a
+        # partially refreshed directory
+        self._users, self._by_group = AppUsers(app_users), by_group
+        self._loaded_at = self._clock()
+        self._request_id = str(uuid4())
+
+    def refresh(self, from_shared: bool = False):
+        """Re-loads the users, either from the shared store (if allowed, and
+        fresh enough) or from Cognito. Users fetched from Cognito are written
+        back to the shared store."""
+        if from_shared and self.shared:
+            try:
+                app_users = self._load_shared(self.max_stale)
+                if app_users:
+                    self._set(app_users)
+                    return
+            except Exception:
+                logger.exception("Unable to load users from the shared directory")
+
+        app_users = self._fetch()
+        self._set(app_users)
+
+        if self.shared:
+            try:
+                self._save_shared(app_users)
+            except Exception:
+                logger.exception("Unable to save users to the shared directory")
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def _helper():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Background refresh of the user directory failed")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=_helper, daemon=True).start()
+
+    def _ensure_loaded(self):
+        age = self._clock() - self._loaded_at
+        if not self._request_id or age > self.max_stale:
+            with self._lock:
+                # Another thread may have loaded the users while we were
+                # waiting for the lock
+                if not self._request_id or (
+                    self._clock() - self._loaded_at > self.max_stale
+                ):
+                    self.refresh(from_shared=not self._request_id)
+            return
+        if age > self.ttl:
+            self._refresh_in_background()
+
+    def users(self) -> Tuple[AppUsers, str]:
+        """Returns all the app users (keyed by sub) and an id identifying the
+        load that produced them"""
+        self._ensure_loaded()
+        return self._users, self._request_id
+
+    def subs_in_group(self, group: str) -> List[str]:
+        """Returns the subs of all the users in a group (eg: all curators)"""
+        self._ensure_loaded()
+        return self._by_group.get(group, [])
+
+    def users_in_group(self, group: str) -> List[CognitoUser]:
+        """Returns all the users in a group (eg: all curators)"""
+        self._ensure_loaded()
+        app_users = self._users
+        return [app_users[sub] for sub in self._by_group.get(group, [])]
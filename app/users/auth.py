@@ -2,12 +2,12 @@
 import time
 from typing import Dict, Union
 
-import requests  # type: ignore
 from jose import jwk, jwt
 from jose.utils import base64url_decode
 
 from app import config
 from app.schemas.users import CognitoUser, User
+from app.users.token_caches import JwksCache, ValidatedTokenCache
 
 from fastapi import Depends, HTTPException, Request, security
 
@@ -60,19 +60,29 @@ def require_user(user: User = Depends(get_user)) -> User:
     return user
 
 
+jwks_cache = JwksCache(
+    url=config.COGNITO_KEYS_URL,
+    ttl=config.COGNITO_KEYS_CACHE_TTL,
+    construct_key=jwk.construct,
+)
+validated_tokens = ValidatedTokenCache(maxsize=config.VALIDATED_TOKENS_CACHE_SIZE)
+
+
 def validate_token(token: str) -> User:
     """
     Does the ground work of unpacking the token, decrypting it using
-    cognito's public key, and returning the claims contained within
+    cognito's public key, and returning the claims contained within.
+    Tokens that have already been validated are served from the
+    `validated_tokens` cache, skipping signature verification.
     """
 
-    keys = requests.get(config.COGNITO_KEYS_URL).json()["keys"]
+    claims = validated_tokens.get(token)
+    if claims is not None:
+        return CognitoUser(**claims)
 
     headers = jwt.get_unverified_headers(token)
 
-    [kid] = [k for k in keys if k["kid"] == headers["kid"]]
-
-    public_key = jwk.construct(kid)
+    public_key = jwks_cache.get(headers["kid"])
 
     message, encoded_signature = str(token).rsplit(".", 1)
 
@@ -91,4 +101,6 @@ def validate_token(token: str) -> User:
             status_code=400, detail="Token was not issued for this app client"
         )
 
+    validated_tokens.set(token, claims)
+
     return CognitoUser(**claims)
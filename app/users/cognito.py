@@ -1,18 +1,17 @@
 """Module with functionality related to querying cognito users, and merging
 (sometime anonymously) user info with Atbds, AtbdVersions, Threads and Comments
 as needed"""
-import functools
 from typing import List, Union
-from uuid import uuid4
 
 from app import config
 from app.api.utils import cognito_client
 from app.db.models import Atbds, AtbdVersions, Comments, Threads
 from app.email import notifications
-from app.logs import logger
 from app.permissions import check_permissions
 from app.schemas import users, versions
 from app.users.auth import get_user
+from app.users.directory import APP_GROUPS, AppUsers, user_directory
+from app.users.hydrator import ContributorInfoHydrator
 
 import fastapi_permissions as permissions
 from fastapi import BackgroundTasks, Depends, HTTPException
@@ -29,6 +28,14 @@ def get_active_user_principals(user: users.User = Depends(get_user)) -> List[str
     return principals
 
 
+def contributor_info_hydrator(principals: List[str]) -> ContributorInfoHydrator:
+    """Hydrator for the users of the user directory"""
+    app_users, _ = list_cognito_users()
+    return ContributorInfoHydrator(
+        principals, app_users, user_directory.subs_in_group("curator")
+    )
+
+
 def update_user_info(
     principals: List[str],
     atbd_version: AtbdVersions,
@@ -40,71 +47,7 @@ def update_user_info(
     based on the wether or not the user is the owner, an author or a reviewer of the
     document.
     """
-    app_users, _ = list_cognito_users()
-
-    version_acl = atbd_version.__acl__()
-
-    contributors = {
-        "owner": [atbd_version.owner],
-        "authors": atbd_version.authors,
-        "reviewers": [r["sub"] for r in atbd_version.reviewers],
-        "curators": [
-            u.sub for u in app_users.values() if "curator" in u.cognito_groups
-        ],
-    }
-    for attr in ["created_by", "last_updated_by", "published_by"]:
-
-        try:
-            user_sub = getattr(data_model, attr)
-        # published_by field is only relevant to AtbdVersions, not
-        # Atbds, Threads or Comments. In those cases, if the published_by
-        # attribute is not present, skip it.
-        except AttributeError:
-            continue
-
-        # The `published_by` field IS present but it's value
-        # is none because the document hasn't been published yet.
-        # Skip.
-        if user_sub is None:
-            continue
-
-        # This means the user sub for one of the `created_by`, `last_updated_by` or `published_by`
-        # fields is not found within the `owner`, `authors`, `reviewers` lists. This can happen if
-        # a curator removes an author from an ATBD version, for example.
-        if not any([user_sub in i for i in contributors.values()]):
-            setattr(
-                data_model,
-                attr,
-                users.AnonymousUser(preferred_username="Unknown User").dict(
-                    by_alias=True
-                ),
-            )
-            continue
-        for contributor_type, contributor_subs in contributors.items():
-
-            if user_sub not in contributor_subs:
-                continue
-
-            if check_permissions(
-                principals=principals,
-                action=f"view_{contributor_type}",
-                acl=version_acl,
-                raise_exception=False,
-            ):
-                setattr(data_model, attr, app_users[user_sub].dict(by_alias=True))
-            else:
-                preferred_username = contributor_type.strip("s").title()
-                if contributor_type != "owner":
-                    preferred_username += f" {contributor_subs.index(user_sub)+1}"
-
-                setattr(
-                    data_model,
-                    attr,
-                    users.AnonymousUser(preferred_username=preferred_username).dict(
-                        by_alias=True
-                    ),
-                )
-    return data_model
+    return contributor_info_hydrator(principals).user_info(atbd_version, data_model)
 
 
 def update_thread_contributor_info(
@@ -114,18 +57,7 @@ def update_thread_contributor_info(
     Adds user info for `created_by` and `last_updated_fields` to a thread
     and all comments contained within the thread
     """
-    thread.comments = [
-        update_user_info(
-            principals=principals, atbd_version=atbd_version, data_model=comment
-        )
-        for comment in thread.comments
-    ]
-
-    thread = update_user_info(
-        principals=principals, atbd_version=atbd_version, data_model=thread
-    )
-
-    return thread
+    return contributor_info_hydrator(principals).thread(atbd_version, thread)
 
 
 def update_version_contributor_info(principals: List[str], version: AtbdVersions):
@@ -141,68 +73,7 @@ def update_version_contributor_info(principals: List[str], version: AtbdVersions
     of the users, anonymized as needed, based on the principals of the
     user requesting/accessing the information.
     """
-    app_users, request_id = list_cognito_users()
-
-    version_acl = version.__acl__()
-
-    # Update `created_by`, `last_updated_by` and `published_by` fields
-    version = update_user_info(
-        principals=principals, atbd_version=version, data_model=version
-    )
-
-    if check_permissions(
-        principals=principals,
-        action="view_owner",
-        acl=version_acl,
-        raise_exception=False,
-    ):
-        version.owner = app_users[version.owner].dict(by_alias=True)
-    else:
-        version.owner = users.AnonymousUser(preferred_username="Owner").dict(
-            by_alias=True
-        )
-
-    if check_permissions(
-        principals=principals,
-        action="view_authors",
-        acl=version_acl,
-        raise_exception=False,
-    ):
-        version.authors = [
-            app_users[author].dict(by_alias=True) for author in version.authors
-        ]
-    else:
-        version.authors = [
-            users.AnonymousUser(preferred_username=f"Author {str(i+1)}").dict(
-                by_alias=True
-            )
-            for i, _ in enumerate(version.authors)
-        ]
-
-    if check_permissions(
-        principals=principals,
-        action="view_reviewers",
-        acl=version_acl,
-        raise_exception=False,
-    ):
-
-        version.reviewers = [
-            users.ReviewerUser(
-                **app_users[reviewer["sub"]].dict(by_alias=True),
-                review_status=reviewer["review_status"],
-            ).dict(by_alias=True)
-            for reviewer in version.reviewers
-        ]
-    else:
-        version.reviewers = [
-            users.AnonymousReviewerUser(
-                preferred_username=f"Reviewer {str(i+1)}",
-                review_status=v["review_status"],
-            ).dict(by_alias=True)
-            for i, v in enumerate(version.reviewers)
-        ]
-
-    return version
+    return contributor_info_hydrator(principals).version(version)
 
 
 def update_atbd_contributor_info(principals: List[str], atbd: Atbds) -> Atbds:
@@ -214,69 +85,51 @@ def update_atbd_contributor_info(principals: List[str], atbd: Atbds) -> Atbds:
     and Owners cannot see identifying info of reviewers, but can
     see identifying info of other authors)
     """
+    return contributor_info_hydrator(principals).atbd(atbd)
 
-    atbd.versions = [
-        update_version_contributor_info(principals=principals, version=version)
-        for version in atbd.versions
-    ]
 
-    return atbd
+def update_atbds_contributor_info(
+    principals: List[str], atbds: List[Atbds]
+) -> List[Atbds]:
+    """
+    Batch version of `update_atbd_contributor_info`, for list endpoints:
+    permissions are evaluated once per version and each contributor is
+    serialized once for the whole list of ATBDs.
+    """
+    hydrator = contributor_info_hydrator(principals)
+    return [hydrator.atbd(atbd) for atbd in atbds]
 
 
-@functools.lru_cache()
 def list_cognito_users(groups="curator,contributor"):
     """
     Returns a list of ALL cognito users, to be filtered against the
     users of a document (authors, reviewers, owner). Returns a unique
-    ID alongside the resulting app_users array in order to validate
-    that the function call was indeed cached.
+    ID alongside the resulting app_users array, identifying the load
+    of the user directory the users were served from.
 
     Accepts a parameters specifying which group to list (listing both
     the `contributor` and ` the `curator` groups by default). The
-    parameter must a string with group names separated by a comma. This
-    is because the function's parameters must be hashable in order to
-    be stored in the LRU cache, since it stores a hashmap of the input
-    parameters along with the function's output.
-    """
-    # We need the cognito groups in the user info returned, in order to
-    # verify certain operations (eg: users can only be added as co-authors
-    # if they are part of the contributor user group, not the curator).
-    # The `list_users` operation does not return the groups the user belongs
-    # to, so instead we are listing the users in each group and adding
-    # the group manually to returned data. It's not pretty. I know.
-
-    class AppUsers(dict):
-        def __missing__(self, key):
-            # NOTE: This is for showing dangling users which aren't available in cognito
-            logger.warning(f"Dangling user found: sub={key}")
-            return users.CognitoUser(
-                **{
-                    "sub": key,
-                    "preferred_username": "User Not Found",
-                    "email": "unknown-user@apt.com",
-                    "cognito:groups": [],
-                    "is_dangling": True,
-                },
-            )
-
-    app_users = {}
-    client = cognito_client()
-    for group in groups.split(","):
+    parameter must a string with group names separated by a comma.
 
-        paginator = client.get_paginator("list_users_in_group")
-        response = paginator.paginate(UserPoolId=config.USER_POOL_ID, GroupName=group)
+    Users are served from the process-wide `user_directory`, which
+    refreshes itself from Cognito once its TTL has expired.
+    """
+    app_users, request_id = user_directory.users()
 
-        for page in response:
-            for user in page.get("Users", []):
-                if user["Username"] in app_users:
-                    # Only update group info
-                    app_users[user["Username"]].cognito_groups.append(group)
-                else:
-                    app_users[user["Username"]] = users.CognitoUser(
-                        **{**user, "cognito:groups": [group]}
-                    )
+    group_names = groups.split(",")
+    if set(group_names) == set(APP_GROUPS):
+        return app_users, request_id
 
-    return (AppUsers(app_users), str(uuid4()))
+    return (
+        AppUsers(
+            {
+                sub: app_users[sub]
+                for group in group_names
+                for sub in user_directory.subs_in_group(group)
+            }
+        ),
+        request_id,
+    )
 
 
 def get_cognito_user(sub: str):
@@ -312,7 +165,7 @@ def process_users_input(
         check_permissions(
             principals=principals,
             action="invite_reviewers",
-            acl=atbd_version.__acl__(),
+            acl=atbd_version,
         )
 
         for reviewer in version_input.reviewers:
@@ -325,7 +178,7 @@ def process_users_input(
             check_permissions(
                 principals=get_active_user_principals(cognito_reviewer),
                 action="join_reviewers",
-                acl=atbd_version.__acl__(),
+                acl=atbd_version,
             )
             # skip notifying reviewers who are already assigned to the document
             if reviewer in [r["sub"] for r in atbd_version.reviewers]:
@@ -360,7 +213,7 @@ def process_users_input(
         check_permissions(
             principals=principals,
             action="invite_authors",
-            acl=atbd_version.__acl__(),
+            acl=atbd_version,
         )
 
         for author in version_input.authors:
@@ -372,7 +225,7 @@ def process_users_input(
             check_permissions(
                 principals=get_active_user_principals(cognito_author),
                 action="join_authors",
-                acl=atbd_version.__acl__(),
+                acl=atbd_version,
             )
             # Skip notification for authors who are already
             # assigned to the document
@@ -391,7 +244,7 @@ def process_users_input(
         check_permissions(
             principals=principals,
             action="offer_ownership",
-            acl=atbd_version.__acl__(),
+            acl=atbd_version,
         )
 
         if version_input.owner not in app_users:
@@ -405,7 +258,7 @@ def process_users_input(
         check_permissions(
             principals=get_active_user_principals(cognito_owner),
             action="receive_ownership",
-            acl=atbd_version.__acl__(),
+            acl=atbd_version,
         )
         user_notifications.append(
             {
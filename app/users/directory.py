@@ -0,0 +1,114 @@
+"""Process-wide directory of the app's Cognito users (see
+`app.users.app_users`), kept in memory for `USER_DIRECTORY_TTL` seconds. Users
+fetched from Cognito are also written to the `cognito_users` table, which new
+containers read from on a cold start instead of paging through Cognito.
+"""
+import datetime
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import func
+
+from app import config
+from app.api.utils import cognito_client
+from app.db.db_session import DbSession
+from app.db.models import CognitoUsers
+from app.schemas import users
+from app.users.app_users import AppUsers, UserDirectory  # noqa: F401
+
+APP_GROUPS = ("curator", "contributor")
+
+
+def fetch_cognito_users(
+    groups: Iterable[str] = APP_GROUPS,
+) -> Dict[str, users.CognitoUser]:
+    """
+    Pages through the users of each group in Cognito.
+
+    The `list_users` operation does not return the groups the user belongs
+    to, so instead we are listing the users in each group and adding
+    the group manually to returned data.
+    """
+    app_users: Dict[str, users.CognitoUser] = {}
+    client = cognito_client()
+    for group in groups:
+
+        paginator = client.get_paginator("list_users_in_group")
+        response = paginator.paginate(UserPoolId=config.USER_POOL_ID, GroupName=group)
+
+        for page in response:
+            for user in page.get("Users", []):
+                if user["Username"] in app_users:
+                    # Only update group info
+                    app_users[user["Username"]].cognito_groups.append(group)
+                else:
+                    app_users[user["Username"]] = users.CognitoUser(
+                        **{**user, "cognito:groups": [group]}
+                    )
+    return app_users
+
+
+def load_shared_users(max_age: int) -> Optional[Dict[str, users.CognitoUser]]:
+    """Reads the users from the shared `cognito_users` table. Returns None if
+    the table is empty or was last refreshed more than `max_age` seconds ago"""
+    db = DbSession()
+    try:
+        refreshed_at = db.query(func.min(CognitoUsers.updated_at)).scalar()
+        if refreshed_at is None or (
+            datetime.datetime.utcnow() - refreshed_at
+        ) > datetime.timedelta(seconds=max_age):
+            return None
+        return {
+            u.sub: users.CognitoUser(
+                sub=u.sub,
+                email=u.email,
+                preferred_username=u.preferred_username,
+                **{"cognito:groups": list(u.cognito_groups)},
+            )
+            for u in db.query(CognitoUsers).all()
+        }
+    finally:
+        db.close()
+
+
+def save_shared_users(app_users: Dict[str, users.CognitoUser]):
+    """Replaces the content of the shared `cognito_users` table"""
+    db = DbSession()
+    try:
+        now = datetime.datetime.utcnow()
+        db.query(CognitoUsers).delete(synchronize_session=False)
+        db.bulk_insert_mappings(
+            CognitoUsers,
+            [
+                dict(
+                    sub=u.sub,
+                    email=u.email,
+                    preferred_username=u.preferred_username,
+                    cognito_groups=u.cognito_groups,
+                    updated_at=now,
+                )
+                for u in app_users.values()
+            ],
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+user_directory = UserDirectory(
+    ttl=config.USER_DIRECTORY_TTL,
+    max_stale=config.USER_DIRECTORY_MAX_STALE,
+    shared=config.FEATURE_FLAGS["SHARED_USER_DIRECTORY"],
+    fetch=fetch_cognito_users,
+    load_shared=load_shared_users,
+    save_shared=save_shared_users,
+)
+
+
+def refresh_user_directory():
+    """Worker task (queued every few minutes by an EventBridge schedule, see
+    the stack): re-fetches the users from Cognito and refreshes the shared
+    `cognito_users` table, so that new API containers start warm"""
+    user_directory.refresh()
@@ -0,0 +1,200 @@
+"""Merges (sometimes anonymized) user info into ATBDs, AtbdVersions, Threads
+and Comments, based on the principals of the user performing the request.
+The users are provided by the caller (see `app.users.cognito`)."""
+from typing import Dict, List, Mapping, Tuple, Union
+
+from app.db.models import Atbds, AtbdVersions, Comments, Threads
+from app.permissions import check_permissions
+from app.schemas import users
+
+
+def _copy(user: Dict) -> Dict:
+    """Copy of a serialized user (whose values are strings, booleans or lists
+    of strings): the users are serialized once, but each hydrated object gets
+    its own copy, which the caller may modify"""
+    return {
+        key: list(value) if isinstance(value, list) else value
+        for key, value in user.items()
+    }
+
+
+class ContributorInfoHydrator:
+    """
+    Replaces the cognito subs found in the `owner`, `authors`, `reviewers`,
+    `created_by`, `last_updated_by` and `published_by` fields with user info,
+    anonymized based on the principals of the user performing the request.
+
+    A single hydrator can be used for any number of ATBDs, versions, threads
+    and comments: the version ACL and the resulting `view_*` permission
+    decisions are computed once per version, and each user is only serialized
+    once, no matter how many documents they contribute to (each document
+    getting a copy of the serialized user).
+    """
+
+    CONTRIBUTOR_TYPES = ["owner", "authors", "reviewers", "curators"]
+
+    def __init__(
+        self,
+        principals: List[str],
+        app_users: Mapping[str, users.CognitoUser],
+        curators: List[str],
+    ):
+        """Init hydrator, with the users of the app (by sub) and the subs of
+        the curators"""
+        self.principals = principals
+        self.app_users = app_users
+        self.curators = curators
+        self._users: Dict[str, Dict] = {}
+        self._anonymous_users: Dict[str, Dict] = {}
+        self._permissions: Dict[Tuple[int, int], Dict[str, bool]] = {}
+
+    def user(self, sub: str) -> Dict:
+        """Serialized (non anonymized) user info"""
+        if sub not in self._users:
+            self._users[sub] = self.app_users[sub].dict(by_alias=True)
+        return _copy(self._users[sub])
+
+    def anonymous_user(self, preferred_username: str) -> Dict:
+        """Serialized anonymous user info"""
+        if preferred_username not in self._anonymous_users:
+            self._anonymous_users[preferred_username] = users.AnonymousUser(
+                preferred_username=preferred_username
+            ).dict(by_alias=True)
+        return _copy(self._anonymous_users[preferred_username])
+
+    def permissions(self, atbd_version: AtbdVersions) -> Dict[str, bool]:
+        """Returns, for each contributor type, wether or not the principals are
+        allowed to view the identifying info of that type of contributor"""
+        key = (atbd_version.atbd_id, atbd_version.major)
+        if key not in self._permissions:
+            self._permissions[key] = {
+                contributor_type: check_permissions(
+                    principals=self.principals,
+                    action=f"view_{contributor_type}",
+                    acl=atbd_version,
+                    raise_exception=False,
+                )
+                for contributor_type in self.CONTRIBUTOR_TYPES
+            }
+        return self._permissions[key]
+
+    def contributors(self, atbd_version: AtbdVersions) -> Dict[str, List[str]]:
+        """Cognito subs of the contributors of a version, by contributor type"""
+        return {
+            "owner": [atbd_version.owner],
+            "authors": atbd_version.authors,
+            "reviewers": [r["sub"] for r in atbd_version.reviewers],
+            "curators": self.curators,
+        }
+
+    def user_info(
+        self,
+        atbd_version: AtbdVersions,
+        data_model: Union[Comments, Threads, AtbdVersions],
+        contributors: Dict[str, List[str]] = None,
+    ):
+        """
+        Replaces the `created_by`, `last_updated_by` and `published_by` fields
+        found in several of the application's data models with a cognito user,
+        appropriately anonymized based on the wether or not the user is the
+        owner, an author or a reviewer of the document.
+        """
+        if contributors is None:
+            contributors = self.contributors(atbd_version)
+        allowed = self.permissions(atbd_version)
+
+        for attr in ["created_by", "last_updated_by", "published_by"]:
+
+            try:
+                user_sub = getattr(data_model, attr)
+            # published_by field is only relevant to AtbdVersions, not
+            # Atbds, Threads or Comments. In those cases, if the published_by
+            # attribute is not present, skip it.
+            except AttributeError:
+                continue
+
+            # The `published_by` field IS present but it's value
+            # is none because the document hasn't been published yet.
+            # Skip.
+            if user_sub is None:
+                continue
+
+            # This means the user sub for one of the `created_by`, `last_updated_by` or `published_by`
+            # fields is not found within the `owner`, `authors`, `reviewers` lists. This can happen if
+            # a curator removes an author from an ATBD version, for example.
+            if not any([user_sub in i for i in contributors.values()]):
+                setattr(data_model, attr, self.anonymous_user("Unknown User"))
+                continue
+            for contributor_type, contributor_subs in contributors.items():
+
+                if user_sub not in contributor_subs:
+                    continue
+
+                if allowed[contributor_type]:
+                    setattr(data_model, attr, self.user(user_sub))
+                else:
+                    preferred_username = contributor_type.strip("s").title()
+                    if contributor_type != "owner":
+                        preferred_username += f" {contributor_subs.index(user_sub)+1}"
+
+                    setattr(data_model, attr, self.anonymous_user(preferred_username))
+        return data_model
+
+    def thread(self, atbd_version: AtbdVersions, thread: Threads) -> Threads:
+        """
+        Adds user info for `created_by` and `last_updated_fields` to a thread
+        and all comments contained within the thread
+        """
+        contributors = self.contributors(atbd_version)
+        thread.comments = [
+            self.user_info(atbd_version, comment, contributors=contributors)
+            for comment in thread.comments
+        ]
+        return self.user_info(atbd_version, thread, contributors=contributors)
+
+    def version(self, version: AtbdVersions) -> AtbdVersions:
+        """
+        Replaces the cognito subs of the `created_by`, `last_updated_by`,
+        `published_by`, `owner`, `authors` and `reviewers` fields of a version
+        """
+        allowed = self.permissions(version)
+
+        # Update `created_by`, `last_updated_by` and `published_by` fields
+        version = self.user_info(version, version)
+
+        if allowed["owner"]:
+            version.owner = self.user(version.owner)
+        else:
+            version.owner = self.anonymous_user("Owner")
+
+        if allowed["authors"]:
+            version.authors = [self.user(author) for author in version.authors]
+        else:
+            version.authors = [
+                self.anonymous_user(f"Author {str(i+1)}")
+                for i, _ in enumerate(version.authors)
+            ]
+
+        if allowed["reviewers"]:
+            version.reviewers = [
+                users.ReviewerUser(
+                    **self.user(reviewer["sub"]),
+                    review_status=reviewer["review_status"],
+                ).dict(by_alias=True)
+                for reviewer in version.reviewers
+            ]
+        else:
+            version.reviewers = [
+                users.AnonymousReviewerUser(
+                    preferred_username=f"Reviewer {str(i+1)}",
+                    review_status=v["review_status"],
+                ).dict(by_alias=True)
+                for i, v in enumerate(version.reviewers)
+            ]
+
+        return version
+
+    def atbd(self, atbd: Atbds) -> Atbds:
+        """Replaces the cognito subs of all the versions of an ATBD"""
+        atbd.versions = [self.version(version) for version in atbd.versions]
+        return atbd
@@ -0,0 +1,124 @@
+"""Process-wide caches used to validate the user tokens (see `app.users.auth`):
+the signing keys of Cognito, and the claims of the already validated tokens"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import requests  # type: ignore
+
+from fastapi import HTTPException
+
+
+def fetch_keys(url: str) -> List[Dict]:
+    """JSON web keys of a JWKS endpoint"""
+    return requests.get(url, timeout=10).json()["keys"]
+
+
+class JwksCache:
+    """
+    Process-wide cache of Cognito's public signing keys, indexed by `kid`.
+    Keys are constructed (by `construct_key`) once per refresh and expire
+    after `ttl` seconds. A token signed with an unknown `kid` (eg: after a key
+    rotation) triggers at most one refresh, shared by all the requests waiting
+    on it.
+    """
+
+    # Min number of seconds between two refreshes triggered by an unknown `kid`
+    MIN_REFRESH_INTERVAL = 30
+
+    def __init__(
+        self,
+        url: str,
+        ttl: int,
+        construct_key: Callable[[Dict], Any],
+        fetch: Callable[[str], List[Dict]] = fetch_keys,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Init cache. Keys are only fetched on first use."""
+        self.url = url
+        self.ttl = ttl
+        self._construct_key = construct_key
+        self._fetch = fetch
+        self._clock = clock
+        self._keys: Dict[str, Any] = {}
+        self._fetched_at: Optional[float] = None
+        # Incremented on each refresh
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _refresh(self, generation: int):
+        """Re-fetches the JWKS, unless another thread already did so since
+        `generation` (single-flight: callers blocked on the lock re-use the
+        result of the refresh that was in progress)"""
+        with self._lock:
+            if self._generation != generation:
+                return
+            keys = self._fetch(self.url)
+            self._keys = {k["kid"]: self._construct_key(k) for k in keys}
+            self._fetched_at = self._clock()
+            self._generation += 1
+
+    def get(self, kid: str):
+        """Returns the public key for `kid`, refreshing the keys if they are
+        expired or if the `kid` is not known"""
+        generation, fetched_at = self._generation, self._fetched_at
+        age = None if fetched_at is None else self._clock() - fetched_at
+        unknown_kid = kid not in self._keys and (
+            age is None or age > self.MIN_REFRESH_INTERVAL
+        )
+        if age is None or age > self.ttl or unknown_kid:
+            # A single refresh covers both expiry and unknown `kid`s (eg: after
+            # a key rotation). Unknown `kid`s only trigger a refresh if the keys
+            # weren't just fetched, so that tokens signed by bogus keys can't
+            # be used to hammer the JWKS endpoint.
+            self._refresh(generation)
+
+        if kid not in self._keys:
+            raise HTTPException(status_code=400, detail="Unknown token signing key")
+        return self._keys[kid]
+
+
+class ValidatedTokenCache:
+    """
+    Bounded LRU of the claims of already validated tokens, keyed by the
+    token's hash. Entries are dropped once the token expires, so a cached
+    token never outlives its `exp` claim.
+    """
+
+    def __init__(self, maxsize: int, clock: Callable[[], float] = time.time):
+        """Init cache (`clock` returns the current epoch time)"""
+        self.maxsize = maxsize
+        self._clock = clock
+        self._claims: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str) -> Optional[Dict]:
+        """Returns the cached claims for a token, or None if the token
+        hasn't been validated or has expired"""
+        key = self._key(token)
+        with self._lock:
+            claims = self._claims.get(key)
+            if claims is None:
+                return None
+            if self._clock() > claims["exp"]:
+                del self._claims[key]
+                return None
+            self._claims.move_to_end(key)
+            return claims
+
+    def set(self, token: str, claims: Dict):
+        """Caches the claims of a validated token"""
+        if self.maxsize <= 0:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._claims[key] = claims
+            self._claims.move_to_end(key)
+            while len(self._claims) > self.maxsize:
+                self._claims.popitem(last=False)
@@ -5,14 +5,41 @@ from functools import wraps
 from app import config
 
 
-def get_task_queue():
-    """Returns the SQS queue for background tasks"""
+def has_priority_task_queue() -> bool:
+    """Whether a queue is set up for the tasks to run ahead of the others"""
+    return bool(
+        getattr(config, "PRIORITY_TASK_QUEUE_NAME", None)
+        or getattr(config, "PRIORITY_TASK_QUEUE_URL", None)
+    )
+
+
+def get_task_queue(priority: bool = False):
+    """Returns the SQS queue for background tasks (or the priority queue, if
+    requested and set up)"""
+    if priority and has_priority_task_queue():
+        if hasattr(config, "TASK_QUEUE_NAME"):
+            return config.sqs.get_queue_by_name(
+                QueueName=config.PRIORITY_TASK_QUEUE_NAME
+            )
+        return config.sqs.Queue(config.PRIORITY_TASK_QUEUE_URL)
     if hasattr(config, "TASK_QUEUE_NAME"):
         return config.sqs.get_queue_by_name(QueueName=config.TASK_QUEUE_NAME)
     else:
         return config.sqs.Queue(config.TASK_QUEUE_URL)
 
 
+def get_dead_letter_task_queue():
+    """Returns the SQS queue the tasks that keep failing are moved to, if set
+    up"""
+    if getattr(config, "DEAD_LETTER_TASK_QUEUE_NAME", None):
+        return config.sqs.get_queue_by_name(
+            QueueName=config.DEAD_LETTER_TASK_QUEUE_NAME
+        )
+    if getattr(config, "DEAD_LETTER_TASK_QUEUE_URL", None):
+        return config.sqs.Queue(config.DEAD_LETTER_TASK_QUEUE_URL)
+    return None
+
+
 def run_once(f):
     """
     # From https://stackoverflow.com/a/4104188/3436502
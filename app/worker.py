@@ -1,27 +1,49 @@
 """Worker for the background task queue
 
-In development mode, the worker runs as a Python script in a separate container.
-In production mode, the worker runs as a Lambda function attached to an SQS queue.
+In development mode, the worker runs as a Python script in a separate container
+(see `app.task_runtime`). In production mode, the worker runs as a Lambda
+function attached to the SQS queues.
 
-Currently, the only task is to generate PDFs. But in the future, we can add
-other types of tasks as background tasks as required.
+The PDFs of published versions and the journal PDFs are queued to a priority
+queue (if set up), which is polled ahead of the other one.
 """
 
-import base64
-import pickle
+import multiprocessing
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 
 from app import config
+from app.email.notifications import send_notifications
 from app.logs import logger
-from app.pdf.utils import make_pdf
-from app.search.opensearch import rebuild_atbd_index
-from app.utils import get_task_queue
+from app.pdf.utils import collect_pdfs, make_pdf, render_threads
+from app.search.outbox import drain_search_outbox
+from app.search.reindex import rebuild_atbd_index, reconcile_atbd_index
+from app.task_runtime import TaskRuntime, decode_task
+from app.users.directory import refresh_user_directory
+from app.utils import (
+    get_dead_letter_task_queue,
+    get_task_queue,
+    has_priority_task_queue,
+)
+
+# While the priority queue is empty, the worker waits for messages of the other
+# queue for a shorter time, so that it picks up the priority tasks soon after
+# they're queued
+WAIT_TIME = 20
+WAIT_TIME_WITH_PRIORITY_QUEUE = 5
 
 
 def get_task_handlers():
     """Returns a dictionary of task handlers"""
     return {
+        "collect_pdfs": collect_pdfs,
+        "drain_search_outbox": drain_search_outbox,
         "make_pdf": make_pdf,
         "rebuild_atbd_index": rebuild_atbd_index,
+        "reconcile_atbd_index": reconcile_atbd_index,
+        "refresh_user_directory": refresh_user_directory,
+        "send_notifications": send_notifications,
     }
 
 
@@ -33,35 +55,137 @@ def handle_task(task):
     handler(**task_payload)
 
 
-def lambda_handler(event, context):
-    """Lambda handler for the background task queue"""
-    for record in event["Records"]:
-        task = pickle.loads(base64.b64decode(record["body"].encode()))
+def coalesce_key(task) -> Optional[str]:
+    """Key of the duplicate tasks (rendering the same PDF), handled once"""
+    if task["task_type"] == "make_pdf":
+        return task["payload"]["filepath"]
+    return None
+
+
+def _handle_task(task) -> Optional[Exception]:
+    """Handles a task, and returns the error raised if it failed"""
+    try:
+        logger.info(f"Handling task: {task['task_type']}")
         handle_task(task)
+    except Exception as e:
+        logger.exception(f"Error handling task: {task['task_type']}")
+        return e
+    return None
 
 
-def worker():
-    """Listens to an SQS queue for PDF generation requests"""
-    while True:
-        # get the next task
-        task_queue = get_task_queue()
-        messages = task_queue.receive_messages(
-            MaxNumberOfMessages=1, WaitTimeSeconds=20
+def handle_tasks(tasks: List[dict]) -> List[Optional[Exception]]:
+    """Handles a batch of tasks, and returns the error raised by each task
+    (None for the ones that succeeded).
+
+    The duplicate tasks are coalesced, and the PDFs are rendered concurrently
+    by up to `PDF_RENDER_CONCURRENCY` threads. The other tasks are handled one
+    after the other."""
+    keys = [coalesce_key(task) or i for i, task in enumerate(tasks)]
+    unique = {}
+    for key, task in zip(keys, tasks):
+        unique.setdefault(key, task)
+
+    pdf_tasks = {k: t for k, t in unique.items() if t["task_type"] == "make_pdf"}
+    errors = {
+        key: _handle_task(task) for key, task in unique.items() if key not in pdf_tasks
+    }
+    if pdf_tasks:
+        errors.update(
+            zip(pdf_tasks.keys(), render_threads.map(_handle_task, pdf_tasks.values()))
         )
-        if not messages:
-            continue
+    return [errors[key] for key in keys]
+
 
-        message = messages[0]
+def lambda_handler(event, context):
+    """Lambda handler for the background task queues. Only the messages of the
+    failed tasks are retried (and eventually moved to the dead-letter queue)"""
+    records = event["Records"]
+    tasks = []
+    for record in records:
         try:
-            task = pickle.loads(base64.b64decode(message.body.encode()))
-            logger.info(f"Handling task: {task}")
-            handle_task(task)
+            tasks.append(decode_task(record["body"]))
         except Exception:
-            logger.exception(f"Error handling task: {task}")
-        finally:
-            message.delete()
+            logger.exception(f"Unable to decode message: {record['messageId']}")
+            tasks.append(None)
+
+    errors = iter(handle_tasks([task for task in tasks if task is not None]))
+    failed = [
+        {"itemIdentifier": record["messageId"]}
+        for record, task in zip(records, tasks)
+        if task is None or next(errors) is not None
+    ]
+    return {"batchItemFailures": failed}
+
+
+def get_task_queues() -> list:
+    """Returns the task queues, in order of priority"""
+    queues = [get_task_queue()]
+    if has_priority_task_queue():
+        queues.insert(0, get_task_queue(priority=True))
+    return queues
+
+
+def worker():
+    """Handles the tasks of the SQS queues until SIGTERM"""
+    default_executor = ThreadPoolExecutor(
+        max_workers=config.WORKER_THREADS, thread_name_prefix="task"
+    )
+    runtime = TaskRuntime(
+        queues=get_task_queues(),
+        handlers=get_task_handlers(),
+        # PDFs are rendered by threads keeping their browser
+        executors={"make_pdf": render_threads},
+        default_executor=default_executor,
+        capacity=config.WORKER_THREADS + render_threads.workers,
+        visibility_timeout=config.TASK_VISIBILITY_TIMEOUT,
+        max_receives=config.TASK_MAX_RECEIVES,
+        retry_delay=config.TASK_RETRY_DELAY,
+        dead_letter_queue=get_dead_letter_task_queue(),
+        wait_time=(
+            WAIT_TIME_WITH_PRIORITY_QUEUE if has_priority_task_queue() else WAIT_TIME
+        ),
+        drain_timeout=config.WORKER_DRAIN_TIMEOUT,
+        coalesce_key=coalesce_key,
+        # Applies the search index changes whose signal may have been lost
+        on_idle=drain_search_outbox,
+    )
+    runtime.install_signal_handlers()
+    try:
+        runtime.run()
+    finally:
+        default_executor.shutdown(wait=False)
+        render_threads.close()
+    logger.info("Worker stopped")
+
+
+def main():
+    """Runs `WORKER_PROCESSES` worker processes, stopped (and drained) on
+    SIGTERM"""
+    if config.WORKER_PROCESSES <= 1:
+        worker()
+        return
+
+    # Spawned (rather than forked) processes don't share the clients and
+    # connections of this one
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=worker, name=f"worker-{i}")
+        for i in range(config.WORKER_PROCESSES)
+    ]
+    for process in processes:
+        process.start()
+
+    def stop(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, stop)
+    for process in processes:
+        process.join()
 
 
 if __name__ == "__main__":
     logger.info("Starting the worker")
-    worker()
+    main()
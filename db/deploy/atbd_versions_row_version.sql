@@ -0,0 +1,29 @@
+-- Deploy nasa-apt:atbd_versions_row_version to pg
+-- requires: document_jsonb
+
+-- Version of the content of an ATBD version, used as its ETag for optimistic
+-- concurrency control. It gets incremented whenever the content changes, but
+-- not when only the metadata does (eg: the version is locked/unlocked).
+BEGIN;
+
+ALTER TABLE apt.atbd_versions
+    ADD COLUMN row_version INTEGER DEFAULT 1 NOT NULL;
+
+CREATE FUNCTION apt.increment_row_version() RETURNS trigger AS $$
+    BEGIN
+        IF (
+            OLD.document, OLD.sections_completed, OLD.citation, OLD.keywords
+        ) IS DISTINCT FROM (
+            NEW.document, NEW.sections_completed, NEW.citation, NEW.keywords
+        ) THEN
+            NEW.row_version := OLD.row_version + 1;
+        END IF;
+        RETURN NEW;
+    END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER atbd_versions_row_version
+    BEFORE UPDATE ON apt.atbd_versions
+    FOR EACH ROW EXECUTE PROCEDURE apt.increment_row_version();
+
+COMMIT;
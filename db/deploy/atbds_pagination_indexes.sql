@@ -0,0 +1,15 @@
+-- Deploy nasa-apt:atbds_pagination_indexes to pg
+-- requires: tables
+
+BEGIN;
+
+-- Keyset pagination of GET /atbds: (sort column, id) pairs
+CREATE INDEX atbds_last_updated_at_id_idx ON apt.atbds (last_updated_at, id);
+CREATE INDEX atbds_created_at_id_idx ON apt.atbds (created_at, id);
+CREATE INDEX atbds_title_id_idx ON apt.atbds (title, id);
+
+-- Status / owner filters on the versions joined to each ATBD
+CREATE INDEX atbd_versions_status_atbd_id_idx ON apt.atbd_versions (status, atbd_id);
+CREATE INDEX atbd_versions_owner_idx ON apt.atbd_versions (owner);
+
+COMMIT;
@@ -0,0 +1,14 @@
+-- Deploy nasa-apt:cognito_users to pg
+-- requires: tables
+
+BEGIN;
+
+CREATE TABLE apt.cognito_users (
+    sub VARCHAR PRIMARY KEY,
+    email VARCHAR NOT NULL,
+    preferred_username VARCHAR NOT NULL,
+    cognito_groups VARCHAR[] DEFAULT '{}',
+    updated_at TIMESTAMP DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP) NOT NULL
+);
+
+COMMIT;
@@ -0,0 +1,19 @@
+-- Deploy nasa-apt:document_jsonb to pg
+-- requires: tables
+
+-- Store the documents as JSONB (parsed once, on write, instead of on every
+-- access) so that they can be partially updated in SQL
+BEGIN;
+
+ALTER TABLE apt.atbd_versions
+    ALTER COLUMN document DROP DEFAULT,
+    ALTER COLUMN document TYPE JSONB USING document::jsonb,
+    ALTER COLUMN document SET DEFAULT '{}',
+    ALTER COLUMN sections_completed DROP DEFAULT,
+    ALTER COLUMN sections_completed TYPE JSONB USING sections_completed::jsonb,
+    ALTER COLUMN sections_completed SET DEFAULT '{}',
+    ALTER COLUMN citation DROP DEFAULT,
+    ALTER COLUMN citation TYPE JSONB USING citation::jsonb,
+    ALTER COLUMN citation SET DEFAULT '{}';
+
+COMMIT;
@@ -0,0 +1,120 @@
+-- Deploy nasa-apt:pdf_renders to pg
+-- requires: document_jsonb
+-- requires: contact_affiliations
+-- requires: journal_status
+-- requires: owner_authors_reviewers
+
+-- Manifest of the PDFs rendered from the ATBD versions, keyed on the hash of
+-- the content they were rendered from (see `app.api.v2.pdf`)
+BEGIN;
+
+-- Hash of the content a version's PDF is rendered from. It's maintained by
+-- the triggers below whenever that content changes, so that looking up a PDF
+-- never requires serializing the version
+ALTER TABLE apt.atbd_versions ADD COLUMN content_hash TEXT;
+
+CREATE FUNCTION apt.atbd_version_content_hash(v apt.atbd_versions) RETURNS TEXT AS $$
+    SELECT md5(jsonb_build_array(
+        a.title, a.alias,
+        v.status, v.published_at, v.doi, v.journal_status,
+        v.document, v.citation, v.keywords, v.owner, v.authors, v.reviewers,
+        (
+            SELECT jsonb_agg(jsonb_build_array(c, l.roles, l.affiliations) ORDER BY c.id)
+            FROM apt.atbd_versions_contacts l
+            JOIN apt.contacts c ON c.id = l.contact_id
+            WHERE l.atbd_id = v.atbd_id AND l.major = v.major
+        )
+    )::text)
+    FROM apt.atbds a
+    WHERE a.id = v.atbd_id;
+$$ LANGUAGE sql STABLE;
+
+-- The hash is (re)computed when the content of the version changes, or when
+-- it's been reset by a change to the ATBD or the contacts of the version
+CREATE FUNCTION apt.set_atbd_version_content_hash() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' OR NEW.content_hash IS NULL OR (
+            OLD.status, OLD.published_at, OLD.doi, OLD.journal_status,
+            OLD.document, OLD.citation, OLD.keywords, OLD.owner, OLD.authors,
+            OLD.reviewers
+        ) IS DISTINCT FROM (
+            NEW.status, NEW.published_at, NEW.doi, NEW.journal_status,
+            NEW.document, NEW.citation, NEW.keywords, NEW.owner, NEW.authors,
+            NEW.reviewers
+        ) THEN
+            NEW.content_hash := apt.atbd_version_content_hash(NEW);
+        END IF;
+        RETURN NEW;
+    END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER content_hash
+    BEFORE INSERT OR UPDATE ON apt.atbd_versions
+    FOR EACH ROW EXECUTE PROCEDURE apt.set_atbd_version_content_hash();
+
+CREATE FUNCTION apt.reset_content_hash_atbds() RETURNS trigger AS $$
+    BEGIN
+        IF (OLD.title, OLD.alias) IS DISTINCT FROM (NEW.title, NEW.alias) THEN
+            UPDATE apt.atbd_versions SET content_hash = NULL
+            WHERE atbd_id = NEW.id;
+        END IF;
+        RETURN NULL;
+    END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER content_hash
+    AFTER UPDATE ON apt.atbds
+    FOR EACH ROW EXECUTE PROCEDURE apt.reset_content_hash_atbds();
+
+CREATE FUNCTION apt.reset_content_hash_atbd_versions_contacts() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP <> 'INSERT' THEN
+            UPDATE apt.atbd_versions SET content_hash = NULL
+            WHERE atbd_id = OLD.atbd_id AND major = OLD.major;
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            UPDATE apt.atbd_versions SET content_hash = NULL
+            WHERE atbd_id = NEW.atbd_id AND major = NEW.major;
+        END IF;
+        RETURN NULL;
+    END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER content_hash
+    AFTER INSERT OR UPDATE OR DELETE ON apt.atbd_versions_contacts
+    FOR EACH ROW EXECUTE PROCEDURE apt.reset_content_hash_atbd_versions_contacts();
+
+CREATE FUNCTION apt.reset_content_hash_contacts() RETURNS trigger AS $$
+    BEGIN
+        UPDATE apt.atbd_versions v SET content_hash = NULL
+        FROM apt.atbd_versions_contacts l
+        WHERE l.contact_id = NEW.id AND v.atbd_id = l.atbd_id AND v.major = l.major;
+        RETURN NULL;
+    END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER content_hash
+    AFTER UPDATE ON apt.contacts
+    FOR EACH ROW EXECUTE PROCEDURE apt.reset_content_hash_contacts();
+
+-- Computes the hash of the existing versions
+UPDATE apt.atbd_versions SET content_hash = NULL;
+
+CREATE TABLE apt.pdf_renders (
+    id SERIAL PRIMARY KEY,
+    atbd_id INTEGER NOT NULL,
+    major INTEGER NOT NULL,
+    FOREIGN KEY (atbd_id, major) REFERENCES apt.atbd_versions (atbd_id, major) ON DELETE CASCADE,
+    minor INTEGER NOT NULL,
+    journal BOOLEAN NOT NULL DEFAULT FALSE,
+    content_hash TEXT NOT NULL,
+    s3_key TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'QUEUED'
+        CHECK (status IN ('QUEUED', 'RENDERING', 'DONE', 'FAILED')),
+    error TEXT,
+    created_at TIMESTAMP DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP) NOT NULL,
+    updated_at TIMESTAMP DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP) NOT NULL,
+    UNIQUE (atbd_id, major, minor, journal, content_hash)
+);
+
+COMMIT;
@@ -0,0 +1,93 @@
+-- Deploy nasa-apt:search_outbox to pg
+-- requires: tables
+
+-- Outbox of the changes to be applied to the search index. The changes are
+-- recorded by triggers, in the same transaction as the writes, and drained
+-- by the worker (see `app.search.outbox`)
+BEGIN;
+
+CREATE TABLE apt.search_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    atbd_id INTEGER NOT NULL,
+    -- NULL: all the versions of the ATBD
+    major INTEGER,
+    created_at TIMESTAMP DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP) NOT NULL
+);
+
+-- Only published versions are indexed, so changes to unpublished versions
+-- (eg: every save of a draft) aren't recorded
+CREATE FUNCTION apt.search_outbox_atbd_versions() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' AND (
+            OLD.published_at IS NOT NULL OR NEW.published_at IS NOT NULL
+        ) AND (
+            OLD.status, OLD.minor, OLD.published_at, OLD.doi,
+            OLD.document, OLD.citation, OLD.keywords
+        ) IS DISTINCT FROM (
+            NEW.status, NEW.minor, NEW.published_at, NEW.doi,
+            NEW.document, NEW.citation, NEW.keywords
+        ) THEN
+            INSERT INTO apt.search_outbox (atbd_id, major)
+            VALUES (NEW.atbd_id, NEW.major);
+        ELSIF TG_OP = 'INSERT' AND NEW.published_at IS NOT NULL THEN
+            INSERT INTO apt.search_outbox (atbd_id, major)
+            VALUES (NEW.atbd_id, NEW.major);
+        ELSIF TG_OP = 'DELETE' AND OLD.published_at IS NOT NULL THEN
+            INSERT INTO apt.search_outbox (atbd_id, major)
+            VALUES (OLD.atbd_id, OLD.major);
+        END IF;
+        RETURN NULL;
+    END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER search_outbox
+    AFTER INSERT OR UPDATE OR DELETE ON apt.atbd_versions
+    FOR EACH ROW EXECUTE PROCEDURE apt.search_outbox_atbd_versions();
+
+CREATE FUNCTION apt.search_outbox_atbds() RETURNS trigger AS $$
+    BEGIN
+        IF (OLD.title, OLD.alias) IS DISTINCT FROM (NEW.title, NEW.alias) THEN
+            INSERT INTO apt.search_outbox (atbd_id, major) VALUES (NEW.id, NULL);
+        END IF;
+        RETURN NULL;
+    END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER search_outbox
+    AFTER UPDATE ON apt.atbds
+    FOR EACH ROW EXECUTE PROCEDURE apt.search_outbox_atbds();
+
+CREATE FUNCTION apt.search_outbox_atbd_versions_contacts() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP <> 'INSERT' THEN
+            INSERT INTO apt.search_outbox (atbd_id, major)
+            VALUES (OLD.atbd_id, OLD.major);
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            INSERT INTO apt.search_outbox (atbd_id, major)
+            VALUES (NEW.atbd_id, NEW.major);
+        END IF;
+        RETURN NULL;
+    END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER search_outbox
+    AFTER INSERT OR UPDATE OR DELETE ON apt.atbd_versions_contacts
+    FOR EACH ROW EXECUTE PROCEDURE apt.search_outbox_atbd_versions_contacts();
+
+CREATE FUNCTION apt.search_outbox_contacts() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO apt.search_outbox (atbd_id, major)
+        SELECT l.atbd_id, l.major
+        FROM apt.atbd_versions_contacts l
+        JOIN apt.atbd_versions v ON v.atbd_id = l.atbd_id AND v.major = l.major
+        WHERE l.contact_id = NEW.id AND v.published_at IS NOT NULL;
+        RETURN NULL;
+    END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER search_outbox
+    AFTER UPDATE ON apt.contacts
+    FOR EACH ROW EXECUTE PROCEDURE apt.search_outbox_contacts();
+
+COMMIT;
@@ -0,0 +1,7 @@
+-- Revert nasa-apt:atbd_versions_row_version from pg
+
+BEGIN;
+DROP TRIGGER atbd_versions_row_version ON apt.atbd_versions;
+DROP FUNCTION apt.increment_row_version();
+ALTER TABLE apt.atbd_versions DROP COLUMN row_version;
+COMMIT;
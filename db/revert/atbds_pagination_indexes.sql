@@ -0,0 +1,9 @@
+-- Revert nasa-apt:atbds_pagination_indexes from pg
+
+BEGIN;
+DROP INDEX apt.atbds_last_updated_at_id_idx;
+DROP INDEX apt.atbds_created_at_id_idx;
+DROP INDEX apt.atbds_title_id_idx;
+DROP INDEX apt.atbd_versions_status_atbd_id_idx;
+DROP INDEX apt.atbd_versions_owner_idx;
+COMMIT;
@@ -0,0 +1,5 @@
+-- Revert nasa-apt:cognito_users from pg
+
+BEGIN;
+DROP TABLE apt.cognito_users;
+COMMIT;
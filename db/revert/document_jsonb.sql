@@ -0,0 +1,16 @@
+-- Revert nasa-apt:document_jsonb from pg
+
+BEGIN;
+
+ALTER TABLE apt.atbd_versions
+    ALTER COLUMN document DROP DEFAULT,
+    ALTER COLUMN document TYPE JSON USING document::json,
+    ALTER COLUMN document SET DEFAULT '{}',
+    ALTER COLUMN sections_completed DROP DEFAULT,
+    ALTER COLUMN sections_completed TYPE JSON USING sections_completed::json,
+    ALTER COLUMN sections_completed SET DEFAULT '{}',
+    ALTER COLUMN citation DROP DEFAULT,
+    ALTER COLUMN citation TYPE JSON USING citation::json,
+    ALTER COLUMN citation SET DEFAULT '{}';
+
+COMMIT;
@@ -0,0 +1,15 @@
+-- Revert nasa-apt:pdf_renders from pg
+
+BEGIN;
+DROP TABLE apt.pdf_renders;
+DROP TRIGGER content_hash ON apt.contacts;
+DROP FUNCTION apt.reset_content_hash_contacts();
+DROP TRIGGER content_hash ON apt.atbd_versions_contacts;
+DROP FUNCTION apt.reset_content_hash_atbd_versions_contacts();
+DROP TRIGGER content_hash ON apt.atbds;
+DROP FUNCTION apt.reset_content_hash_atbds();
+DROP TRIGGER content_hash ON apt.atbd_versions;
+DROP FUNCTION apt.set_atbd_version_content_hash();
+DROP FUNCTION apt.atbd_version_content_hash(apt.atbd_versions);
+ALTER TABLE apt.atbd_versions DROP COLUMN content_hash;
+COMMIT;
@@ -0,0 +1,13 @@
+-- Revert nasa-apt:search_outbox from pg
+
+BEGIN;
+DROP TRIGGER search_outbox ON apt.contacts;
+DROP FUNCTION apt.search_outbox_contacts();
+DROP TRIGGER search_outbox ON apt.atbd_versions_contacts;
+DROP FUNCTION apt.search_outbox_atbd_versions_contacts();
+DROP TRIGGER search_outbox ON apt.atbds;
+DROP FUNCTION apt.search_outbox_atbds();
+DROP TRIGGER search_outbox ON apt.atbd_versions;
+DROP FUNCTION apt.search_outbox_atbd_versions();
+DROP TABLE apt.search_outbox;
+COMMIT;
@@ -0,0 +1,8 @@
+-- Verify nasa-apt:atbd_versions_row_version on pg
+
+BEGIN;
+
+SELECT row_version FROM apt.atbd_versions WHERE FALSE;
+SELECT has_function_privilege('apt.increment_row_version()', 'execute');
+
+ROLLBACK;
@@ -0,0 +1,16 @@
+-- Verify nasa-apt:atbds_pagination_indexes on pg
+
+BEGIN;
+
+SELECT 1/COUNT(*) FROM pg_indexes
+WHERE schemaname = 'apt' AND indexname = 'atbds_last_updated_at_id_idx';
+SELECT 1/COUNT(*) FROM pg_indexes
+WHERE schemaname = 'apt' AND indexname = 'atbds_created_at_id_idx';
+SELECT 1/COUNT(*) FROM pg_indexes
+WHERE schemaname = 'apt' AND indexname = 'atbds_title_id_idx';
+SELECT 1/COUNT(*) FROM pg_indexes
+WHERE schemaname = 'apt' AND indexname = 'atbd_versions_status_atbd_id_idx';
+SELECT 1/COUNT(*) FROM pg_indexes
+WHERE schemaname = 'apt' AND indexname = 'atbd_versions_owner_idx';
+
+ROLLBACK;
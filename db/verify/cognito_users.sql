@@ -0,0 +1,9 @@
+-- Verify nasa-apt:cognito_users on pg
+
+BEGIN;
+
+SELECT sub, email, preferred_username, cognito_groups, updated_at
+FROM apt.cognito_users
+WHERE FALSE;
+
+ROLLBACK;
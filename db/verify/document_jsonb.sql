@@ -0,0 +1,9 @@
+-- Verify nasa-apt:document_jsonb on pg
+
+BEGIN;
+
+SELECT document || '{}'::jsonb, sections_completed || '{}'::jsonb, citation || '{}'::jsonb
+FROM apt.atbd_versions
+WHERE FALSE;
+
+ROLLBACK;
@@ -0,0 +1,15 @@
+-- Verify nasa-apt:pdf_renders on pg
+
+BEGIN;
+
+SELECT id, atbd_id, major, minor, journal, content_hash, s3_key, status, error,
+    created_at, updated_at
+FROM apt.pdf_renders WHERE FALSE;
+SELECT content_hash FROM apt.atbd_versions WHERE FALSE;
+SELECT has_function_privilege('apt.atbd_version_content_hash(apt.atbd_versions)', 'execute');
+SELECT has_function_privilege('apt.set_atbd_version_content_hash()', 'execute');
+SELECT has_function_privilege('apt.reset_content_hash_atbds()', 'execute');
+SELECT has_function_privilege('apt.reset_content_hash_atbd_versions_contacts()', 'execute');
+SELECT has_function_privilege('apt.reset_content_hash_contacts()', 'execute');
+
+ROLLBACK;
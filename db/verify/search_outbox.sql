@@ -0,0 +1,11 @@
+-- Verify nasa-apt:search_outbox on pg
+
+BEGIN;
+
+SELECT id, atbd_id, major, created_at FROM apt.search_outbox WHERE FALSE;
+SELECT has_function_privilege('apt.search_outbox_atbd_versions()', 'execute');
+SELECT has_function_privilege('apt.search_outbox_atbds()', 'execute');
+SELECT has_function_privilege('apt.search_outbox_atbd_versions_contacts()', 'execute');
+SELECT has_function_privilege('apt.search_outbox_contacts()', 'execute');
+
+ROLLBACK;
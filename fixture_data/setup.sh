@@ -27,6 +27,8 @@ aws --endpoint-url http://localstack:4566 s3 cp "fixture_data/figures/test-atbd-
 
 wait_for_service "sqs"
 aws --endpoint-url http://localstack:4566 sqs create-queue --queue-name ${TASK_QUEUE_NAME}
+aws --endpoint-url http://localstack:4566 sqs create-queue --queue-name ${PRIORITY_TASK_QUEUE_NAME}
+aws --endpoint-url http://localstack:4566 sqs create-queue --queue-name ${DEAD_LETTER_TASK_QUEUE_NAME}
 
 wait_for_service "cognito-idp"
 wait_for_service "cognito-identity"
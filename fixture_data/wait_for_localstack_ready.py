@@ -30,7 +30,8 @@ def aws_resources_ready():
         return False
 
     sqs = boto3.resource("sqs", endpoint_url=os.environ["AWS_RESOURCES_ENDPOINT"])
-    if not ({q.url.split("/")[-1] for q in sqs.queues.all()} == {"dev-tasks"}):
+    queues = {q.url.split("/")[-1] for q in sqs.queues.all()}
+    if not (queues == {"dev-tasks", "dev-tasks-priority", "dev-tasks-dead-letter"}):
         return False
 
     cognito = boto3.client(
@@ -15,7 +15,7 @@ inst_reqs = [
     "pandas==1.4.0",
     "pydantic==1.5.1",
     "requests==2.28.1",
-    "opensearch-py==2.0.0",
+    "opensearch-py[async]==2.2.0",
     "requests-aws4auth==1.1.2",
     "python-multipart==0.0.5",
     "python-jose==3.2.0",
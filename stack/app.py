@@ -1,8 +1,10 @@
 """
 CDK Stack definition code for NASA APT API
 """
+import base64
 import os
-from typing import Any
+import pickle
+from typing import Any, List
 
 import aws_cdk.aws_apigatewayv2_alpha as apigw
 import aws_cdk.aws_apigatewayv2_integrations_alpha as apigw_integrations
@@ -10,6 +12,8 @@ import config
 from aws_cdk import App, Aspects, CfnOutput, Duration, RemovalPolicy, Stack, Tags
 from aws_cdk import aws_cognito as cognito
 from aws_cdk import aws_ec2 as ec2
+from aws_cdk import aws_events as events
+from aws_cdk import aws_events_targets as events_targets
 from aws_cdk import aws_iam as iam
 from aws_cdk import aws_lambda as _lambda
 from aws_cdk import aws_lambda_event_sources as lambda_event_source
@@ -186,13 +190,36 @@ class nasaAPTLambdaStack(Stack):
         bucket = s3.Bucket(**bucket_params)
 
         visibility_timeout = timeout * 2
+        # tasks that still failed after their retries
+        dead_letter_sqs_queue = sqs.Queue(
+            self,
+            f"{id}-dead-letter-queue",
+            retention_period=Duration.days(14),
+        )
+        dead_letter_queue = sqs.DeadLetterQueue(
+            max_receive_count=config.MAX_RETRIES + 1, queue=dead_letter_sqs_queue
+        )
         sqs_queue = sqs.Queue(
             self,
             f"{id}-queue",
             # how long to wait before a retry
             visibility_timeout=Duration.seconds(visibility_timeout),
             # how long to keep messages in the queue
-            retention_period=Duration.seconds(visibility_timeout * config.MAX_RETRIES),
+            retention_period=Duration.seconds(
+                visibility_timeout * (config.MAX_RETRIES + 1)
+            ),
+            dead_letter_queue=dead_letter_queue,
+        )
+        # PDFs of published versions and journal PDFs, rendered ahead of the
+        # other tasks
+        priority_sqs_queue = sqs.Queue(
+            self,
+            f"{id}-priority-queue",
+            visibility_timeout=Duration.seconds(visibility_timeout),
+            retention_period=Duration.seconds(
+                visibility_timeout * (config.MAX_RETRIES + 1)
+            ),
+            dead_letter_queue=dead_letter_queue,
         )
 
         # This domain is launched within a VPC
@@ -241,6 +268,9 @@ class nasaAPTLambdaStack(Stack):
             POSTGRES_ADMIN_CREDENTIALS_ARN=database.secret.secret_arn,
             OPENSEARCH_URL=private_os_domain.domain_endpoint,
             TASK_QUEUE_URL=sqs_queue.queue_url,
+            PRIORITY_TASK_QUEUE_URL=priority_sqs_queue.queue_url,
+            DEAD_LETTER_TASK_QUEUE_URL=dead_letter_sqs_queue.queue_url,
+            TASK_MAX_RECEIVES=str(config.MAX_RETRIES + 1),
             S3_BUCKET=bucket.bucket_name,
             NOTIFICATIONS_FROM=config.NOTIFICATIONS_FROM,
             APT_FEATURE_MFA_ENABLED=config.APT_FEATURE_MFA_ENABLED,
@@ -333,13 +363,36 @@ class nasaAPTLambdaStack(Stack):
         )
         bucket.grant_read_write(sqs_handler_lambda)
         database.secret.grant_read(sqs_handler_lambda)
+        # notifications are sent (and failed sends re-queued) by the worker
+        sqs_handler_lambda.add_to_role_policy(ses_access)
+        sqs_handler_lambda.add_to_role_policy(sqs_access)
+        if config.PDF_SERVICE_CREDENTIALS_ARN:
+            self.grant_pdf_service_credentials(
+                id, [api_handler_lambda, sqs_handler_lambda], sqs_handler_lambda
+            )
 
         os_access_policy.add_arn_principal(f"{sqs_handler_lambda.function_arn}")
         private_os_domain.grant_read_write(sqs_handler_lambda)
 
-        # attach the task handling lambda to the queue
-        sqs_event_source = lambda_event_source.SqsEventSource(sqs_queue)
-        sqs_handler_lambda.add_event_source(sqs_event_source)
+        # attach the task handling lambda to the queues (the priority queue has
+        # its own pollers, so its tasks don't wait behind the other ones)
+        for queue in [sqs_queue, priority_sqs_queue]:
+            sqs_handler_lambda.add_event_source(
+                lambda_event_source.SqsEventSource(
+                    queue, batch_size=10, report_batch_item_failures=True
+                )
+            )
+
+        # the users are refreshed in the background, so that new API
+        # containers start warm (from the `cognito_users` table)
+        self.schedule_task(
+            id,
+            sqs_queue,
+            "refresh_user_directory",
+            events.Schedule.rate(
+                Duration.minutes(config.USER_DIRECTORY_REFRESH_MINUTES)
+            ),
+        )
 
         user_pool = cognito.UserPool(
             self,
@@ -459,6 +512,44 @@ class nasaAPTLambdaStack(Stack):
                 key="APP_CLIENT_NAME", value=app_client.user_pool_client_name
             )
 
+    def schedule_task(
+        self, id: str, queue: sqs.Queue, task_type: str, schedule: events.Schedule
+    ) -> None:
+        """Sends a task (without payload) to the queue on a schedule. The
+        message is encoded as the API encodes the tasks it queues."""
+        body = base64.b64encode(
+            pickle.dumps({"task_type": task_type, "payload": {}})
+        ).decode()
+        events.Rule(
+            self,
+            f"{id}-{task_type.replace('_', '-')}-schedule",
+            schedule=schedule,
+            targets=[
+                events_targets.SqsQueue(
+                    queue, message=events.RuleTargetInput.from_text(body)
+                )
+            ],
+        )
+
+    def grant_pdf_service_credentials(
+        self,
+        id: str,
+        lambda_functions: List[_lambda.Function],
+        renderer: _lambda.Function,
+    ) -> None:
+        """Points the lambdas to the credentials of the service user the PDFs
+        are rendered as, and grants the renderer read access to them."""
+        for lambda_function in lambda_functions:
+            lambda_function.add_environment(
+                key="PDF_SERVICE_CREDENTIALS_ARN",
+                value=config.PDF_SERVICE_CREDENTIALS_ARN,
+            )
+        secretsmanager.Secret.from_secret_complete_arn(
+            self,
+            f"{id}-pdf-service-credentials",
+            config.PDF_SERVICE_CREDENTIALS_ARN,
+        ).grant_read(renderer)
+
 
 app = App()
 
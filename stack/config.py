@@ -42,6 +42,9 @@ MAX_CONCURRENT: int = 50 if "prod" in STAGE else 0
 # Number of times to retry a failed task
 MAX_RETRIES: int = 1
 
+# How often the worker refreshes the shared directory of the Cognito users
+USER_DIRECTORY_REFRESH_MINUTES: int = 5
+
 
 ################################################################################
 #                                                                              #
@@ -70,6 +73,10 @@ NOTIFICATIONS_FROM = os.environ.get("NOTIFICATIONS_FROM") or exit(
     "NOTIFICATIONS_FROM env var required"
 )
 
+# SecretsManager ARN of the credentials (`username` and `password`) of the
+# Cognito user the worker signs in as to pre-render the PDFs of published versions
+PDF_SERVICE_CREDENTIALS_ARN = os.environ.get("PDF_SERVICE_CREDENTIALS_ARN")
+
 GCC_MODE = bool(os.environ.get("GCC_MODE"))
 
 # Feature flags
@@ -0,0 +1,13 @@
+"""Helpers shared by the tests"""
+import fastapi_permissions
+
+
+def user_principals(sub=None, groups=()):
+    """Principals of a user in the Cognito `groups` (as returned by
+    `get_active_user_principals`), or of an anonymous user if there's no
+    `sub`"""
+    principals = [fastapi_permissions.Everyone]
+    if sub:
+        principals.extend([fastapi_permissions.Authenticated, f"user:{sub}"])
+        principals.extend([f"role:{g}" for g in groups])
+    return principals
@@ -0,0 +1,178 @@
+"""Equivalence tests for the compiled ATBD version ACL"""
+import itertools
+
+import pytest
+from conftest import user_principals
+from sqlalchemy import Column
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql import elements, functions, operators
+
+from app.acls import ATBD_VERSION_ACLS, COMPILED_ATBD_VERSION_ACLS
+from app.db.models import AtbdVersions
+from app.permissions import atbd_versions_filter, check_permissions
+
+import fastapi_permissions
+
+STATUSES = [
+    "DRAFT",
+    "CLOSED_REVIEW_REQUESTED",
+    "CLOSED_REVIEW",
+    "OPEN_REVIEW",
+    "PUBLICATION_REQUESTED",
+    "PUBLICATION",
+    "PUBLISHED",
+    "NOT_A_STATUS",
+]
+LOCKED_BY = [None, "owner", "author1", "someone-else"]
+ACTIONS = sorted(
+    {a["action"] for actions in ATBD_VERSION_ACLS.values() for a in actions}
+) + ["not_an_action"]
+
+
+PRINCIPALS = [
+    user_principals(),
+    user_principals("owner", ["contributor"]),
+    user_principals("author1", ["contributor"]),
+    user_principals("author2", ["contributor"]),
+    user_principals("reviewer1", ["contributor"]),
+    user_principals("someone-else", ["contributor"]),
+    user_principals("curator", ["curator"]),
+    user_principals("owner", ["contributor", "curator"]),
+    user_principals("someone-else", []),
+]
+
+
+@pytest.mark.parametrize("status,locked_by", itertools.product(STATUSES, LOCKED_BY))
+def test_compiled_acl_matches_version_acl(status, locked_by):
+    """The compiled ACL grants exactly what the expanded version ACL grants"""
+    version = AtbdVersions(
+        atbd_id=1,
+        major=1,
+        status=status,
+        locked_by=locked_by,
+        owner="owner",
+        authors=["author1", "author2"],
+        reviewers=[{"sub": "reviewer1", "review_status": "IN_PROGRESS"}],
+    )
+    acl = version.__acl__()
+    for principals, action in itertools.product(PRINCIPALS, ACTIONS):
+        assert COMPILED_ATBD_VERSION_ACLS.has_permission(
+            principals, action, version
+        ) == fastapi_permissions.has_permission(principals, action, acl), (
+            principals,
+            action,
+        )
+
+
+@pytest.mark.parametrize("status,locked_by", itertools.product(STATUSES, LOCKED_BY))
+def test_grantee_rules_match_compiled_acl(status, locked_by):
+    """The grantee rules (used to translate the ACL into SQL) grant exactly
+    what the compiled ACL grants"""
+    acl = COMPILED_ATBD_VERSION_ACLS
+    version = AtbdVersions(
+        atbd_id=1,
+        major=1,
+        status=status,
+        locked_by=locked_by,
+        owner="owner",
+        authors=["author1", "author2"],
+        reviewers=[{"sub": "reviewer1", "review_status": "IN_PROGRESS"}],
+    )
+    state = (status if status in acl.statuses else acl.OTHER_STATUS, bool(locked_by))
+    for principals, action in itertools.product(PRINCIPALS, ACTIONS):
+        subs = {p[len("user:") :] for p in principals if p.startswith("user:")}
+        expected = next(
+            (
+                state in states
+                for grantee, states in acl.grantee_rules(action)
+                if acl._matches(grantee, version, set(principals), subs)
+            ),
+            False,
+        )
+        assert acl.has_permission(principals, action, version) == expected
+
+
+def _evaluate(clause, version):
+    """Evaluates (in python) an SQL predicate of `atbd_versions_filter` on a
+    version: only the constructs the predicates are made of are supported"""
+
+    def evaluate(clause):
+        return _evaluate(clause, version)
+
+    if isinstance(clause, elements.Grouping):
+        return evaluate(clause.element)
+    if isinstance(clause, (elements.True_, elements.False_)):
+        return isinstance(clause, elements.True_)
+    if isinstance(clause, elements.Null):
+        return None
+    if isinstance(clause, elements.BindParameter):
+        return clause.value
+    if isinstance(clause, Column):
+        return getattr(version, clause.key)
+    if isinstance(clause, elements.BooleanClauseList):
+        values = [evaluate(c) for c in clause.clauses]
+        return all(values) if clause.operator is operators.and_ else any(values)
+    if isinstance(clause, elements.ClauseList):
+        return [evaluate(c) for c in clause.clauses]
+    if isinstance(clause, elements.Case):
+        for condition, result in clause.whens:
+            if evaluate(condition):
+                return evaluate(result)
+        return evaluate(clause.else_)
+    if isinstance(clause, functions.Function) and clause.name == "to_jsonb":
+        [value] = evaluate(clause.clauses)
+        return value
+    if isinstance(clause, elements.CollectionAggregate):
+        return evaluate(clause.element)
+    if isinstance(clause, elements.AsBoolean):
+        value = evaluate(clause.element)
+        return not value if clause.operator is operators.isfalse else bool(value)
+    if (
+        isinstance(clause, elements.UnaryExpression)
+        and clause.operator is operators.inv
+    ):
+        return not evaluate(clause.element)
+    if isinstance(clause, elements.BinaryExpression):
+        left, right = evaluate(clause.left), evaluate(clause.right)
+        if clause.operator is operators.in_op:
+            return left in right
+        if clause.operator is operators.notin_op:
+            return left not in right
+        if clause.operator is operators.is_:
+            return left is right
+        if clause.operator is operators.isnot:
+            return left is not right
+        if clause.operator is operators.eq and isinstance(
+            clause.right, elements.CollectionAggregate
+        ):
+            # value = ANY(array)
+            return left in right
+        if getattr(clause.operator, "opstring", None) == "@>":
+            return all(
+                any(item.items() <= element.items() for element in left)
+                for item in right
+            )
+    raise NotImplementedError(f"Unsupported clause: {clause!r}")
+
+
+@pytest.mark.parametrize("principals", PRINCIPALS)
+def test_versions_filter_matches_check_permissions(principals):
+    """The SQL predicate of the versions filter (which compiles for
+    postgresql) matches the versions `check_permissions` allows"""
+    for action in ACTIONS:
+        clause = atbd_versions_filter(principals, action)
+        assert str(clause.compile(dialect=postgresql.dialect()))
+
+        for status, locked_by in itertools.product(STATUSES, LOCKED_BY):
+            version = AtbdVersions(
+                atbd_id=1,
+                major=1,
+                status=status,
+                locked_by=locked_by,
+                owner="owner",
+                authors=["author1", "author2"],
+                reviewers=[{"sub": "reviewer1", "review_status": "IN_PROGRESS"}],
+            )
+            assert bool(_evaluate(clause, version)) == check_permissions(
+                principals, action, version, raise_exception=False
+            ), (principals, action, status, locked_by)
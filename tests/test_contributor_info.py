@@ -0,0 +1,282 @@
+"""Tests (and benchmarks) for the contributor info hydrator"""
+import time
+
+import pytest
+from conftest import user_principals
+
+from app.db.models import Atbds, AtbdVersions, Comments, Threads
+from app.permissions import check_permissions
+from app.schemas import users
+from app.schemas.users import CognitoUser
+from app.users.hydrator import ContributorInfoHydrator
+
+STATUSES = ["DRAFT", "CLOSED_REVIEW", "OPEN_REVIEW", "PUBLISHED"]
+APP_USERS = {
+    f"user{i}": CognitoUser(
+        sub=f"user{i}", email=f"user{i}@example.com", preferred_username=f"User {i}"
+    )
+    for i in range(30)
+}
+CURATORS = ["user0", "user1"]
+
+
+def _legacy_user_info(principals, atbd_version, data_model):
+    """`created_by`, `last_updated_by` and `published_by` of a data model, as
+    replaced (per object) before the hydrator"""
+    version_acl = atbd_version.__acl__()
+    contributors = {
+        "owner": [atbd_version.owner],
+        "authors": atbd_version.authors,
+        "reviewers": [r["sub"] for r in atbd_version.reviewers],
+        "curators": CURATORS,
+    }
+    for attr in ["created_by", "last_updated_by", "published_by"]:
+        user_sub = getattr(data_model, attr, None)
+        if user_sub is None:
+            continue
+        if not any([user_sub in i for i in contributors.values()]):
+            setattr(
+                data_model,
+                attr,
+                users.AnonymousUser(preferred_username="Unknown User").dict(
+                    by_alias=True
+                ),
+            )
+            continue
+        for contributor_type, contributor_subs in contributors.items():
+            if user_sub not in contributor_subs:
+                continue
+            if check_permissions(
+                principals=principals,
+                action=f"view_{contributor_type}",
+                acl=version_acl,
+                raise_exception=False,
+            ):
+                setattr(data_model, attr, APP_USERS[user_sub].dict(by_alias=True))
+            else:
+                preferred_username = contributor_type.strip("s").title()
+                if contributor_type != "owner":
+                    preferred_username += f" {contributor_subs.index(user_sub)+1}"
+                setattr(
+                    data_model,
+                    attr,
+                    users.AnonymousUser(preferred_username=preferred_username).dict(
+                        by_alias=True
+                    ),
+                )
+    return data_model
+
+
+def _legacy_version(principals, version):
+    """Contributor info of a version, as replaced (per version) before the
+    hydrator"""
+    version_acl = version.__acl__()
+
+    def allowed(contributor_type):
+        return check_permissions(
+            principals=principals,
+            action=f"view_{contributor_type}",
+            acl=version_acl,
+            raise_exception=False,
+        )
+
+    version = _legacy_user_info(principals, version, version)
+    if allowed("owner"):
+        version.owner = APP_USERS[version.owner].dict(by_alias=True)
+    else:
+        version.owner = users.AnonymousUser(preferred_username="Owner").dict(
+            by_alias=True
+        )
+    if allowed("authors"):
+        version.authors = [APP_USERS[a].dict(by_alias=True) for a in version.authors]
+    else:
+        version.authors = [
+            users.AnonymousUser(preferred_username=f"Author {i + 1}").dict(
+                by_alias=True
+            )
+            for i, _ in enumerate(version.authors)
+        ]
+    if allowed("reviewers"):
+        version.reviewers = [
+            users.ReviewerUser(
+                **APP_USERS[r["sub"]].dict(by_alias=True),
+                review_status=r["review_status"],
+            ).dict(by_alias=True)
+            for r in version.reviewers
+        ]
+    else:
+        version.reviewers = [
+            users.AnonymousReviewerUser(
+                preferred_username=f"Reviewer {i + 1}",
+                review_status=r["review_status"],
+            ).dict(by_alias=True)
+            for i, r in enumerate(version.reviewers)
+        ]
+    return version
+
+
+def _legacy_atbd(principals, atbd):
+    atbd.versions = [_legacy_version(principals, v) for v in atbd.versions]
+    return atbd
+
+
+def _atbds(n):
+    """ATBDs with 3 versions each, whose contributors are spread over the
+    users of the app"""
+    atbds = []
+    for i in range(n):
+        owner, author, reviewer = (f"user{(i + k) % 28 + 2}" for k in range(3))
+        atbds.append(
+            Atbds(
+                id=i,
+                versions=[
+                    AtbdVersions(
+                        atbd_id=i,
+                        major=major,
+                        status=STATUSES[(i + major) % len(STATUSES)],
+                        owner=owner,
+                        authors=[author],
+                        reviewers=[{"sub": reviewer, "review_status": "IN_PROGRESS"}],
+                        created_by=owner,
+                        last_updated_by=author,
+                        published_by="user0" if major < 3 else None,
+                    )
+                    for major in range(1, 4)
+                ],
+            )
+        )
+    return atbds
+
+
+def _hydrated(atbds):
+    """Hydrated fields of the versions of the ATBDs"""
+    return [
+        (
+            v.owner,
+            v.authors,
+            v.reviewers,
+            v.created_by,
+            v.last_updated_by,
+            v.published_by,
+        )
+        for atbd in atbds
+        for v in atbd.versions
+    ]
+
+
+def _hydrator(principals):
+    return ContributorInfoHydrator(principals, APP_USERS, CURATORS)
+
+
+def test_anonymous_user_sees_no_identifying_info():
+    """Users who aren't logged in only see anonymized contributors"""
+    [atbd] = _atbds(1)
+    version = _hydrator(user_principals()).atbd(atbd).versions[0]
+    assert version.owner["preferred_username"] == "Owner"
+    assert [a["preferred_username"] for a in version.authors] == ["Author 1"]
+    assert [r["preferred_username"] for r in version.reviewers] == ["Reviewer 1"]
+    assert all(
+        user["is_anonymous"]
+        for user in [version.owner, *version.authors, *version.reviewers]
+    )
+
+
+def test_curator_sees_contributors():
+    """Curators see who the contributors are"""
+    [atbd] = _atbds(1)
+    version = _hydrator(user_principals("user0", ["curator"])).atbd(atbd).versions[0]
+    assert version.owner["sub"] == atbd.versions[0].created_by["sub"] == "user2"
+    assert [a["sub"] for a in version.authors] == ["user3"]
+    assert [r["sub"] for r in version.reviewers] == ["user4"]
+    assert [r["review_status"] for r in version.reviewers] == ["IN_PROGRESS"]
+
+
+@pytest.mark.parametrize(
+    "principals",
+    [
+        user_principals(),
+        user_principals("user2", ["contributor"]),
+        user_principals("user4", ["contributor"]),
+        user_principals("user0", ["curator"]),
+    ],
+)
+def test_shared_hydrator_matches_legacy_hydration(principals):
+    """A hydrator shared by a list of ATBDs (and threads) hydrates them as
+    they were hydrated one object at a time"""
+    hydrator = _hydrator(principals)
+    shared = [hydrator.atbd(atbd) for atbd in _atbds(10)]
+    legacy = [_legacy_atbd(principals, atbd) for atbd in _atbds(10)]
+    assert _hydrated(shared) == _hydrated(legacy)
+
+    [atbd] = _atbds(1)
+    version = atbd.versions[0]
+
+    def thread():
+        return Threads(
+            created_by="user2",
+            last_updated_by="user9",
+            comments=[
+                Comments(created_by=sub, last_updated_by=sub) for sub in CURATORS
+            ],
+        )
+
+    hydrated = hydrator.thread(version, thread())
+    legacy_thread = thread()
+    legacy_thread.comments = [
+        _legacy_user_info(principals, version, c) for c in legacy_thread.comments
+    ]
+    legacy_thread = _legacy_user_info(principals, version, legacy_thread)
+    assert [
+        (t.created_by, t.last_updated_by) for t in [hydrated, *hydrated.comments]
+    ] == [
+        (t.created_by, t.last_updated_by)
+        for t in [legacy_thread, *legacy_thread.comments]
+    ]
+
+
+def test_hydrated_users_are_not_shared():
+    """Each hydrated field gets its own user dict, even though the users are
+    serialized once"""
+    hydrator = _hydrator(user_principals("user0", ["curator"]))
+    first, second = (
+        hydrator.atbd(atbd).versions[0] for atbd in [*_atbds(1), *_atbds(1)]
+    )
+    assert first is not second and first.owner == second.owner
+    first.owner["preferred_username"] = "Renamed"
+    first.owner["cognito:groups"].append("curator")
+    assert second.owner["preferred_username"] == "User 2"
+    assert second.owner["cognito:groups"] == []
+    assert hydrator.user("user2")["preferred_username"] == "User 2"
+
+    anonymous = _hydrator(user_principals())
+    first, second = (
+        anonymous.atbd(atbd).versions[0] for atbd in [*_atbds(1), *_atbds(1)]
+    )
+    first.owner["preferred_username"] = "Renamed"
+    assert second.owner["preferred_username"] == "Owner"
+
+
+@pytest.mark.benchmark
+def test_benchmark_list_hydration():
+    """Hydrates a list of ATBDs one version at a time (as before the
+    hydrator), and with a single hydrator (the timings are reported, not
+    asserted)"""
+    principals = user_principals("user2", ["contributor"])
+    n = 500
+
+    atbds = _atbds(n)
+    started_at = time.perf_counter()
+    legacy = [_legacy_atbd(principals, atbd) for atbd in atbds]
+    naive = time.perf_counter() - started_at
+
+    atbds = _atbds(n)
+    started_at = time.perf_counter()
+    hydrator = _hydrator(principals)
+    shared = [hydrator.atbd(atbd) for atbd in atbds]
+    batched = time.perf_counter() - started_at
+
+    print(
+        f"{n} ATBDs x 3 versions: {naive * 1000:.1f}ms (per version), "
+        f"{batched * 1000:.1f}ms (single hydrator)"
+    )
+    assert _hydrated(shared) == _hydrated(legacy)
@@ -0,0 +1,148 @@
+"""Tests for the updates of the generic CRUD operations, against a session
+recording the statements (and returning the rows the database would)"""
+from typing import Optional
+
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.mutable import MutableDict
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.crud.base import CRUDBase
+from app.db.models import AtbdVersions
+
+
+class Update(BaseModel):
+    status: Optional[str]
+    document: Optional[dict]
+    doi: Optional[str]
+    not_a_column: Optional[str]
+
+
+class Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+
+class Session:
+    """Session executing the UPDATE ... RETURNING statements on `rows` (by
+    identity), bumping their `row_version` as the database trigger does"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+        self.flushes = 0
+        self.commits = 0
+
+    def flush(self):
+        self.flushes += 1
+
+    def commit(self):
+        self.commits += 1
+
+    def execute(self, statement):
+        self.statements.append(statement)
+        returned = []
+        for row in self.rows.values():
+            row.update(statement.parameters)
+            row["row_version"] += 1
+            returned.append({c: row[c.key] for c in statement._returning})
+        return Result(returned)
+
+
+def _version(**loaded):
+    """Persistent (detached) version, with only the `loaded` columns loaded"""
+    version = AtbdVersions(atbd_id=1, major=1, **loaded)
+    make_transient_to_detached(version)
+    return version
+
+
+def _session(**columns):
+    return Session(
+        {
+            (1, 1): {
+                "atbd_id": 1,
+                "major": 1,
+                "status": "DRAFT",
+                "document": {"abstract": "old"},
+                "doi": None,
+                "row_version": 1,
+                **columns,
+            }
+        }
+    )
+
+
+crud = CRUDBase(AtbdVersions)
+
+
+def test_diff():
+    """Only the columns whose value differs from the loaded value (or which
+    aren't loaded) are updated"""
+    version = _version(status="DRAFT", document={"abstract": "old"})
+    assert crud._diff(
+        version,
+        {
+            "status": "DRAFT",
+            "document": {"abstract": "new"},
+            "doi": "loaded on access",
+            "not_a_column": "ignored",
+        },
+    ) == {"document": {"abstract": "new"}, "doi": "loaded on access"}
+
+
+def test_update_returns_the_written_values():
+    """The changed columns are written with a single UPDATE, which returns the
+    updated and the already loaded columns (eg: changed by a trigger): they
+    are set on the object, without flagging it as modified"""
+    version = _version(status="DRAFT", document={"abstract": "old"}, row_version=1)
+    db = _session()
+
+    updated = crud.update(
+        db,
+        db_obj=version,
+        obj_in=Update(status="DRAFT", document={"abstract": "new"}),
+    )
+
+    assert updated is version
+    [statement] = db.statements
+    assert statement.parameters == {"document": {"abstract": "new"}}
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    assert sql.startswith("UPDATE atbd_versions SET document=")
+    assert "RETURNING" in sql
+    assert {c.key for c in statement._returning} == {
+        "atbd_id",
+        "major",
+        "status",
+        "document",
+        "row_version",
+    }
+    assert (db.flushes, db.commits) == (1, 1)
+
+    state = inspect(version)
+    assert version.document == {"abstract": "new"}
+    assert version.row_version == 2
+    assert not state.modified
+    assert "doi" not in state.dict
+    # The returned JSON is tracked, as if it had been loaded
+    assert isinstance(version.document, MutableDict)
+    version.document["abstract"] = "changed"
+    assert state.modified
+
+
+def test_update_without_changes():
+    """An update that doesn't change any column doesn't write anything (but
+    still commits the pending changes)"""
+    version = _version(status="DRAFT", row_version=1)
+    db = _session()
+
+    crud.update(db, db_obj=version, obj_in=Update(status="DRAFT"))
+    crud.update(db, db_obj=version, obj_in=Update(), commit=False)
+
+    assert db.statements == []
+    assert (db.flushes, db.commits) == (0, 1)
+    assert version.row_version == 1
+    assert not inspect(version).modified
@@ -0,0 +1,141 @@
+"""Tests for the batched email sender, against a local stand-in for SES"""
+import threading
+
+import pytest
+from botocore.exceptions import ClientError
+
+from app.email.sender import EmailConfigurationError, EmailSender, RateLimiter
+
+
+class LocalSes:
+    """Stand-in for the SES client: records the sent emails, throttles the
+    first `throttle` sends, rejects the `rejected` addresses and fails with
+    `error` once `error_after` emails are sent"""
+
+    def __init__(self, throttle=0, rejected=(), error=None, error_after=0):
+        self.sent = []
+        self.throttle = throttle
+        self.rejected = set(rejected)
+        self.error = error
+        self.error_after = error_after
+        self._lock = threading.Lock()
+
+    def send_email(self, Source, Destination, Message):
+        [to] = Destination["ToAddresses"]
+        with self._lock:
+            if self.error and len(self.sent) >= self.error_after:
+                raise ClientError(
+                    {"Error": {"Code": self.error, "Message": self.error}},
+                    "SendEmail",
+                )
+            if self.throttle > 0:
+                self.throttle -= 1
+                raise ClientError(
+                    {"Error": {"Code": "Throttling", "Message": "Rate exceeded"}},
+                    "SendEmail",
+                )
+            if to in self.rejected:
+                raise ClientError(
+                    {"Error": {"Code": "MessageRejected", "Message": "Rejected"}},
+                    "SendEmail",
+                )
+            self.sent.append((Source, to, Message["Subject"]["Data"]))
+        return {"MessageId": str(len(self.sent))}
+
+
+def _messages(n):
+    return [
+        {"to": f"user{i}@example.com", "subject": f"Subject {i}", "html": "<p>Hi</p>"}
+        for i in range(n)
+    ]
+
+
+def _sender(ses, max_send_rate=1000, max_retries=3):
+    sender = EmailSender(
+        ses=ses,
+        source="apt@example.com",
+        max_send_rate=max_send_rate,
+        concurrency=4,
+        max_retries=max_retries,
+    )
+    sender.RETRY_BACKOFF = 0
+    return sender
+
+
+def test_sends_all_messages():
+    """Every message is sent once, from the configured source"""
+    ses = LocalSes()
+    assert _sender(ses).send(_messages(20)) == []
+    assert sorted(to for _, to, _ in ses.sent) == sorted(m["to"] for m in _messages(20))
+    assert {source for source, _, _ in ses.sent} == {"apt@example.com"}
+
+
+def test_retries_throttled_sends():
+    """Throttled sends are retried"""
+    ses = LocalSes(throttle=3)
+    assert _sender(ses).send(_messages(5)) == []
+    assert len(ses.sent) == 5
+
+
+def test_returns_messages_failing_after_retries():
+    """Messages still throttled after the retries are returned, to be
+    re-queued"""
+    ses = LocalSes(throttle=100)
+    messages = _messages(2)
+    assert _sender(ses, max_retries=1).send(messages) == messages
+    assert ses.sent == []
+
+
+def test_rejected_messages_are_not_retried():
+    """Permanent failures are dropped (retrying them wouldn't succeed)"""
+    ses = LocalSes(rejected={"user1@example.com"})
+    assert _sender(ses).send(_messages(3)) == []
+    assert len(ses.sent) == 2
+
+
+def test_configuration_errors_are_raised():
+    """Sends failing because the sender can't use SES aren't dropped: the
+    error is raised, so that the task is retried"""
+    ses = LocalSes(error="AccessDenied")
+    with pytest.raises(EmailConfigurationError):
+        _sender(ses).send(_messages(20))
+    assert ses.sent == []
+
+
+def test_configuration_errors_stop_the_sends():
+    """If the sender breaks after some emails were sent, the remaining sends
+    are stopped and only the unsent messages are returned (to be re-queued)"""
+    ses = LocalSes(error="ExpiredToken", error_after=5)
+    messages = _messages(20)
+    unsent = _sender(ses).send(messages)
+    assert len(ses.sent) == 5
+    sent = {to for _, to, _ in ses.sent}
+    assert [m for m in messages if m["to"] not in sent] == unsent
+
+
+class FakeClock:
+    """Clock only advanced by sleeping"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_rate_limiter():
+    """The rate limiter allows a burst of `rate` acquisitions, and then
+    `rate` acquisitions per second"""
+    clock = FakeClock()
+    # A power of two, so that the fake time adds up exactly
+    limiter = RateLimiter(rate=16, clock=clock, sleep=clock.sleep)
+    acquired_at = []
+    for _ in range(24):
+        limiter.acquire()
+        acquired_at.append(clock.now)
+    # 16 immediately, then one every 1/16s
+    assert acquired_at[:16] == [0] * 16
+    assert acquired_at[16:] == [i / 16 for i in range(1, 9)]
@@ -0,0 +1,101 @@
+"""Tests (and benchmarks) for the compiled email templates"""
+import json
+import os
+import time
+from string import Template
+
+import pytest
+
+from app.email.templates import RECIPIENT_FIELDS, SHARED_FIELDS, TemplateRegistry
+
+TEMPLATES_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "app", "email", "email_templates.json"
+)
+with open(TEMPLATES_PATH) as f:
+    TEMPLATES = json.load(f)
+
+SHARED = {field: f"<{field}>" for field in SHARED_FIELDS}
+RECIPIENTS = [
+    {field: f"<{field} {i}>" for field in RECIPIENT_FIELDS} for i in range(50)
+]
+
+
+def test_all_templates_compile():
+    """The templates of the app are all valid"""
+    registry = TemplateRegistry.from_file(TEMPLATES_PATH)
+    assert all(name in registry for name in TEMPLATES)
+
+
+@pytest.mark.parametrize("name", sorted(TEMPLATES))
+def test_rendering_matches_string_template(name):
+    """Rendering a bound template is equivalent to substituting all the
+    values at once"""
+    template = TemplateRegistry(TEMPLATES)[name].bind(SHARED)
+    for recipient in RECIPIENTS[:3]:
+        assert template.render(recipient) == (
+            Template(TEMPLATES[name]["subject"]).substitute(**SHARED, **recipient),
+            Template(TEMPLATES[name]["content"]).substitute(**SHARED, **recipient),
+        )
+
+
+def test_values_are_not_interpreted():
+    """Delimiters in the bound values (or escaped in the template) are kept
+    as is"""
+    registry = TemplateRegistry(
+        {"n": {"subject": "$$5 for $atbd_title", "content": "$comment"}}
+    )
+    template = registry["n"].bind({"atbd_title": "$comment"})
+    assert template.render({"comment": "${section}"}) == (
+        "$5 for $comment",
+        "${section}",
+    )
+
+
+def test_missing_value():
+    """Rendering fails if a placeholder has no value"""
+    template = TemplateRegistry(TEMPLATES)["publish"].bind(SHARED)
+    with pytest.raises(KeyError):
+        template.render({})
+
+
+@pytest.mark.parametrize(
+    "subject", ["Hi $not_a_field", "Hi ${preferred_username", "Hi $"]
+)
+def test_invalid_templates(subject):
+    """Unknown and invalid placeholders are rejected"""
+    with pytest.raises(ValueError):
+        TemplateRegistry({"n": {"subject": subject, "content": ""}})
+
+
+@pytest.mark.benchmark
+def test_benchmark_fan_out():
+    """Renders an event's notification for many recipients, with compiled
+    templates and with `string.Template`s built for each recipient (the
+    timings are reported, not asserted)"""
+    registry = TemplateRegistry(TEMPLATES)
+    events = 100
+
+    started_at = time.perf_counter()
+    for _ in range(events):
+        naive_messages = []
+        for recipient in RECIPIENTS:
+            message = TEMPLATES["publish"]
+            naive_messages.append(
+                (
+                    Template(message["subject"]).substitute(**SHARED, **recipient),
+                    Template(message["content"]).substitute(**SHARED, **recipient),
+                )
+            )
+    naive = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    for _ in range(events):
+        template = registry["publish"].bind(SHARED)
+        compiled_messages = [template.render(recipient) for recipient in RECIPIENTS]
+    compiled = time.perf_counter() - started_at
+
+    print(
+        f"{events} events x {len(RECIPIENTS)} recipients: "
+        f"{naive * 1000:.1f}ms (string.Template), {compiled * 1000:.1f}ms (compiled)"
+    )
+    assert compiled_messages == naive_messages
@@ -0,0 +1,130 @@
+"""Tests (and benchmark) of the headless browser kept by the PDF worker,
+rendering a fixture page served locally"""
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("playwright")
+
+from playwright.sync_api import sync_playwright  # noqa: E402
+
+from app.pdf.browser import CHROMIUM_ARGS, BrowserPool, BrowserThreadPool  # noqa: E402
+
+# Preview page, flagged as ready once "rendered"
+FIXTURE = """<!DOCTYPE html>
+<html>
+  <body>
+    <h1>ATBD</h1>
+    <p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>
+    <script>
+      setTimeout(() => {
+        const ready = document.createElement("div");
+        ready.id = "pdf-preview-ready";
+        document.body.appendChild(ready);
+      }, 100);
+    </script>
+  </body>
+</html>
+"""
+
+
+@pytest.fixture(scope="module")
+def preview_url(tmp_path_factory):
+    """URL of the fixture page, served locally"""
+    directory = tmp_path_factory.mktemp("preview")
+    (directory / "pdf-preview.html").write_text(FIXTURE)
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), partial(SimpleHTTPRequestHandler, directory=str(directory))
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/pdf-preview.html"
+    server.shutdown()
+
+
+def _render(page, url, path):
+    page.goto(url)
+    page.wait_for_selector("#pdf-preview-ready", state="attached", timeout=10000)
+    page.pdf(path=path, format="A4")
+
+
+def test_browser_is_recycled(preview_url, tmp_path):
+    """The browser is kept between jobs, and relaunched after `max_jobs`"""
+    pool = BrowserPool(max_jobs=2)
+    try:
+        browsers = []
+        for i in range(3):
+            with pool.page() as page:
+                browsers.append(page.context.browser)
+                _render(page, preview_url, tmp_path / f"{i}.pdf")
+        assert browsers[0] is browsers[1]
+        assert browsers[2] is not browsers[0]
+        assert not browsers[0].is_connected()
+    finally:
+        pool.close()
+
+
+def test_browser_is_relaunched_after_crash(preview_url, tmp_path):
+    """A crashed browser is replaced on the next job"""
+    pool = BrowserPool(max_jobs=10)
+    try:
+        with pool.page() as page:
+            page.context.browser.close()
+        with pool.page() as page:
+            _render(page, preview_url, tmp_path / "out.pdf")
+        assert (tmp_path / "out.pdf").stat().st_size > 0
+    finally:
+        pool.close()
+
+
+def test_pdfs_are_rendered_concurrently(preview_url, tmp_path):
+    """Each rendering thread keeps its own browser, closed with the pool"""
+    pool = BrowserThreadPool(workers=2, max_jobs=10)
+
+    def render(i):
+        with pool.browser().page() as page:
+            _render(page, preview_url, tmp_path / f"{i}.pdf")
+            return threading.get_ident(), page.context.browser
+
+    try:
+        results = pool.map(render, range(6))
+        browsers = {thread: browser for thread, browser in results}
+        assert 1 <= len(browsers) <= 2
+        assert len({id(browser) for browser in browsers.values()}) == len(browsers)
+        assert all((tmp_path / f"{i}.pdf").stat().st_size > 0 for i in range(6))
+    finally:
+        pool.close()
+    assert not any(browser.is_connected() for browser in browsers.values())
+
+
+def test_benchmark_pdf_generation(preview_url, tmp_path):
+    """Rendering PDFs with the kept browser is faster than launching a
+    browser for each PDF"""
+    jobs = 5
+
+    started_at = time.perf_counter()
+    with sync_playwright() as p:
+        for i in range(jobs):
+            browser = p.chromium.launch(headless=True, args=CHROMIUM_ARGS)
+            page = browser.new_context().new_page()
+            _render(page, preview_url, tmp_path / f"launch-{i}.pdf")
+            browser.close()
+    launched = time.perf_counter() - started_at
+
+    pool = BrowserPool(max_jobs=jobs)
+    started_at = time.perf_counter()
+    try:
+        for i in range(jobs):
+            with pool.page() as page:
+                _render(page, preview_url, tmp_path / f"pool-{i}.pdf")
+    finally:
+        pool.close()
+    pooled = time.perf_counter() - started_at
+
+    print(
+        f"{jobs} PDFs: {launched * 1000:.0f}ms (browser per PDF), "
+        f"{pooled * 1000:.0f}ms (kept browser)"
+    )
+    assert pooled < launched
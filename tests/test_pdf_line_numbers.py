@@ -0,0 +1,191 @@
+"""Tests (and benchmark) of the line numbering of journal PDFs"""
+import io
+import random
+import time
+import zlib
+
+import pytest
+
+pdfplumber = pytest.importorskip("pdfplumber")
+
+from pypdf import PdfReader  # noqa: E402
+from reportlab.lib.pagesizes import A4  # noqa: E402
+from reportlab.pdfgen import canvas  # noqa: E402
+
+from app.pdf.line_numbers import (  # noqa: E402
+    NUMBERS_X,
+    IncrementalUpdate,
+    LineNumbering,
+    _text_lines,
+    add_line_numbers,
+)
+
+HEADER = "This ATBD was downloaded from APT"
+WORDS = "algorithm theoretical basis document retrieval radiance aerosol cloud".split()
+
+
+def make_pdf(path, pages, lines=45):
+    """PDF of `pages` pages, each with a header and `lines` lines of text"""
+    rnd = random.Random(0)
+    can = canvas.Canvas(str(path), pagesize=A4)
+    for _ in range(pages):
+        can.setFont("Helvetica", 8)
+        can.drawCentredString(A4[0] / 2, A4[1] - 20, HEADER)
+        can.setFont("Times-Roman", 11)
+        for i in range(lines):
+            text = " ".join(rnd.choice(WORDS) for _ in range(12))
+            can.drawString(60, A4[1] - 60 - i * 16, text)
+        can.showPage()
+    can.save()
+
+
+def make_raw_pdf(path, pages, lines=10, xref_stream=False):
+    """PDF of `pages` pages whose resources (and size) are only set on their
+    `/Pages` parent, with a classic xref table or an xref stream"""
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(pages))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        (
+            f"<< /Type /Pages /Kids [{kids}] /Count {pages} /MediaBox [0 0 595 842]"
+            " /Resources << /Font << /F1 3 0 R >> >> >>"
+        ).encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Times-Roman >>",
+    ]
+    for i in range(pages):
+        text = " T* ".join(f"(page {i} line {j}) Tj" for j in range(lines))
+        content = f"BT /F1 11 Tf 16 TL 60 780 Td {text} ET".encode()
+        objects.append(f"<< /Type /Page /Parent 2 0 R /Contents {5 + 2 * i} 0 R >>")
+        objects.append(
+            f"<< /Length {len(content)} >>\nstream\n".encode()
+            + content
+            + b"\nendstream"
+        )
+
+    pdf = bytearray(b"%PDF-1.5\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        obj = obj if isinstance(obj, bytes) else obj.encode()
+        pdf += f"{number} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(pdf)
+    size = len(objects) + 1
+    if xref_stream:
+        offsets.append(xref)
+        size += 1
+        data = zlib.compress(
+            b"\x00\x00\x00\x00\xff\xff"
+            + b"".join(b"\x01" + o.to_bytes(4, "big") + b"\x00" for o in offsets)
+        )
+        pdf += (
+            f"{size - 1} 0 obj\n<< /Type /XRef /Size {size} /W [1 4 1] /Root 1 0 R"
+            f" /Filter /FlateDecode /Length {len(data)} >>\nstream\n".encode()
+            + data
+            + b"\nendstream\nendobj\n"
+        )
+    else:
+        pdf += f"xref\n0 {size}\n0000000000 65535 f\r\n".encode()
+        pdf += b"".join(f"{o:010} 00000 n\r\n".encode() for o in offsets)
+        pdf += f"trailer\n<< /Size {size} /Root 1 0 R >>\n".encode()
+    pdf += f"startxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(pdf)
+
+
+def line_numbers(path):
+    """The line numbers (and their vertical position) of each page"""
+    with pdfplumber.open(str(path)) as pdf:
+        return [
+            [
+                (int(word["text"]), round(word["bottom"]))
+                for word in page.extract_words()
+                if word["x1"] <= NUMBERS_X + 1
+            ]
+            for page in pdf.pages
+        ]
+
+
+def test_text_lines(tmp_path):
+    """The lines are the ones extracted by pdfplumber"""
+    make_pdf(tmp_path / "in.pdf", pages=1)
+    with pdfplumber.open(str(tmp_path / "in.pdf")) as pdf:
+        page = pdf.pages[0]
+        expected = page.extract_text_lines(return_chars=False)
+        page.flush_cache()
+        assert _text_lines(page) == expected
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_add_line_numbers(tmp_path, workers):
+    """Lines are numbered across pages, except the ignored ones"""
+    make_pdf(tmp_path / "in.pdf", pages=3, lines=20)
+    add_line_numbers(
+        str(tmp_path / "in.pdf"),
+        str(tmp_path / "out.pdf"),
+        ignore_line_texts={HEADER},
+        workers=workers,
+    )
+
+    pages = line_numbers(tmp_path / "out.pdf")
+    assert [number for page in pages for number, _ in page] == list(range(1, 61))
+    # Numbers follow the lines
+    bottoms = [bottom for _, bottom in pages[0]]
+    assert {b - a for a, b in zip(bottoms, bottoms[1:])} == {16}
+    # The original content is kept
+    reader = PdfReader(str(tmp_path / "out.pdf"), strict=True)
+    assert len(reader.pages) == 3
+    assert HEADER in reader.pages[2].extract_text()
+
+
+@pytest.mark.parametrize("xref_stream", [False, True])
+def test_add_line_numbers_inherited_resources(tmp_path, xref_stream):
+    """The numbers' font is added to the resources the pages inherit (which
+    are kept), and the update's cross-reference section is a stream if the
+    PDF's is"""
+    make_raw_pdf(tmp_path / "in.pdf", pages=2, xref_stream=xref_stream)
+    add_line_numbers(str(tmp_path / "in.pdf"), str(tmp_path / "out.pdf"), workers=1)
+
+    pages = line_numbers(tmp_path / "out.pdf")
+    assert [number for page in pages for number, _ in page] == list(range(1, 21))
+    reader = PdfReader(str(tmp_path / "out.pdf"), strict=True)
+    for i, page in enumerate(reader.pages):
+        assert "/F1" in page["/Resources"]["/Font"]
+        assert f"page {i} line 9" in page.extract_text()
+    # The pages' parent is unchanged
+    assert "/LineNumbers" not in reader.pages[0]["/Parent"]["/Resources"]["/Font"]
+
+    with open(tmp_path / "out.pdf", "rb") as f:
+        tail = f.read()[len((tmp_path / "in.pdf").read_bytes()) :]
+    assert (b"/XRef" in tail) is xref_stream
+    assert (b"\nxref\n" in tail) is not xref_stream
+
+
+def test_font_added_to_inherited_resources(tmp_path):
+    """A page without resources gets a copy of the ones it inherits"""
+    make_raw_pdf(tmp_path / "in.pdf", pages=2)
+    reader = PdfReader(str(tmp_path / "in.pdf"))
+    # Not flattened (as `reader.pages` are) by pypdf
+    page = reader.get_object(4)
+    assert "/Resources" not in page
+
+    numbering = LineNumbering(IncrementalUpdate(reader, io.BytesIO(), 0))
+    name = numbering._font_name(page)
+    assert set(page["/Resources"]["/Font"]) == {"/F1", name}
+    assert set(page["/Parent"]["/Resources"]["/Font"]) == {"/F1"}
+    assert numbering._font_name(page) == name
+
+
+def test_benchmark_add_line_numbers(tmp_path):
+    """Numbers a 200 pages PDF"""
+    pages = 200
+    make_pdf(tmp_path / "in.pdf", pages=pages)
+
+    started_at = time.perf_counter()
+    add_line_numbers(
+        str(tmp_path / "in.pdf"), str(tmp_path / "out.pdf"), ignore_line_texts={HEADER}
+    )
+    elapsed = time.perf_counter() - started_at
+
+    print(f"{pages} pages: {elapsed:.1f}s")
+    with pdfplumber.open(str(tmp_path / "out.pdf"), pages=[pages]) as pdf:
+        numbers = [w["text"] for w in pdf.pages[0].extract_words() if w["x1"] <= 31]
+    assert numbers[-1] == str(pages * 45)
@@ -0,0 +1,125 @@
+"""Benchmark of the search latency with a new client per search (as before the
+clients were pooled) and with pooled (sync and async) clients, against a local
+OpenSearch, eg:
+
+    docker run -p 9200:9200 -e discovery.type=single-node \
+        -e DISABLE_SECURITY_PLUGIN=true opensearchproject/opensearch:2
+
+The benchmark is skipped if no OpenSearch is reachable (on
+`OPENSEARCH_BENCHMARK_HOST`:`OPENSEARCH_BENCHMARK_PORT`, localhost:9200 by
+default)."""
+import asyncio
+import os
+import socket
+import statistics
+import time
+import uuid
+
+import pytest
+
+pytest.importorskip("opensearchpy")
+
+from opensearchpy import (  # noqa: E402
+    AIOHttpConnection,
+    AsyncOpenSearch,
+    OpenSearch,
+    RequestsHttpConnection,
+    helpers,
+)
+
+from app.search.mapping import atbd_index_body  # noqa: E402
+
+HOST = os.environ.get("OPENSEARCH_BENCHMARK_HOST", "localhost")
+PORT = int(os.environ.get("OPENSEARCH_BENCHMARK_PORT", "9200"))
+SEARCHES = 200
+WORDS = "algorithm theoretical basis document retrieval radiance aerosol cloud".split()
+
+
+def _client_options():
+    return dict(hosts=[{"host": HOST, "port": PORT}], timeout=10)
+
+
+def _body(i):
+    return {"query": {"match": {"title": WORDS[i % len(WORDS)]}}, "size": 10}
+
+
+@pytest.fixture(scope="module")
+def index():
+    """Temporary ATBD index, with a few hundred documents"""
+    try:
+        socket.create_connection((HOST, PORT), timeout=1).close()
+    except OSError:
+        pytest.skip(f"No OpenSearch reachable on {HOST}:{PORT}")
+
+    client = OpenSearch(**_client_options())
+    name = f"atbd-benchmark-{uuid.uuid4().hex}"
+    client.indices.create(
+        name, body=atbd_index_body(shards=1, replicas=0, refresh_interval="1s")
+    )
+    helpers.bulk(
+        client,
+        (
+            {
+                "_index": name,
+                "_id": f"{i}_1",
+                "title": " ".join(WORDS[j % len(WORDS)] for j in range(i, i + 5)),
+            }
+            for i in range(500)
+        ),
+    )
+    client.indices.refresh(name)
+    yield name
+    client.indices.delete(name)
+    client.close()
+
+
+def _report(label, timings):
+    timings = sorted(t * 1000 for t in timings)
+    print(
+        f"{label}: {statistics.median(timings):.2f}ms median, "
+        f"{timings[int(len(timings) * 0.95)]:.2f}ms p95"
+    )
+
+
+@pytest.mark.benchmark
+def test_benchmark_search_latency(index):
+    """Searches with a client per search, with a pooled client and with a
+    pooled async client (the timings are reported, not asserted)"""
+    per_search = []
+    for i in range(SEARCHES):
+        started_at = time.perf_counter()
+        client = OpenSearch(
+            **_client_options(), connection_class=RequestsHttpConnection
+        )
+        client.search(body=_body(i), index=index)
+        per_search.append(time.perf_counter() - started_at)
+        client.close()
+
+    pooled = []
+    client = OpenSearch(
+        **_client_options(), connection_class=RequestsHttpConnection, pool_maxsize=10
+    )
+    for i in range(SEARCHES):
+        started_at = time.perf_counter()
+        result = client.search(body=_body(i), index=index)
+        pooled.append(time.perf_counter() - started_at)
+    client.close()
+    assert result["hits"]["total"]["value"] > 0
+
+    async def search_async():
+        timings = []
+        client = AsyncOpenSearch(
+            **_client_options(), connection_class=AIOHttpConnection, maxsize=10
+        )
+        for i in range(SEARCHES):
+            started_at = time.perf_counter()
+            await client.search(body=_body(i), index=index)
+            timings.append(time.perf_counter() - started_at)
+        await client.close()
+        return timings
+
+    pooled_async = asyncio.run(search_async())
+
+    _report("client per search", per_search)
+    _report("pooled client", pooled)
+    _report("pooled async client", pooled_async)
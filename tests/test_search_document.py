@@ -0,0 +1,218 @@
+"""Tests (and benchmarks) for the extraction of the indexed text of the
+version documents"""
+import re
+import time
+from typing import Any
+
+import pytest
+
+from app.schemas import document as _document
+from app.search.text import INDEXED_SECTIONS, extract_document_text
+
+
+def _legacy_cleanup(document: dict) -> dict:
+    """Indexed text of a document, as extracted by the pydantic based
+    cleaner `extract_document_text` replaced"""
+    v = _document.Document.parse_obj(document)
+
+    def _clean(d: Any) -> Any:
+        if not d:
+            return
+        if isinstance(d, _document.PublicationReference):
+            return d.dict(exclude_none=True, exclude_unset=True)
+        if isinstance(d, str):
+            return " ".join(re.findall(r"\w+", d))
+        if isinstance(d, list):
+            return [_clean(_d) for _d in d]
+        if isinstance(d, _document.AlgorithmVariable):
+            return [_clean(d.name), _clean(d.unit)]
+        if isinstance(d, _document.DataAccessUrl):
+            return [_clean(d.url), _clean(d.description)]
+        if isinstance(d, _document.TextLeaf):
+            return _clean(d.text)
+        if isinstance(d, (_document.EquationNode, _document.EquationInlineNode)):
+            return
+        if isinstance(
+            d,
+            (_document.SectionWrapper, _document.DivWrapperNode, _document.BaseNode),
+        ):
+            return _clean(d.children)
+        raise Exception("Unhandled Node! ", d)
+
+    return {
+        field: _clean(getattr(v, field))
+        for field in v.__fields__
+        if field not in ["version_description"]
+    }
+
+
+def _words(value: Any) -> list:
+    """Words of a (nested) value of the legacy cleaner"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return value.split()
+    return [word for v in value for word in _words(v)]
+
+
+def _text(text):
+    return {"text": text}
+
+
+def _p(*children):
+    return {"type": "p", "children": list(children)}
+
+
+def _blocks(i):
+    """Blocks of a section, covering all the node types"""
+    return [
+        _p(
+            _text(f"Paragraph {i}: the (retrieved) "),
+            {"text": "bold", "bold": True},
+            _text("-ish values, "),
+            {
+                "type": "a",
+                "url": "https://example.com/path?q=1",
+                "children": [_text("a link")],
+            },
+            _text(" and "),
+            {"type": "equation-inline", "children": [_text("\\alpha_{i}")]},
+            {"type": "ref", "refId": "ref1", "children": [_text("[1]")]},
+        ),
+        {
+            "type": "ul",
+            "children": [
+                {
+                    "type": "li",
+                    "children": [
+                        _p(_text(f"item {i}.1")),
+                        {
+                            "type": "ol",
+                            "children": [
+                                {"type": "li", "children": [_p(_text("nested item"))]}
+                            ],
+                        },
+                    ],
+                }
+            ],
+        },
+        {
+            "type": "table-block",
+            "children": [
+                {
+                    "type": "table",
+                    "children": [
+                        {
+                            "type": "tr",
+                            "children": [
+                                {"type": "td", "children": [_p(_text("cell, one"))]},
+                                {"type": "td", "children": [_p(_text("cell #2"))]},
+                            ],
+                        }
+                    ],
+                },
+                {"type": "caption", "children": [_text(f"Table {i} caption")]},
+            ],
+        },
+        {
+            "type": "image-block",
+            "children": [
+                {"type": "img", "objectKey": "figure.png", "children": [_text("")]},
+                {"type": "caption", "children": [_text("Figure caption")]},
+            ],
+        },
+        {"type": "equation", "children": [_text("E = mc^2")]},
+        {"type": "sub-section", "id": f"s{i}", "children": [_text("Sub section")]},
+    ]
+
+
+def _variable(name):
+    div = {"children": [_p(_text(name))]}
+    return {"name": div, "long_name": {"children": [_p(_text("long"))]}, "unit": div}
+
+
+def _document_fixture(blocks=1):
+    """Document with every section filled in (with `blocks` sets of blocks
+    per WYSIWYG section)"""
+    document = {
+        "key_points": "Key points: one, two & three",
+        "algorithm_input_variables": [_variable("Input (K)")],
+        "algorithm_input_variables_caption": "Inputs",
+        "algorithm_output_variables": [_variable("Output [m/s]")],
+        "algorithm_output_variables_caption": "Outputs",
+        "publication_references": [
+            {"id": "ref1", "authors": "Doe, J.", "title": "A title", "year": "2020"}
+        ],
+    }
+    for section in ("algorithm_implementations", "data_access_related_urls"):
+        document[section] = [
+            {"url": "https://example.com/data", "description": "The data, v2"},
+            {"url": "", "description": "No url"},
+        ]
+    document["data_access_input_data"] = []
+    for section, field in _document.Document.__fields__.items():
+        if section not in document and field.type_ is _document.SectionWrapper:
+            document[section] = {
+                "children": [block for i in range(blocks) for block in _blocks(i)]
+            }
+    return document
+
+
+def test_indexed_words_match_legacy_cleaner():
+    """The words indexed for each section are the ones the previous
+    (pydantic based) cleaner indexed"""
+    document = _document_fixture()
+    legacy = _legacy_cleanup(document)
+    extracted = extract_document_text(document)
+
+    assert "version_description" not in extracted
+    for section in INDEXED_SECTIONS:
+        if section == "publication_references":
+            assert extracted[section] == legacy[section]
+        else:
+            assert _words(extracted.get(section)) == _words(legacy[section]), section
+
+
+def test_section_text():
+    """Each section is indexed as a single string of words: the text of
+    equations, and the urls of links, aren't indexed. Empty sections are
+    left out."""
+    extracted = extract_document_text(_document_fixture())
+    assert extracted["abstract"].startswith(
+        "Paragraph 0 the retrieved bold ish values a link and 1 item 0 1 nested item "
+        "cell one cell 2 Table 0 caption Figure caption Sub section"
+    )
+    assert "alpha" not in extracted["abstract"]
+    assert "mc" not in extracted["abstract"]
+    assert extracted["key_points"] == "Key points one two three"
+    assert extracted["algorithm_input_variables"] == "Input K Input K"
+    assert "data_access_input_data" not in extracted
+
+
+@pytest.mark.benchmark
+def test_benchmark_extract_document_text():
+    """Extracts the indexed text of a large document (~1k blocks) with the
+    previous cleaner and with `extract_document_text` (the timings are
+    reported, not asserted)"""
+    document = _document_fixture(blocks=10)
+    blocks = sum(
+        len(v["children"])
+        for v in document.values()
+        if isinstance(v, dict) and "children" in v
+    )
+
+    started_at = time.perf_counter()
+    legacy = _legacy_cleanup(document)
+    legacy_time = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    extracted = extract_document_text(document)
+    extracted_time = time.perf_counter() - started_at
+
+    print(
+        f"{blocks} blocks: {legacy_time * 1000:.1f}ms (pydantic cleaner), "
+        f"{extracted_time * 1000:.1f}ms (extract_document_text)"
+    )
+    for section in INDEXED_SECTIONS:
+        if section != "publication_references":
+            assert _words(extracted.get(section)) == _words(legacy[section])
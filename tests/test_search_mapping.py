@@ -0,0 +1,80 @@
+"""Tests for the explicit mapping of the ATBD index"""
+from app.schemas.document import Document
+from app.search.mapping import (
+    ATBD_MAPPING_VERSION,
+    SKIPPED_SECTIONS,
+    TEXT_ANALYZER,
+    atbd_index_body,
+    atbd_mappings,
+)
+
+
+def _fields(properties, prefix=""):
+    """Yields the (path, mapping) pairs of all the mapped fields"""
+    for name, mapping in properties.items():
+        path = f"{prefix}{name}"
+        if "properties" in mapping:
+            yield from _fields(mapping["properties"], f"{path}.")
+        else:
+            yield path, mapping
+
+
+def test_index_body():
+    """The settings are applied, along with the mapping and aliases"""
+    body = atbd_index_body(
+        shards=2, replicas=0, refresh_interval="-1", aliases={"atbd": {}}
+    )
+    assert body["settings"]["index"] == {
+        "number_of_shards": 2,
+        "number_of_replicas": 0,
+        "refresh_interval": "-1",
+    }
+    assert TEXT_ANALYZER in body["settings"]["analysis"]["analyzer"]
+    assert body["aliases"] == {"atbd": {}}
+    assert body["mappings"] == atbd_mappings()
+    assert "aliases" not in atbd_index_body(shards=1, replicas=1, refresh_interval="1s")
+
+
+def test_mapping_is_explicit_and_versioned():
+    """Unmapped fields aren't indexed, and the mapping version is recorded"""
+    mappings = atbd_mappings()
+    assert mappings["dynamic"] is False
+    assert mappings["_meta"] == {"mapping_version": ATBD_MAPPING_VERSION}
+    assert mappings["_source"]["excludes"]
+
+
+def test_sections_are_analyzed_text():
+    """Every indexed section of the document is analyzed text, without any
+    keyword subfield"""
+    document = atbd_mappings()["properties"]["version"]["properties"]["document"]
+    sections = document["properties"]
+    for section in Document.__fields__:
+        if section in SKIPPED_SECTIONS:
+            assert section not in sections
+        elif section != "publication_references":
+            assert sections[section] == {"type": "text", "analyzer": TEXT_ANALYZER}
+
+
+def test_identifiers_are_keywords():
+    """Identifiers are matched exactly"""
+    fields = dict(_fields(atbd_mappings()["properties"]))
+    for path in [
+        "id",
+        "alias",
+        "version.version",
+        "version.doi",
+        "version.keywords.label",
+        "version.keywords.path",
+        "version.keywords.value",
+        "version.document.publication_references.doi",
+    ]:
+        assert fields[path] == {"type": "keyword"}, path
+
+
+def test_only_title_has_subfields():
+    """Text fields aren't duplicated as keywords (except the title, which is
+    sorted on)"""
+    fields = dict(_fields(atbd_mappings()["properties"]))
+    assert [path for path, mapping in fields.items() if "fields" in mapping] == [
+        "title"
+    ]
@@ -0,0 +1,435 @@
+"""Tests of the worker runtime, against an in-memory stand-in of SQS"""
+import base64
+import itertools
+import os
+import pickle
+import signal
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.task_runtime import (
+    MAX_MESSAGE_BYTES,
+    TaskRuntime,
+    batch_entries,
+    chunk_by_size,
+    decode_task,
+    encode_task,
+)
+
+
+class FakeMessage:
+    """Received message"""
+
+    def __init__(self, queue, message_id, body, receipt_handle, receives):
+        self.queue = queue
+        self.message_id = message_id
+        self.body = body
+        self.receipt_handle = receipt_handle
+        self.attributes = {"ApproximateReceiveCount": str(receives)}
+
+    def delete(self):
+        self.queue.delete(self.receipt_handle)
+
+    def change_visibility(self, VisibilityTimeout):
+        self.queue.change_visibility(self.receipt_handle, VisibilityTimeout)
+
+
+class FakeQueue:
+    """In-memory stand-in of an SQS queue (messages are invisible for
+    `visibility_timeout` seconds once received, and their receipt handle
+    changes on each receive)"""
+
+    def __init__(self, visibility_timeout=30):
+        self.visibility_timeout = visibility_timeout
+        self.messages = {}
+        self.deleted = []
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def send_message(self, MessageBody):
+        with self._lock:
+            message_id = str(next(self._ids))
+            self.messages[message_id] = dict(
+                body=MessageBody, visible_at=0, receives=0, receipt_handle=None
+            )
+
+    def receive_messages(self, MaxNumberOfMessages, WaitTimeSeconds, AttributeNames):
+        deadline = time.monotonic() + WaitTimeSeconds
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                received = []
+                for message_id, message in self.messages.items():
+                    if len(received) == MaxNumberOfMessages:
+                        break
+                    if message["visible_at"] > now:
+                        continue
+                    message["receives"] += 1
+                    message["receipt_handle"] = f"{message_id}-{message['receives']}"
+                    message["visible_at"] = now + self.visibility_timeout
+                    received.append(
+                        FakeMessage(
+                            self,
+                            message_id,
+                            message["body"],
+                            message["receipt_handle"],
+                            message["receives"],
+                        )
+                    )
+            if received or now >= deadline:
+                return received
+            time.sleep(0.01)
+
+    def _find(self, receipt_handle):
+        for message_id, message in self.messages.items():
+            if message["receipt_handle"] == receipt_handle:
+                return message_id, message
+        raise KeyError(receipt_handle)
+
+    def delete(self, receipt_handle):
+        with self._lock:
+            message_id, message = self._find(receipt_handle)
+            del self.messages[message_id]
+            self.deleted.append(pickle.loads(base64.b64decode(message["body"])))
+
+    def change_visibility(self, receipt_handle, timeout):
+        with self._lock:
+            self._find(receipt_handle)[1]["visible_at"] = time.monotonic() + timeout
+
+    def change_message_visibility_batch(self, Entries):
+        failed = []
+        for entry in Entries:
+            try:
+                self.change_visibility(
+                    entry["ReceiptHandle"], entry["VisibilityTimeout"]
+                )
+            except KeyError:
+                failed.append({"Id": entry["Id"]})
+        return {"Failed": failed}
+
+
+def send(queue, task_type, **payload):
+    queue.send_message(
+        MessageBody=base64.b64encode(
+            pickle.dumps({"task_type": task_type, "payload": payload})
+        ).decode()
+    )
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=4)
+    yield executor
+    executor.shutdown()
+
+
+def make_runtime(queues, handlers, executor, **kwargs):
+    options = dict(
+        executors={},
+        default_executor=executor,
+        capacity=4,
+        retry_delay=0,
+        wait_time=0.05,
+        drain_timeout=5,
+    )
+    options.update(kwargs)
+    return TaskRuntime(queues=queues, handlers=handlers, **options)
+
+
+def run_until(runtime, condition, timeout=5):
+    """Runs the runtime (in a thread) until the condition is met"""
+    thread = threading.Thread(target=runtime.run)
+    thread.start()
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    runtime.stop()
+    thread.join(timeout)
+    assert not thread.is_alive()
+
+
+def test_failed_tasks_are_retried_then_dead_lettered(executor):
+    """Messages are deleted once their task succeeded; failed tasks are
+    retried until their retry budget is spent"""
+    queue, dead_letter_queue = FakeQueue(), FakeQueue()
+    calls = Counter()
+
+    def flaky(name, failures):
+        calls[name] += 1
+        if calls[name] <= failures:
+            raise ValueError(name)
+
+    send(queue, "flaky", name="ok", failures=0)
+    send(queue, "flaky", name="retried", failures=1)
+    send(queue, "flaky", name="failing", failures=10)
+    runtime = make_runtime(
+        [queue],
+        {"flaky": flaky},
+        executor,
+        max_receives=3,
+        dead_letter_queue=dead_letter_queue,
+    )
+    run_until(runtime, lambda: not queue.messages)
+
+    assert calls == {"ok": 1, "retried": 2, "failing": 3}
+    assert [task["payload"]["name"] for task in queue.deleted] == [
+        "ok",
+        "retried",
+        "failing",
+    ]
+    [(_, dead_letter)] = dead_letter_queue.messages.items()
+    assert pickle.loads(base64.b64decode(dead_letter["body"]))["payload"] == {
+        "name": "failing",
+        "failures": 10,
+    }
+
+
+def test_concurrency_per_task_type(executor):
+    """Tasks are handled by the executor of their type"""
+    queue = FakeQueue()
+    running, max_running = Counter(), Counter()
+    lock = threading.Lock()
+
+    def task(kind):
+        with lock:
+            running[kind] += 1
+            max_running[kind] = max(max_running[kind], running[kind])
+        time.sleep(0.05)
+        with lock:
+            running[kind] -= 1
+
+    for _ in range(6):
+        send(queue, "heavy", kind="heavy")
+        send(queue, "light", kind="light")
+    heavy_executor = ThreadPoolExecutor(max_workers=1)
+    runtime = make_runtime(
+        [queue],
+        {"heavy": task, "light": task},
+        executor,
+        executors={"heavy": heavy_executor},
+        capacity=8,
+    )
+    try:
+        run_until(runtime, lambda: len(queue.deleted) == 12)
+    finally:
+        heavy_executor.shutdown()
+
+    assert max_running["heavy"] == 1
+    assert max_running["light"] > 1
+    assert len(queue.deleted) == 12
+
+
+def test_long_tasks_are_kept_invisible(executor):
+    """The visibility timeout of running tasks is extended, so that they
+    aren't redelivered"""
+    queue = FakeQueue(visibility_timeout=0.2)
+    calls = Counter()
+
+    def slow():
+        calls["slow"] += 1
+        time.sleep(0.8)
+
+    send(queue, "slow")
+    runtime = make_runtime([queue], {"slow": slow}, executor, visibility_timeout=0.2)
+    run_until(runtime, lambda: queue.deleted)
+    assert calls["slow"] == 1
+
+
+def test_heartbeat_keeps_the_retry_backoff(executor):
+    """A heartbeat in progress when a task fails doesn't override the retry
+    backoff of its message"""
+    extending, release = threading.Event(), threading.Event()
+
+    class SlowHeartbeatQueue(FakeQueue):
+        def change_message_visibility_batch(self, Entries):
+            extending.set()
+            release.wait(5)
+            return super().change_message_visibility_batch(Entries)
+
+    queue = SlowHeartbeatQueue()
+    fail = threading.Event()
+
+    def failing():
+        fail.wait(5)
+        raise RuntimeError("Task failed")
+
+    send(queue, "failing")
+    runtime = make_runtime([queue], {"failing": failing}, executor, retry_delay=100)
+    [message] = queue.receive_messages(1, 0, [])
+    runtime._dispatch(queue, message)
+
+    heartbeat = threading.Thread(target=runtime._extend_visibility)
+    heartbeat.start()
+    assert extending.wait(5)
+    # The task fails (and its message is settled) while the heartbeat is
+    # extending the visibility of its message
+    fail.set()
+    time.sleep(0.1)
+    release.set()
+    heartbeat.join(5)
+
+    def visible_in():
+        return queue.messages[message.message_id]["visible_at"] - time.monotonic()
+
+    deadline = time.monotonic() + 1
+    while visible_in() < 90 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # Not overridden afterwards
+    time.sleep(0.1)
+    assert not runtime._in_flight
+    assert visible_in() > 90
+
+
+def test_duplicate_tasks_are_coalesced(executor):
+    """Tasks with the same key as a running task are dropped"""
+    queue = FakeQueue()
+    calls = Counter()
+
+    def render(filepath):
+        calls[filepath] += 1
+        time.sleep(0.1)
+
+    for filepath in ["a.pdf", "a.pdf", "b.pdf", "a.pdf"]:
+        send(queue, "render", filepath=filepath)
+    runtime = make_runtime(
+        [queue],
+        {"render": render},
+        executor,
+        coalesce_key=lambda task: task["payload"]["filepath"],
+    )
+    run_until(runtime, lambda: not queue.messages)
+    assert calls == {"a.pdf": 1, "b.pdf": 1}
+
+
+def test_priority_queue_is_handled_first(executor):
+    """Messages of the first queue are received ahead of the others"""
+    queue, priority_queue = FakeQueue(), FakeQueue()
+    handled = []
+    for i in range(3):
+        send(queue, "task", name=f"draft-{i}")
+        send(priority_queue, "task", name=f"published-{i}")
+    runtime = make_runtime(
+        [priority_queue, queue],
+        {"task": lambda name: handled.append(name)},
+        ThreadPoolExecutor(max_workers=1),
+        capacity=1,
+    )
+    run_until(runtime, lambda: len(handled) == 6)
+    assert [name.split("-")[0] for name in handled] == ["published"] * 3 + ["draft"] * 3
+
+
+def test_sigterm_drains_running_tasks(executor):
+    """On SIGTERM, no message is received anymore, running tasks are waited
+    for, and the messages of the unfinished ones are released"""
+    queue = FakeQueue()
+    started = threading.Event()
+    release = threading.Event()
+
+    def short():
+        started.set()
+        time.sleep(0.2)
+
+    def stuck():
+        release.wait(5)
+
+    send(queue, "short")
+    send(queue, "stuck")
+    runtime = make_runtime(
+        [queue], {"short": short, "stuck": stuck}, executor, drain_timeout=0.5
+    )
+    previous = {s: signal.getsignal(s) for s in (signal.SIGTERM, signal.SIGINT)}
+    runtime.install_signal_handlers()
+    try:
+        threading.Timer(
+            0.1, lambda: started.wait(5) and os.kill(os.getpid(), signal.SIGTERM)
+        ).start()
+        # Sent once the runtime is stopping: never received
+        threading.Timer(0.2, send, args=(queue, "short")).start()
+        runtime.run()
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+        release.set()
+
+    assert [task["task_type"] for task in queue.deleted] == ["short"]
+    stuck_message, unreceived = sorted(
+        queue.messages.values(), key=lambda message: -message["receives"]
+    )
+    assert stuck_message["receives"] == 1
+    assert stuck_message["visible_at"] <= time.monotonic()
+    assert unreceived["receives"] == 0
+
+
+def test_drain_cancels_tasks_not_started():
+    """On stop, the tasks waiting for an executor thread are cancelled (and
+    their messages released) instead of being run during the drain"""
+    queue = FakeQueue()
+    calls = Counter()
+    started = threading.Event()
+    release = threading.Event()
+
+    def stuck():
+        calls["stuck"] += 1
+        started.set()
+        release.wait(5)
+
+    def waiting():
+        calls["waiting"] += 1
+
+    send(queue, "stuck")
+    send(queue, "waiting")
+    send(queue, "waiting")
+    # A single thread: the waiting tasks are queued behind the stuck one
+    executor = ThreadPoolExecutor(max_workers=1)
+    runtime = make_runtime(
+        [queue], {"stuck": stuck, "waiting": waiting}, executor, drain_timeout=0.2
+    )
+    try:
+        run_until(runtime, lambda: started.is_set() and len(runtime._in_flight) == 3)
+        # All the messages are released: none of them was handled
+        assert queue.deleted == []
+        assert [m["receives"] for m in queue.messages.values()] == [1, 1, 1]
+        now = time.monotonic()
+        assert all(m["visible_at"] <= now for m in queue.messages.values())
+    finally:
+        release.set()
+        executor.shutdown()
+    assert calls == {"stuck": 1}
+
+
+def test_tasks_fit_in_messages():
+    """Payloads are chunked by count and by encoded size, and the messages
+    are batched within the limits of SQS"""
+    emails = [
+        {"to": f"user{i}@example.com", "html": "<p>comment</p>" * (i % 7) * 500}
+        for i in range(300)
+    ]
+    chunks = list(chunk_by_size(emails, max_items=50))
+    assert [email for chunk in chunks for email in chunk] == emails
+    assert all(len(chunk) <= 50 for chunk in chunks)
+
+    bodies = [encode_task("send", {"emails": chunk}) for chunk in chunks]
+    assert all(len(body) <= MAX_MESSAGE_BYTES for body in bodies)
+    assert [decode_task(body)["payload"]["emails"] for body in bodies] == chunks
+
+    batches = list(batch_entries(bodies, delay=60))
+    assert [e["MessageBody"] for entries in batches for e in entries] == bodies
+    for entries in batches:
+        assert len(entries) <= 10
+        assert sum(len(e["MessageBody"]) for e in entries) <= MAX_MESSAGE_BYTES
+        assert len({e["Id"] for e in entries}) == len(entries)
+        assert {e["DelaySeconds"] for e in entries} == {60}
+
+
+def test_large_items_are_chunked_alone():
+    """An item too large for a message is yielded on its own"""
+    items = ["small", "x" * MAX_MESSAGE_BYTES, "small"]
+    assert list(chunk_by_size(items, max_items=10)) == [
+        ["small"],
+        ["x" * MAX_MESSAGE_BYTES],
+        ["small"],
+    ]
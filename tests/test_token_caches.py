@@ -0,0 +1,145 @@
+"""Tests for the caches of Cognito's signing keys and of the validated tokens,
+with a fake clock"""
+import threading
+import time
+
+import pytest
+
+from app.users.token_caches import JwksCache, ValidatedTokenCache
+
+from fastapi import HTTPException
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeJwks:
+    """JWKS endpoint returning the current `kids`, counting the fetches (which
+    can be held, to let concurrent requests pile up)"""
+
+    def __init__(self, kids):
+        self.kids = kids
+        self.fetches = 0
+        self.release = threading.Event()
+        self.release.set()
+        self.fetching = threading.Event()
+
+    def __call__(self, url):
+        self.fetches += 1
+        self.fetching.set()
+        self.release.wait(5)
+        return [{"kid": kid} for kid in self.kids]
+
+
+def _jwks_cache(kids=("key1",), ttl=3600):
+    clock, jwks = FakeClock(), FakeJwks(list(kids))
+    cache = JwksCache(
+        "https://cognito/jwks.json",
+        ttl=ttl,
+        construct_key=lambda key: f"public {key['kid']}",
+        fetch=jwks,
+        clock=clock,
+    )
+    return cache, jwks, clock
+
+
+def test_keys_are_fetched_once_until_they_expire():
+    """The keys are fetched on first use, and re-fetched once expired"""
+    cache, jwks, clock = _jwks_cache(ttl=3600)
+    assert cache.get("key1") == "public key1"
+    clock.now += 3600
+    assert cache.get("key1") == "public key1"
+    assert jwks.fetches == 1
+
+    jwks.kids = ["key2"]
+    clock.now += 1
+    assert cache.get("key2") == "public key2"
+    assert jwks.fetches == 2
+    with pytest.raises(HTTPException):
+        cache.get("key1")
+
+
+def test_unknown_kid_refreshes_are_throttled():
+    """A token signed with an unknown key only triggers a refresh if the keys
+    were fetched more than `MIN_REFRESH_INTERVAL` seconds ago"""
+    cache, jwks, clock = _jwks_cache()
+    cache.get("key1")
+
+    jwks.kids = ["key1", "rotated"]
+    clock.now += JwksCache.MIN_REFRESH_INTERVAL
+    for _ in range(10):
+        with pytest.raises(HTTPException) as e:
+            cache.get("rotated")
+        assert e.value.status_code == 400
+    assert jwks.fetches == 1
+
+    clock.now += 1
+    assert cache.get("rotated") == "public rotated"
+    assert jwks.fetches == 2
+    # A bogus key is only looked up again 30s later
+    with pytest.raises(HTTPException):
+        cache.get("bogus")
+    assert jwks.fetches == 2
+
+
+def test_concurrent_refreshes_are_single_flight():
+    """Requests waiting on a refresh re-use its result instead of fetching the
+    keys again"""
+    cache, jwks, _ = _jwks_cache()
+    jwks.release.clear()
+    keys = []
+
+    def get():
+        keys.append(cache.get("key1"))
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    assert jwks.fetching.wait(5)
+    # Let the other threads block on the refresh in progress
+    time.sleep(0.1)
+    jwks.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert keys == ["public key1"] * 8
+    assert jwks.fetches == 1
+
+
+def test_validated_tokens_expire_at_exp():
+    """The claims of a token are dropped once the token expires"""
+    clock = FakeClock()
+    cache = ValidatedTokenCache(maxsize=10, clock=clock)
+    claims = {"sub": "user1", "exp": clock.now + 60}
+    cache.set("token", claims)
+
+    assert cache.get("token") is claims
+    assert cache.get("other token") is None
+    clock.now += 60
+    assert cache.get("token") is claims
+    clock.now += 1
+    assert cache.get("token") is None
+    assert len(cache._claims) == 0
+
+
+def test_validated_tokens_lru_eviction():
+    """The least recently used tokens are evicted first"""
+    clock = FakeClock()
+    cache = ValidatedTokenCache(maxsize=2, clock=clock)
+    for token in ("a", "b"):
+        cache.set(token, {"sub": token, "exp": clock.now + 60})
+    # `a` becomes the most recently used
+    assert cache.get("a")["sub"] == "a"
+    cache.set("c", {"sub": "c", "exp": clock.now + 60})
+
+    assert cache.get("b") is None
+    assert [cache.get(token)["sub"] for token in ("a", "c")] == ["a", "c"]
+
+    disabled = ValidatedTokenCache(maxsize=0, clock=clock)
+    disabled.set("a", {"sub": "a", "exp": clock.now + 60})
+    assert disabled.get("a") is None
@@ -0,0 +1,212 @@
+"""Tests for the in-memory directory of the app users, with a stubbed Cognito
+lister and shared store, and a fake clock"""
+import threading
+import time
+
+import pytest
+
+from app.schemas.users import CognitoUser
+from app.users.app_users import UserDirectory
+
+TTL = 300
+MAX_STALE = 3600
+
+
+def _user(sub, *groups):
+    return CognitoUser(
+        sub=sub,
+        email=f"{sub}@example.com",
+        preferred_username=sub.title(),
+        **{"cognito:groups": list(groups)},
+    )
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class Cognito:
+    """Cognito lister returning the current `users`, counting the listings
+    (which can be held, to check they run in the background)"""
+
+    def __init__(self, *users):
+        self.users = {u.sub: u for u in users}
+        self.listings = 0
+        self.release = threading.Event()
+        self.release.set()
+        self.listed = threading.Event()
+
+    def __call__(self):
+        self.release.wait(5)
+        self.listings += 1
+        self.listed.set()
+        return dict(self.users)
+
+
+class SharedStore:
+    """Shared `cognito_users` table"""
+
+    def __init__(self, users=None, error=None):
+        self.users = users
+        self.error = error
+        self.loads = []
+        self.saves = []
+
+    def load(self, max_age):
+        self.loads.append(max_age)
+        if self.error:
+            raise self.error
+        return self.users
+
+    def save(self, app_users):
+        if self.error:
+            raise self.error
+        self.saves.append(app_users)
+
+
+def _wait_for_refresh(directory):
+    """Waits for the background refresh of the directory to complete"""
+    deadline = time.monotonic() + 5
+    while directory._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not directory._refreshing
+
+
+def _directory(cognito, shared=None):
+    clock = FakeClock()
+    store = shared or SharedStore()
+    directory = UserDirectory(
+        ttl=TTL,
+        max_stale=MAX_STALE,
+        shared=shared is not None,
+        fetch=cognito,
+        load_shared=store.load,
+        save_shared=store.save,
+        clock=clock,
+    )
+    return directory, clock
+
+
+def test_users_are_served_from_memory_until_they_expire():
+    """The users are listed on first use, and re-listed synchronously once
+    they are older than `max_stale`"""
+    cognito = Cognito(_user("alice", "curator"), _user("bob", "contributor"))
+    directory, clock = _directory(cognito)
+
+    app_users, request_id = directory.users()
+    assert set(app_users) == {"alice", "bob"}
+    assert directory.subs_in_group("curator") == ["alice"]
+    assert [u.sub for u in directory.users_in_group("contributor")] == ["bob"]
+    assert app_users["deleted"].is_dangling
+    clock.now += TTL
+    assert directory.users() == (app_users, request_id)
+    assert cognito.listings == 1
+
+    cognito.users["carol"] = _user("carol", "curator")
+    clock.now += MAX_STALE
+    app_users, new_request_id = directory.users()
+    assert new_request_id != request_id
+    assert "carol" in app_users
+    assert directory.subs_in_group("curator") == ["alice", "carol"]
+    assert cognito.listings == 2
+
+
+def test_stale_users_are_refreshed_in_the_background():
+    """Once the TTL expired, the stale users are served while a single
+    background thread lists the users again"""
+    cognito = Cognito(_user("alice", "curator"))
+    directory, clock = _directory(cognito)
+    _, request_id = directory.users()
+
+    cognito.release.clear()
+    cognito.listed.clear()
+    cognito.users["bob"] = _user("bob", "curator")
+    clock.now += TTL + 1
+    for _ in range(5):
+        app_users, stale_request_id = directory.users()
+        assert stale_request_id == request_id
+        assert set(app_users) == {"alice"}
+
+    cognito.release.set()
+    assert cognito.listed.wait(5)
+    _wait_for_refresh(directory)
+    assert cognito.listings == 2
+    app_users, fresh_request_id = directory.users()
+    assert fresh_request_id != request_id
+    assert set(app_users) == {"alice", "bob"}
+
+
+def test_background_refresh_failure_keeps_the_stale_users():
+    """A failed background refresh is logged, and retried on the next
+    access"""
+    cognito = Cognito(_user("alice", "curator"))
+    directory, clock = _directory(cognito)
+    app_users, request_id = directory.users()
+
+    failed = threading.Event()
+
+    def failing():
+        failed.set()
+        raise RuntimeError("Cognito is down")
+
+    directory._fetch = failing
+    clock.now += TTL + 1
+    assert directory.users() == (app_users, request_id)
+    assert failed.wait(5)
+    _wait_for_refresh(directory)
+    assert directory.users() == (app_users, request_id)
+
+
+def test_cold_start_loads_the_shared_users():
+    """A new directory loads the users from the shared store (if they are
+    fresh enough) instead of listing them from Cognito"""
+    cognito = Cognito(_user("alice", "curator"))
+    store = SharedStore(users={"bob": _user("bob", "contributor")})
+    directory, clock = _directory(cognito, shared=store)
+
+    app_users, _ = directory.users()
+    assert set(app_users) == {"bob"}
+    assert store.loads == [MAX_STALE]
+    assert cognito.listings == 0
+
+    # Later refreshes list the users from Cognito, and save them
+    clock.now += MAX_STALE + 1
+    app_users, _ = directory.users()
+    assert set(app_users) == {"alice"}
+    assert store.loads == [MAX_STALE]
+    assert [set(users) for users in store.saves] == [{"alice"}]
+
+
+@pytest.mark.parametrize(
+    "store", [SharedStore(users=None), SharedStore(error=RuntimeError("No table"))]
+)
+def test_cold_start_without_shared_users(store):
+    """Users are listed from Cognito if the shared store is empty (or
+    outdated) or fails: the errors of the store are only logged"""
+    cognito = Cognito(_user("alice", "curator"))
+    directory, _ = _directory(cognito, shared=store)
+
+    app_users, _ = directory.users()
+    assert set(app_users) == {"alice"}
+    assert cognito.listings == 1
+    assert [set(users) for users in store.saves] == ([] if store.error else [{"alice"}])
+
+
+def test_unshared_directory_ignores_the_shared_store():
+    """A directory which isn't shared only lists the users from Cognito"""
+    cognito = Cognito(_user("alice", "curator"))
+    directory = UserDirectory(
+        ttl=TTL,
+        max_stale=MAX_STALE,
+        shared=False,
+        fetch=cognito,
+        load_shared=pytest.fail,
+        save_shared=pytest.fail,
+        clock=FakeClock(),
+    )
+    directory.refresh(from_shared=True)
+    assert set(directory.users()[0]) == {"alice"}
@@ -0,0 +1,68 @@
+"""Tests for the serialization of the versions' document in the summary
+outputs"""
+from typing import Optional
+
+import pytest
+from pydantic import BaseModel
+from pydantic.utils import GetterDict
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.exc import DetachedInstanceError
+
+from app.db.models import AtbdVersions
+from app.schemas.document import Document, DocumentSummary, DocumentSummaryGetterDict
+
+SUMMARY = {
+    "abstract": {"children": [{"type": "p", "children": [{"text": "An abstract"}]}]},
+    "version_description": None,
+}
+
+
+class SummaryOutput(BaseModel):
+    """The document of `versions.AtbdVersionSummaryOutput`"""
+
+    major: int
+    document: Optional[DocumentSummary]
+
+    class Config:
+        orm_mode = True
+        getter_dict = DocumentSummaryGetterDict
+
+
+class FullOutput(SummaryOutput):
+    """The document of `versions.FullOutput`"""
+
+    document: Optional[Document]
+
+    class Config:
+        getter_dict = GetterDict
+
+
+def _version(**loaded):
+    """Persistent (detached) version, with only the `loaded` columns loaded,
+    which raises rather than lazy loading the other columns"""
+    version = AtbdVersions(atbd_id=1, major=1, **loaded)
+    make_transient_to_detached(version)
+    return version
+
+
+def test_summary_output_reads_the_document_summary():
+    """Versions loaded with only the summary sections are serialized without
+    loading (or overwriting) their full document"""
+    version = _version()
+    set_committed_value(version, "document_summary", SUMMARY)
+
+    output = SummaryOutput.from_orm(version)
+    assert output.document.abstract.children[0].children[0].text == "An abstract"
+    assert "document" not in version.__dict__
+    with pytest.raises(DetachedInstanceError):
+        FullOutput.from_orm(version)
+
+
+def test_outputs_read_the_loaded_document():
+    document = {**SUMMARY, "key_points": "Key points"}
+    version = _version(document=document)
+
+    assert SummaryOutput.from_orm(version).document == DocumentSummary(**SUMMARY)
+    assert FullOutput.from_orm(version).document.key_points == "Key points"
+    assert SummaryOutput.from_orm(_version(document=None)).document is None
@@ -0,0 +1,87 @@
+"""Tests for the ETags, preconditions and schemas of the section-level updates
+of the ATBD versions"""
+import pytest
+from pydantic import ValidationError
+
+from app.api.etags import (
+    if_match_row_version,
+    parse_etag,
+    require_unmodified,
+    version_etag,
+)
+from app.schemas.version_patches import Patch, SectionOperation, SectionOperationEnum
+
+from fastapi import HTTPException
+
+ABSTRACT = {"children": [{"type": "p", "children": [{"text": "An abstract"}]}]}
+
+
+@pytest.mark.parametrize(
+    "etag,row_version",
+    [('"3"', 3), ('W/"3"', 3), (' "42" ', 42), (version_etag(7), 7)],
+)
+def test_parse_etag(etag, row_version):
+    """Strong and weak ETags are parsed into the row version"""
+    assert parse_etag(etag) == row_version
+
+
+@pytest.mark.parametrize("etag", ["3", '"3', '"-1"', '"v3"', 'w/"3"', "*", '""'])
+def test_parse_malformed_etag(etag):
+    with pytest.raises(HTTPException) as e:
+        parse_etag(etag)
+    assert e.value.status_code == 400
+
+
+def test_if_match_is_required():
+    """Conditional updates require an `If-Match` header (428), holding a
+    well formed ETag (400)"""
+    assert if_match_row_version('"5"') == 5
+    with pytest.raises(HTTPException) as e:
+        if_match_row_version(None)
+    assert e.value.status_code == 428
+    with pytest.raises(HTTPException) as e:
+        if_match_row_version("5")
+    assert e.value.status_code == 400
+
+
+def test_modified_version_fails_the_precondition():
+    """An update of a version modified since its ETag was read (which
+    returns `None`) fails with a 412"""
+    patched = {"document": {}, "row_version": 6}
+    assert require_unmodified(patched) is patched
+    with pytest.raises(HTTPException) as e:
+        require_unmodified(None)
+    assert e.value.status_code == 412
+
+
+def test_section_operations():
+    """Set values are validated against the schema of their section, and
+    removed sections don't need a value"""
+    patch = Patch(
+        operations=[
+            {"op": "set", "section": "abstract", "value": ABSTRACT},
+            {"op": "set", "section": "key_points", "value": "Key points"},
+            {"op": "remove", "section": "introduction"},
+        ],
+        sections_completed={"abstract": "complete"},
+    )
+    set_abstract, set_key_points, remove = patch.operations
+    assert set_abstract.op == SectionOperationEnum.SET
+    assert set_abstract.value.children[0].children[0].text == "An abstract"
+    assert set_key_points.value == "Key points"
+    assert (remove.op, remove.value) == (SectionOperationEnum.REMOVE, None)
+    assert Patch().operations == []
+
+
+@pytest.mark.parametrize(
+    "operation",
+    [
+        {"op": "set", "section": "not_a_section", "value": "text"},
+        {"op": "replace", "section": "abstract", "value": ABSTRACT},
+        {"op": "set", "section": "abstract", "value": "not a section"},
+        {"op": "set", "section": "key_points", "value": {"children": []}},
+    ],
+)
+def test_invalid_section_operations(operation):
+    with pytest.raises(ValidationError):
+        SectionOperation(**operation)